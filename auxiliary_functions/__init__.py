@@ -1 +1,9 @@
 from . import functions
+from . import snapshot
+from . import bloom
+from . import change_feed
+from . import btree
+from . import indexes
+from . import sales_partitions
+from . import profiling
+from . import inventory_stats
@@ -0,0 +1,225 @@
+import hashlib
+import math
+import os
+import struct
+
+# Заголовок файла фильтра: сигнатура, число бит, число хешей,
+# вероятность ложного срабатывания, количество ключей, ёмкость
+# и состояние индекса на момент записи.
+BLOOM_MAGIC = b'BLM1'
+BLOOM_HEADER = struct.Struct('>4sQIdQQqq')
+
+# Минимальная ёмкость фильтра.
+MIN_CAPACITY = 1024
+
+
+def _file_state(path: str) -> tuple | None:
+    """
+    Функция возвращает размер и время изменения файла или None, если его нет.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class BloomFilter:
+    """
+    Фильтр Блума для индекса, сохраняемый рядом с ним.
+
+    Фильтр отвечает либо "ключа точно нет", либо "ключ может быть".
+    Если фильтр говорит, что ключа нет, индекс файл можно не читать.
+    В заголовке хранится состояние индекса, по которому фильтр
+    был построен: если индекс поменялся в обход фильтра,
+    фильтр перестраивается по индексу.
+    """
+    def __init__(self, path: str, index, fp_rate: float = 0.01) -> None:
+        self.path = path
+        # Индекс (TextIndex или BTreeIndex), по ключам которого строится фильтр.
+        self.index = index
+        self.fp_rate = fp_rate
+        # Сколько поисков было отсечено фильтром.
+        self.negatives = 0
+        self.rebuilds = 0
+        self.bits = bytearray()
+        self.num_bits = 0
+        self.num_hashes = 0
+        self.count = 0
+        self.capacity = 0
+        self.index_state = None
+        self.file_state = None
+        self._load()
+
+    def _reset(self, capacity: int) -> None:
+        # Классические формулы размера фильтра для заданной ёмкости.
+        self.capacity = max(capacity, MIN_CAPACITY)
+        self.num_bits = math.ceil(-self.capacity * math.log(self.fp_rate) / (math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Двойное хеширование: из одного дайджеста получаем k позиций.
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def _header(self) -> bytes:
+        size, mtime = self.index_state if self.index_state else (-1, -1)
+        return BLOOM_HEADER.pack(
+            BLOOM_MAGIC, self.num_bits, self.num_hashes, self.fp_rate,
+            self.count, self.capacity, size, mtime
+        )
+
+    def _load(self) -> None:
+        """
+        Функция читает фильтр из файла.
+        Если файла нет, он повреждён или построен для другого индекса,
+        фильтр строится заново.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                header = f.read(BLOOM_HEADER.size)
+                magic, num_bits, num_hashes, fp_rate, count, capacity, size, mtime = \
+                    BLOOM_HEADER.unpack(header)
+                bits = bytearray(f.read())
+        except (FileNotFoundError, struct.error):
+            self.rebuild()
+            return
+
+        if magic != BLOOM_MAGIC or fp_rate != self.fp_rate or len(bits) != (num_bits + 7) // 8:
+            self.rebuild()
+            return
+
+        self.num_bits, self.num_hashes, self.count, self.capacity = num_bits, num_hashes, count, capacity
+        self.bits = bits
+        self.index_state = (size, mtime) if size >= 0 else None
+        self.file_state = _file_state(self.path)
+        if self.index_state != self.index.state():
+            self.rebuild()
+
+    def _save(self) -> None:
+        with open(self.path, 'wb') as f:
+            f.write(self._header())
+            f.write(self.bits)
+        self.file_state = _file_state(self.path)
+
+    def rebuild(self, capacity: int = 0) -> None:
+        """
+        Функция заново строит фильтр по ключам индекс файла и сохраняет его.
+
+        Args:
+            capacity(int): Желаемая ёмкость. По умолчанию вдвое больше числа ключей.
+        """
+        keys = list(self.index.keys())
+        self._reset(max(capacity, 2 * len(keys)))
+        for key in keys:
+            for pos in self._positions(key):
+                self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count = len(keys)
+        self.index_state = self.index.state()
+        self.rebuilds += 1
+        self._save()
+
+    def might_contain(self, key: str) -> bool:
+        """
+        Функция проверяет, может ли ключ быть в индексе.
+
+        Args:
+            key(str): Искомый ключ.
+        Returns:
+            bool: False - ключа точно нет, True - ключ может быть.
+        """
+        current = self.index.state()
+        # Без индекс файла фильтру нечего подтверждать,
+        # пусть обычный поиск решает сам.
+        if current is None:
+            return True
+        if current != self.index_state:
+            # Индекс поменяли: сначала перечитываем фильтр с диска,
+            # если и он устарел - перестраиваем.
+            self._load()
+
+        for pos in self._positions(key):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                self.negatives += 1
+                return False
+        return True
+
+    def add(self, key: str) -> None:
+        """
+        Функция добавляет ключ в фильтр после записи в индекс файл.
+        На диске перезаписываются только изменённые байты и заголовок.
+
+        Args:
+            key(str): Добавленный ключ.
+        """
+        self.add_many([key])
+
+    def add_many(self, keys: list) -> None:
+        """
+        Функция добавляет пачку ключей одной записью на диск.
+
+        Args:
+            keys(list): Добавленные ключи.
+        """
+        # Фильтр мог обновить другой процесс.
+        if _file_state(self.path) != self.file_state:
+            self._load()
+
+        if self.count + len(keys) > self.capacity:
+            # Фильтр переполнен, перестраиваем с запасом,
+            # новые ключи уже есть в индекс файле.
+            self.rebuild(2 * (self.count + len(keys)))
+            return
+
+        changed = set()
+        for key in keys:
+            for pos in self._positions(key):
+                mask = 1 << (pos & 7)
+                if not self.bits[pos >> 3] & mask:
+                    self.bits[pos >> 3] |= mask
+                    changed.add(pos >> 3)
+        self.count += len(keys)
+        self.index_state = self.index.state()
+
+        with open(self.path, 'r+b') as f:
+            f.write(self._header())
+            for byte in sorted(changed):
+                f.seek(BLOOM_HEADER.size + byte)
+                f.write(self.bits[byte:byte + 1])
+        self.file_state = _file_state(self.path)
+
+    def mark_synced(self) -> None:
+        """
+        Функция фиксирует текущее состояние индекс файла после удаления ключа.
+        Удалённый ключ остаётся в фильтре и даёт только ложное срабатывание.
+        """
+        if _file_state(self.path) != self.file_state:
+            self._load()
+        self.index_state = self.index.state()
+        with open(self.path, 'r+b') as f:
+            f.write(self._header())
+        self.file_state = _file_state(self.path)
+
+    def stats(self) -> dict:
+        """
+        Функция возвращает статистику фильтра.
+
+        Returns:
+            dict: Размеры фильтра, заданная и оценочная вероятность ложного срабатывания.
+        """
+        estimated = (1 - math.exp(-self.num_hashes * self.count / self.num_bits)) ** self.num_hashes
+        return {
+            'keys': self.count,
+            'capacity': self.capacity,
+            'bits': self.num_bits,
+            'hashes': self.num_hashes,
+            'fp_rate': self.fp_rate,
+            'estimated_fp_rate': estimated,
+            'negatives': self.negatives,
+            'rebuilds': self.rebuilds,
+        }
@@ -0,0 +1,460 @@
+import bisect
+import os
+import struct
+from collections import OrderedDict
+from .profiling import profiled
+
+# Заголовок файла (страница 0): сигнатура, размер страницы, корень,
+# число страниц, число ключей и поколение (растёт при каждом изменении).
+BTREE_MAGIC = b'BPT1'
+FILE_HEADER = struct.Struct('>4sIQQQQ')
+
+# Заголовок страницы узла: тип, число ключей, следующий лист.
+NODE_HEADER = struct.Struct('>BHQ')
+LEAF, INTERNAL = 1, 2
+
+KEY_LEN = struct.Struct('>H')
+VALUE = struct.Struct('>q')
+CHILD = struct.Struct('>Q')
+
+PAGE_SIZE = 4096
+# Ключ должен помещаться хотя бы по два в страницу, иначе разбиение не поможет.
+MAX_KEY_SIZE = 512
+# При массовой загрузке страницы заполняются не полностью,
+# чтобы первые вставки не вызывали разбиений.
+BULK_FILL = 0.9
+
+
+class Node:
+    """
+    Узел дерева. У листа values - номера строк, у внутреннего узла -
+    номера дочерних страниц (их на одну больше, чем ключей).
+    """
+    __slots__ = ('page', 'leaf', 'keys', 'values', 'next_leaf')
+
+    def __init__(self, page: int, leaf: bool, keys: list, values: list, next_leaf: int = 0) -> None:
+        self.page = page
+        self.leaf = leaf
+        self.keys = keys
+        self.values = values
+        self.next_leaf = next_leaf
+
+    def size(self) -> int:
+        """
+        Функция возвращает размер узла в байтах после сериализации.
+        """
+        keys_size = sum(KEY_LEN.size + len(key.encode('utf-8')) for key in self.keys)
+        if self.leaf:
+            return NODE_HEADER.size + keys_size + VALUE.size * len(self.keys)
+        return NODE_HEADER.size + keys_size + CHILD.size * len(self.values)
+
+    def encode(self, page_size: int) -> bytes:
+        data = bytearray(NODE_HEADER.pack(LEAF if self.leaf else INTERNAL, len(self.keys), self.next_leaf))
+        if self.leaf:
+            for key, value in zip(self.keys, self.values):
+                raw = key.encode('utf-8')
+                data += KEY_LEN.pack(len(raw)) + raw + VALUE.pack(value)
+        else:
+            data += CHILD.pack(self.values[0])
+            for key, child in zip(self.keys, self.values[1:]):
+                raw = key.encode('utf-8')
+                data += KEY_LEN.pack(len(raw)) + raw + CHILD.pack(child)
+        return bytes(data.ljust(page_size, b'\0'))
+
+    @classmethod
+    def decode(cls, page: int, data: bytes) -> 'Node':
+        kind, count, next_leaf = NODE_HEADER.unpack_from(data, 0)
+        pos = NODE_HEADER.size
+        keys, values = list(), list()
+        if kind == INTERNAL:
+            values.append(CHILD.unpack_from(data, pos)[0])
+            pos += CHILD.size
+        for _ in range(count):
+            (length,) = KEY_LEN.unpack_from(data, pos)
+            pos += KEY_LEN.size
+            keys.append(data[pos:pos + length].decode('utf-8'))
+            pos += length
+            values.append((VALUE if kind == LEAF else CHILD).unpack_from(data, pos)[0])
+            pos += VALUE.size
+        return cls(page, kind == LEAF, keys, values, next_leaf)
+
+
+class BTreeIndex:
+    """
+    Индекс на диске в виде B+ дерева со страницами фиксированного размера.
+
+    Поиск и вставка читают O(log n) страниц, переполненная страница
+    разбивается на месте: левая половина остаётся на своей странице,
+    правая дописывается в конец файла. Удаление убирает ключ из листа
+    без слияния страниц, поэтому любое изменение пишет только
+    затронутые страницы и заголовок. Прочитанные страницы хранятся
+    в LRU кеше. Ключи уникальны: повторная вставка ключа не меняет
+    его номер строки, как и поиск по текстовому индексу возвращал
+    первую запись.
+    """
+    def __init__(self, path: str, cache_pages: int = 256, page_size: int = PAGE_SIZE) -> None:
+        self.path = path
+        self.cache_pages = cache_pages
+        self.page_size = page_size
+        self.cache = OrderedDict()
+        self.file = None
+        self.root = 0
+        self.page_count = 0
+        self.key_count = 0
+        self.generation = 0
+        # Статистика кеша страниц.
+        self.page_reads = 0
+        self.page_writes = 0
+
+    # Работа со страницами.
+    def _open(self) -> bool:
+        """
+        Функция открывает файл дерева и сверяет поколение с кешем.
+        Если файл изменил другой процесс, кеш сбрасывается.
+
+        Returns:
+            bool: False, если файла дерева ещё нет.
+        """
+        if self.file is None:
+            if not os.path.exists(self.path):
+                return False
+            self.file = open(self.path, 'r+b', buffering=0)
+        header = self._pread(FILE_HEADER.size, 0)
+        magic, page_size, root, page_count, key_count, generation = FILE_HEADER.unpack(header)
+        if magic != BTREE_MAGIC:
+            raise ValueError(f'{self.path} не является файлом B+ дерева')
+        if generation != self.generation or page_size != self.page_size:
+            self.cache.clear()
+        self.page_size, self.root, self.page_count = page_size, root, page_count
+        self.key_count, self.generation = key_count, generation
+        return True
+
+    # os.pread/os.pwrite есть не на всех платформах, поэтому seek.
+    def _pread(self, size: int, offset: int) -> bytes:
+        self.file.seek(offset)
+        return self.file.read(size)
+
+    def _pwrite(self, data: bytes, offset: int) -> None:
+        self.file.seek(offset)
+        self.file.write(data)
+
+    def _create(self) -> None:
+        self.file = open(self.path, 'w+b', buffering=0)
+        self.page_count = 1
+        self.root = self._allocate(Node(0, True, list(), list())).page
+        self._write_header()
+
+    def _write_header(self) -> None:
+        header = FILE_HEADER.pack(
+            BTREE_MAGIC, self.page_size, self.root, self.page_count, self.key_count, self.generation
+        )
+        self._pwrite(header.ljust(self.page_size, b'\0'), 0)
+
+    def _read(self, page: int) -> Node:
+        node = self.cache.get(page)
+        if node is not None:
+            self.cache.move_to_end(page)
+            return node
+        data = self._pread(self.page_size, page * self.page_size)
+        self.page_reads += 1
+        node = Node.decode(page, data)
+        self._remember(node)
+        return node
+
+    def _remember(self, node: Node) -> None:
+        self.cache[node.page] = node
+        self.cache.move_to_end(node.page)
+        while len(self.cache) > self.cache_pages:
+            self.cache.popitem(last=False)
+
+    def _write(self, node: Node) -> None:
+        self._pwrite(node.encode(self.page_size), node.page * self.page_size)
+        self.page_writes += 1
+        self._remember(node)
+
+    def _allocate(self, node: Node) -> Node:
+        node.page = self.page_count
+        self.page_count += 1
+        self._write(node)
+        return node
+
+    def _commit(self) -> None:
+        self.generation += 1
+        self._write_header()
+
+    # Интерфейс индекса.
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def state(self) -> tuple | None:
+        """
+        Функция возвращает состояние индекса для проверки фильтра Блума.
+        """
+        if not self._open():
+            return None
+        return self.page_count, self.generation
+
+    @profiled
+    def find(self, key: str) -> int | None:
+        """
+        Функция ищет номер строки по ключу.
+
+        Args:
+            key(str): Искомый ключ.
+        Returns:
+            int: Номер строки.
+            None: Если ничего не найдено.
+        """
+        if not self._open():
+            return None
+        node = self._read(self.root)
+        while not node.leaf:
+            node = self._read(node.values[bisect.bisect_right(node.keys, key)])
+        i = bisect.bisect_left(node.keys, key)
+        if i < len(node.keys) and node.keys[i] == key:
+            return node.values[i]
+        return None
+
+    @profiled
+    def find_many(self, keys: list) -> dict:
+        """
+        Функция ищет номера строк для списка ключей.
+
+        Args:
+            keys(list): Искомые ключи.
+        Returns:
+            dict: Словарь {ключ: номер строки} только для найденных ключей.
+        """
+        result = dict()
+        for key in keys:
+            line = self.find(key)
+            if line is not None:
+                result[key] = line
+        return result
+
+    def _insert(self, page: int, key: str, value: int):
+        """
+        Функция рекурсивно вставляет ключ в поддерево.
+
+        Returns:
+            tuple: (разделитель, новая страница), если узел разбился, иначе None.
+            False: Если ключ уже был.
+        """
+        node = self._read(page)
+        if node.leaf:
+            i = bisect.bisect_left(node.keys, key)
+            if i < len(node.keys) and node.keys[i] == key:
+                return False
+            node.keys.insert(i, key)
+            node.values.insert(i, value)
+        else:
+            i = bisect.bisect_right(node.keys, key)
+            split = self._insert(node.values[i], key, value)
+            if not split:
+                return split
+            node.keys.insert(i, split[0])
+            node.values.insert(i + 1, split[1])
+
+        if node.size() <= self.page_size:
+            self._write(node)
+            return None
+        return self._split(node)
+
+    def _split(self, node: Node) -> tuple:
+        mid = len(node.keys) // 2
+        if node.leaf:
+            right = Node(0, True, node.keys[mid:], node.values[mid:], node.next_leaf)
+            separator = right.keys[0]
+            del node.keys[mid:], node.values[mid:]
+        else:
+            separator = node.keys[mid]
+            right = Node(0, False, node.keys[mid + 1:], node.values[mid + 1:])
+            del node.keys[mid:], node.values[mid + 1:]
+        self._allocate(right)
+        if node.leaf:
+            node.next_leaf = right.page
+        # Левая половина остаётся на своей странице.
+        self._write(node)
+        return separator, right.page
+
+    @profiled
+    def insert(self, key: str, value: int) -> None:
+        """
+        Функция вставляет ключ и номер строки.
+
+        Args:
+            key(str): Ключ.
+            value(int): Номер строки.
+        """
+        self.insert_many([(key, value)])
+
+    @profiled
+    def insert_many(self, entries: list) -> None:
+        """
+        Функция вставляет пачку пар (ключ, номер строки).
+
+        Args:
+            entries(list): Список пар (ключ, номер строки).
+        """
+        if not self._open():
+            self._create()
+        for key, value in entries:
+            if len(key.encode('utf-8')) > MAX_KEY_SIZE:
+                raise ValueError(f'Ключ длиннее {MAX_KEY_SIZE} байт: {key}')
+            split = self._insert(self.root, key, value)
+            if split is False:
+                continue
+            self.key_count += 1
+            if split:
+                # Разбился корень - дерево растёт на уровень.
+                new_root = Node(0, False, [split[0]], [self.root, split[1]])
+                self.root = self._allocate(new_root).page
+        self._commit()
+
+    def _leaf_for(self, key: str) -> Node:
+        node = self._read(self.root)
+        while not node.leaf:
+            node = self._read(node.values[bisect.bisect_right(node.keys, key)])
+        return node
+
+    @profiled
+    def delete(self, key: str) -> bool:
+        """
+        Функция удаляет ключ из индекса.
+
+        Args:
+            key(str): Удаляемый ключ.
+        Returns:
+            bool: True, если ключ был найден.
+        """
+        if not self._open():
+            return False
+        node = self._leaf_for(key)
+        i = bisect.bisect_left(node.keys, key)
+        if i >= len(node.keys) or node.keys[i] != key:
+            return False
+        del node.keys[i], node.values[i]
+        self._write(node)
+        self.key_count -= 1
+        self._commit()
+        return True
+
+    @profiled
+    def rename(self, key: str, new_key: str) -> bool:
+        """
+        Функция меняет ключ, сохраняя номер строки.
+        Если новый ключ уже есть, индекс не меняется:
+        insert пропускает существующий ключ, и запись потерялась бы.
+
+        Args:
+            key(str): Старый ключ.
+            new_key(str): Новый ключ.
+        Returns:
+            bool: True, если ключ переименован.
+        """
+        value = self.find(key)
+        if value is None or self.find(new_key) is not None:
+            return False
+        self.delete(key)
+        self.insert(new_key, value)
+        return True
+
+    def items(self):
+        """
+        Генератор возвращает пары (ключ, номер строки) в порядке ключей.
+        """
+        if not self._open():
+            return
+        node = self._read(self.root)
+        while not node.leaf:
+            node = self._read(node.values[0])
+        while True:
+            yield from zip(list(node.keys), list(node.values))
+            if not node.next_leaf:
+                return
+            node = self._read(node.next_leaf)
+
+    def keys(self):
+        for key, _ in self.items():
+            yield key
+
+    @profiled
+    def bulk_build(self, entries) -> None:
+        """
+        Функция строит дерево заново из отсортированных пар (ключ, номер строки).
+        Страницы пишутся последовательно снизу вверх.
+
+        Args:
+            entries: Отсортированные по ключу пары (ключ, номер строки).
+        """
+        # Поколение продолжаем со старого файла, чтобы другие процессы сбросили кеш.
+        if self.exists():
+            self._open()
+            self.file.close()
+        self.cache.clear()
+        self._create()
+        self.key_count = 0
+        limit = int(self.page_size * BULK_FILL)
+
+        # Собираем листья.
+        level = list()
+        leaf = Node(self.root, True, list(), list())
+        last_key = None
+        for key, value in entries:
+            if key == last_key:
+                continue
+            last_key = key
+            entry_size = KEY_LEN.size + len(key.encode('utf-8')) + VALUE.size
+            if leaf.keys and leaf.size() + entry_size > limit:
+                next_leaf = Node(self.page_count, True, list(), list())
+                self.page_count += 1
+                leaf.next_leaf = next_leaf.page
+                self._write(leaf)
+                level.append((leaf.keys[0], leaf.page))
+                leaf = next_leaf
+            leaf.keys.append(key)
+            leaf.values.append(value)
+            self.key_count += 1
+        self._write(leaf)
+        level.append((leaf.keys[0] if leaf.keys else '', leaf.page))
+
+        # Строим внутренние уровни, пока не останется один корень.
+        while len(level) > 1:
+            upper = list()
+            node = Node(0, False, list(), [level[0][1]])
+            first_key = level[0][0]
+            for key, page in level[1:]:
+                entry_size = KEY_LEN.size + len(key.encode('utf-8')) + CHILD.size
+                if node.size() + entry_size > limit:
+                    self._allocate(node)
+                    upper.append((first_key, node.page))
+                    node = Node(0, False, list(), [page])
+                    first_key = key
+                    continue
+                node.keys.append(key)
+                node.values.append(page)
+            self._allocate(node)
+            upper.append((first_key, node.page))
+            level = upper
+        self.root = level[0][1]
+        self._commit()
+
+    def stats(self) -> dict:
+        """
+        Функция возвращает статистику дерева и кеша страниц.
+        """
+        self._open()
+        return {
+            'keys': self.key_count,
+            'pages': self.page_count,
+            'page_size': self.page_size,
+            'cached_pages': len(self.cache),
+            'page_reads': self.page_reads,
+            'page_writes': self.page_writes,
+        }
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.cache.clear()
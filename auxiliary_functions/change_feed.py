@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+
+# Имя файла с отметками потребителей.
+WATERMARKS_FILE = 'consumers.json'
+SEGMENT_SUFFIX = '.log'
+
+
+class ChangeFeed:
+    """
+    Журнал изменений хранилища, в который только дописывают.
+
+    Каждое событие - одна JSON строка с порядковым номером seq,
+    именем операции, временем и данными. Журнал разбит на сегменты,
+    имя сегмента - номер его первого события. Потребители сохраняют
+    свою отметку через ack, а сегменты, прочитанные всеми
+    потребителями, удаляются.
+    """
+    def __init__(self, directory: str, segment_size: int = 10000) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self.last_seq = None
+        # Сегмент, в который идёт запись, и его размер после нашей записи.
+        self.active = None
+        self.active_size = None
+        # Хвост журнала (last_seq, active, active_size) читают и меняют только под ней,
+        # чтобы номер последнего события и размер сегмента были из одного чтения.
+        self.lock = threading.RLock()
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f'{first_seq:020d}{SEGMENT_SUFFIX}')
+
+    def segments(self) -> list:
+        """
+        Функция возвращает отсортированный список номеров первых событий сегментов.
+
+        Returns:
+            list: Номера первых событий сегментов.
+        """
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return list()
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in names if name.endswith(SEGMENT_SUFFIX))
+
+    def _read_tail(self) -> None:
+        """
+        Функция восстанавливает последний номер события по последнему сегменту.
+        """
+        segments = self.segments()
+        if not segments:
+            self.last_seq = 0
+            self.active = None
+            self.active_size = None
+            return
+
+        self.active = segments[-1]
+        path = self._segment_path(self.active)
+        last_seq = self.active - 1
+        size = 0
+        # Размер считаем по прочитанным байтам, а не по файлу после чтения:
+        # иначе дописанное за это время событие не перечитается и номер повторится.
+        with open(path, 'rb') as f:
+            for line in f:
+                size += len(line)
+                if line.endswith(b'\n'):
+                    last_seq = json.loads(line)['seq']
+        self.last_seq = last_seq
+        self.active_size = size
+
+    def _refresh(self) -> None:
+        # Перечитываем хвост, если журнал менялся не нами.
+        if self.active is None or self.last_seq is None or \
+                self.active_size != self._size(self._segment_path(self.active)):
+            self._read_tail()
+
+    def _write(self, event: dict) -> int:
+        seq = event['seq']
+        if self.active is None or seq - self.active >= self.segment_size:
+            os.makedirs(self.directory, exist_ok=True)
+            self.active = seq
+
+        path = self._segment_path(self.active)
+        with open(path, 'ab') as f:
+            f.write((json.dumps(event, separators=(',', ':'), ensure_ascii=False) + '\n').encode('utf-8'))
+            size = f.tell()
+        self.last_seq = seq
+        self.active_size = size
+        return seq
+
+    def last(self) -> int:
+        """
+        Функция возвращает номер последнего записанного события, 0 для пустого журнала.
+        """
+        with self.lock:
+            self._refresh()
+            return self.last_seq
+
+    def append(self, op: str, data: dict) -> int:
+        """
+        Функция дописывает событие в журнал.
+
+        Args:
+            op(str): Имя операции.
+            data(dict): Данные операции.
+        Returns:
+            int: Номер записанного события.
+        """
+        with self.lock:
+            self._refresh()
+            return self._write({'seq': self.last_seq + 1, 'op': op, 'ts': time.time(), 'data': data})
+
+    def append_event(self, event: dict) -> int:
+        """
+        Функция дописывает событие другого журнала, сохраняя его номер.
+        Так журнал копируется на реплику. Пустой журнал может
+        начинаться с любого номера, дальше номера идут подряд.
+
+        Args:
+            event(dict): Событие с полями seq, op, ts и data.
+        Returns:
+            int: Номер записанного события.
+        """
+        with self.lock:
+            self._refresh()
+            if self.last_seq and event['seq'] != self.last_seq + 1:
+                raise ValueError(f'Событие {event["seq"]} не следует за {self.last_seq}')
+            return self._write(event)
+
+    @staticmethod
+    def _size(path: str) -> int | None:
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return None
+
+    def read_since(self, seq: int):
+        """
+        Генератор возвращает события с номером больше seq в порядке записи.
+
+        Args:
+            seq(int): Последний обработанный потребителем номер.
+        Yields:
+            dict: Событие журнала.
+        """
+        segments = self.segments()
+        for i, first_seq in enumerate(segments):
+            # Сегмент целиком прочитан, если следующий начинается не позже seq + 1.
+            if i + 1 < len(segments) and segments[i + 1] <= seq + 1:
+                continue
+            try:
+                with open(self._segment_path(first_seq), 'rb') as f:
+                    for line in f:
+                        # Недописанную строку пропускаем, её прочитаем в следующий раз.
+                        if not line.endswith(b'\n'):
+                            break
+                        event = json.loads(line)
+                        if event['seq'] > seq:
+                            yield event
+            except FileNotFoundError:
+                # Сегмент удалили при усечении, пока мы читали предыдущий.
+                continue
+
+    def watermarks(self) -> dict:
+        """
+        Функция возвращает отметки потребителей.
+
+        Returns:
+            dict: Словарь {имя потребителя: последний обработанный номер}.
+        """
+        try:
+            with open(os.path.join(self.directory, WATERMARKS_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return dict()
+
+    def ack(self, consumer: str, seq: int) -> None:
+        """
+        Функция сохраняет отметку потребителя и удаляет сегменты,
+        которые уже прочитали все потребители.
+
+        Args:
+            consumer(str): Имя потребителя.
+            seq(int): Последний обработанный потребителем номер.
+        """
+        with self.lock:
+            marks = self.watermarks()
+            marks[consumer] = seq
+            self._save_watermarks(marks)
+            self.truncate()
+
+    def drop_consumer(self, consumer: str) -> None:
+        """
+        Функция удаляет потребителя, чтобы он больше не удерживал журнал.
+
+        Args:
+            consumer(str): Имя потребителя.
+        """
+        with self.lock:
+            marks = self.watermarks()
+            marks.pop(consumer, None)
+            self._save_watermarks(marks)
+            self.truncate()
+
+    def _save_watermarks(self, marks: dict) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, WATERMARKS_FILE)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(marks, f)
+        os.replace(path + '.tmp', path)
+
+    def truncate(self) -> int:
+        """
+        Функция удаляет сегменты, все события которых не больше
+        минимальной отметки потребителей. Активный сегмент не удаляется.
+        Без зарегистрированных потребителей журнал не усекается.
+
+        Returns:
+            int: Количество удалённых сегментов.
+        """
+        with self.lock:
+            marks = self.watermarks()
+            if not marks:
+                return 0
+            low = min(marks.values())
+            segments = self.segments()
+            removed = 0
+            for first_seq, next_seq in zip(segments, segments[1:]):
+                if next_seq > low + 1:
+                    break
+                os.remove(self._segment_path(first_seq))
+                removed += 1
+            return removed
@@ -1,10 +1,15 @@
+import os
+import heapq
+import tempfile
 from datetime import datetime as dt
 from decimal import Decimal
-from constants import LINE_SIZE
+from constants import DATETIME_FORMAT, LINE_SIZE
 from src.models import Car, CarStatus
 from my_exceptions import InvalidCharacterStr
+from .profiling import profiled
 
 
+@profiled
 def read_file(path: str) -> list:
     """
     Функция по указанному пути читает полностью файл и
@@ -74,6 +79,7 @@ def insert_in_file(params: tuple, path_txt: str, path_index_txt: str):
             f.writelines(list_strings)
 
 
+@profiled
 def find_index(path, first_key: str) -> int | None:
     """
     Функция по указанному пути читает полностью файл и возвращает
@@ -94,6 +100,7 @@ def find_index(path, first_key: str) -> int | None:
     return None
 
 
+@profiled
 def find_index_sold_vin(path, vin: str) -> int | None:
     """
     Функция ищет номер строки, в которой хранится продажа по номеру машины.
@@ -117,6 +124,7 @@ def find_index_sold_vin(path, vin: str) -> int | None:
     return None
 
 
+@profiled
 def find_index_sold_sale_num(path, num_sale: str) -> int | None:
     """
     Функция ищет номер строки, в которой хранится продажа по номеру продажи.
@@ -143,7 +151,8 @@ def find_index_sold_sale_num(path, num_sale: str) -> int | None:
     return None
 
 
-def change_machine_status(path: str, index: int, new_status: str) -> list:
+@profiled
+def change_machine_status(path: str, index: int, new_status: str, stats=None) -> list:
     """
     Функция ищет номер строки, в которой хранится продажа по номеру продажи.
 
@@ -151,6 +160,7 @@ def change_machine_status(path: str, index: int, new_status: str) -> list:
         path(str): Путь к файлу.
         index(int): В какой строке поменять статус.
         new_str(str): Новый статус
+        stats(InventoryStats): Счётчики склада, в которых нужно учесть смену статуса.
     Returns:
         list: Список параметров измененной машины.
     """
@@ -158,14 +168,35 @@ def change_machine_status(path: str, index: int, new_status: str) -> list:
         f.seek(index * (LINE_SIZE))
         current_cur = f.read(LINE_SIZE - 1).strip()
         list_current_cur = current_cur.split(';')
+        old_status = list_current_cur[-1]
         list_current_cur[-1] = new_status
         new_str = ';'.join(list_current_cur).ljust(LINE_SIZE - 1) + '\n'
 
         f.seek(index * (LINE_SIZE))
         f.write(new_str)
+    if stats is not None:
+        stats.status_changed(list_current_cur, old_status)
     return list_current_cur
 
 
+def decode_datetime(value: str) -> dt:
+    """
+    Функция разбирает дату из файла.
+    Даты хранятся в ISO формате 'YYYY-MM-DD HH:MM:SS', поэтому
+    используется быстрый dt.fromisoformat вместо dt.strptime.
+    Если строка не в ISO формате, разбираем её старым способом.
+
+    Args:
+        value(str): Дата из файла.
+    Returns:
+        datetime: Разобранная дата.
+    """
+    try:
+        return dt.fromisoformat(value)
+    except ValueError:
+        return dt.strptime(value, DATETIME_FORMAT)
+
+
 def create_car_object(car_list: list) -> Car:
     """
     Функция создает обьект машины из списка параметров.
@@ -179,11 +210,12 @@ def create_car_object(car_list: list) -> Car:
         vin=car_list[0],
         model=int(car_list[1]),
         price=Decimal(car_list[2]),
-        date_start=dt.strptime(car_list[3], '%Y-%m-%d %H:%M:%S'),
+        date_start=decode_datetime(car_list[3]),
         status=CarStatus(car_list[4])
     )
 
 
+@profiled
 def read_line(path: str, line: int) -> list:
     """
     Функция читает строчку по указанной строке.
@@ -200,3 +232,216 @@ def read_line(path: str, line: int) -> list:
             return f.read(LINE_SIZE).strip().split(';')
     except FileNotFoundError:
         return list()
+
+
+def iter_rows(path: str):
+    """
+    Генератор построчно читает файл фиксированной длины
+    и возвращает строки без выравнивания. Удаленные строки пропускаются.
+
+    Args:
+        path(str): Путь к файлу.
+    Yields:
+        str: Строка без пробелов выравнивания.
+    """
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            while line := f.read(LINE_SIZE):
+                row = line.strip()
+                if not row or row == 'is_deleted':
+                    continue
+                yield row
+    except FileNotFoundError:
+        return
+
+
+@profiled
+def write_index(path_index_txt: str, entries: list):
+    """
+    Функция за один проход перезаписывает индекс файл
+    из списка пар (ключ, номер строки), отсортированного по ключу.
+    Файл пишется рядом и подменяется целиком, поэтому читатели
+    без блокировки видят либо старый, либо новый индекс.
+
+    Args:
+        path_index_txt(str): Путь к индекс файлу.
+        entries(list): Список пар (ключ, номер строки).
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path_index_txt) + '.', suffix='.tmp',
+        dir=os.path.dirname(path_index_txt) or '.'
+    )
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            f.writelines(f'{key};{line_num}\n' for key, line_num in entries)
+        os.replace(tmp_path, path_index_txt)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+@profiled
+def append_rows(params_list: list, path_txt: str) -> int:
+    """
+    Функция дописывает пачку строк в конец основного файла.
+
+    Args:
+        params_list(list): Список кортежей параметров, которые нужно записать в txt.
+        path_txt(str): Путь к обычному txt файлу.
+    Returns:
+        int: Номер строки, в которую записан первый кортеж.
+    """
+    # Проверяем всю пачку до записи, чтобы не записать её частично.
+    for params in params_list:
+        for i in params:
+            if isinstance(i, str) and ';' in i:
+                raise InvalidCharacterStr
+
+    with open(path_txt, 'a+', encoding='utf-8', newline='') as f:
+        f.seek(0, 2)
+        first_line = f.tell() // LINE_SIZE
+        f.writelines(
+            (';'.join(map(str, params)).strip()).ljust(LINE_SIZE - 1) + '\n'
+            for params in params_list
+        )
+    return first_line
+
+
+@profiled
+def merge_index(path_index_txt: str, entries: list):
+    """
+    Функция вставляет пары (ключ, номер строки) в индекс файл одной перезаписью.
+    При равных ключах новая запись встает после старой, как в insert_in_file.
+
+    Args:
+        path_index_txt(str): Путь к индекс файлу.
+        entries(list): Список пар (ключ, номер строки).
+    """
+    new_entries = sorted(entries, key=lambda x: x[0])
+    old_entries = (line.strip().split(';') for line in read_file(path_index_txt))
+    write_index(
+        path_index_txt,
+        heapq.merge(((key, num) for key, num in old_entries), new_entries, key=lambda x: x[0])
+    )
+
+
+def insert_many_in_file(params_list: list, path_txt: str, path_index_txt: str):
+    """
+    Функция записывает пачку строк в основной файл и
+    обновляет индекс файл одной перезаписью вместо перезаписи на каждую строку.
+
+    Args:
+        params_list(list): Список кортежей параметров, которые нужно записать в txt.
+        path_txt(str): Путь по которому нужно записать обычный txt файл.
+        path_index_txt(str): Путь где нужно записать индексы.
+    """
+    first_line = append_rows(params_list, path_txt)
+    merge_index(
+        path_index_txt,
+        [(str(params[0]), first_line + i) for i, params in enumerate(params_list)]
+    )
+
+
+@profiled
+def read_lines(path: str, lines) -> dict:
+    """
+    Функция читает несколько строк за одно открытие файла.
+    Строки читаются по возрастанию номера, чтобы чтение шло последовательно.
+
+    Args:
+        path(str): Путь к файлу.
+        lines: Номера строк, которые нужно прочитать.
+    Returns:
+        dict: Словарь {номер строки: список строк разделенной ;}.
+    """
+    result = dict()
+    try:
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            for line in sorted(set(lines)):
+                f.seek(line * (LINE_SIZE))
+                result[line] = f.read(LINE_SIZE).strip().split(';')
+    except FileNotFoundError:
+        return dict()
+    return result
+
+
+def file_state(path: str) -> tuple | None:
+    """
+    Функция возвращает размер и время изменения файла.
+    По ним кеши в памяти понимают, что файл поменяли.
+
+    Args:
+        path(str): Путь к файлу.
+    Returns:
+        tuple: Размер и время изменения в наносекундах.
+        None: Если файла нет.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+# Сколько строк читается за один раз при побайтовом просмотре файла.
+SCAN_CHUNK_ROWS = 4096
+
+
+@profiled
+def scan_status(path: str, status: str):
+    """
+    Генератор ищет строки с нужным статусом без разбора остальных строк.
+    Файл читается в бинарном режиме большими блоками, статус ищется
+    в блоке как байты ';статус', за которым идут пробелы выравнивания.
+    Декодируются только найденные строки.
+    Поля cars.txt в ASCII, поэтому номер строки - смещение в байтах на LINE_SIZE.
+
+    Args:
+        path(str): Путь к файлу.
+        status(str): Искомый статус.
+    Yields:
+        tuple: Номер строки и список полей строки.
+    """
+    pattern = (';' + status).encode('utf-8')
+    with open(path, 'rb') as f:
+        base = 0
+        while chunk := f.read(LINE_SIZE * SCAN_CHUNK_ROWS):
+            view = memoryview(chunk)
+            pos = chunk.find(pattern)
+            while pos != -1:
+                end = pos + len(pattern)
+                # Статус - последнее поле, после него только выравнивание.
+                if end < len(chunk) and chunk[end] not in b' \n':
+                    pos = chunk.find(pattern, end)
+                    continue
+                number = pos // LINE_SIZE
+                yield base + number, str(view[number * LINE_SIZE:end], 'utf-8').split(';')
+                pos = chunk.find(pattern, (number + 1) * LINE_SIZE)
+            base += len(chunk) // LINE_SIZE
+
+
+def scan_rows(path: str, opener=open):
+    """
+    Генератор возвращает живые строки файла вместе с номерами.
+    Удаленные и пустые строки отбрасываются по первым байтам без декодирования.
+
+    Args:
+        path(str): Путь к файлу.
+        opener: Функция открытия файла, например lzma.open для архива.
+    Yields:
+        tuple: Номер строки и список полей строки.
+    """
+    try:
+        f = opener(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        base = 0
+        while chunk := f.read(LINE_SIZE * SCAN_CHUNK_ROWS):
+            view = memoryview(chunk)
+            for start in range(0, len(chunk), LINE_SIZE):
+                if chunk[start] == 32 or chunk.startswith(b'is_deleted', start):
+                    continue
+                row = str(view[start:start + LINE_SIZE - 1], 'utf-8').rstrip()
+                yield base + start // LINE_SIZE, row.split(';')
+            base += len(chunk) // LINE_SIZE
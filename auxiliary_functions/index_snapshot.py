@@ -0,0 +1,246 @@
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from array import array
+
+# Заголовок снапшота: сигнатура, количество ключей, ширина ключа в байтах,
+# состояние текстового индекса на момент сборки, поколение и контрольные суммы.
+SNAPSHOT_MAGIC = b'IXS1'
+SNAPSHOT_HEADER = struct.Struct('<4sQIqqQII')
+
+
+def _file_state(path: str) -> tuple | None:
+    """
+    Функция возвращает размер и время изменения файла или None, если его нет.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class SnapshotView:
+    """
+    Открытый снапшот: отображение файла в память и поля заголовка.
+
+    После создания вид не меняется. Новый снапшот - новый вид,
+    а старое отображение закрывается само, когда его отпустит
+    последний читатель, поэтому запись не мешает идущим поискам.
+    """
+    __slots__ = ('map', 'count', 'key_width', 'source_state', 'generation')
+
+    def __init__(self, data, count: int, key_width: int, source_state: tuple, generation: int) -> None:
+        self.map = data
+        self.count = count
+        self.key_width = key_width
+        self.source_state = source_state
+        self.generation = generation
+
+    def _key(self, i: int) -> bytes:
+        start = SNAPSHOT_HEADER.size + i * self.key_width
+        return self.map[start:start + self.key_width]
+
+    def _line(self, i: int) -> int:
+        start = SNAPSHOT_HEADER.size + self.count * self.key_width + i * 8
+        return int.from_bytes(self.map[start:start + 8], 'little', signed=True)
+
+    def find(self, key: str) -> int | None:
+        """
+        Функция ищет номер строки бинарным поиском по снапшоту.
+
+        Args:
+            key(str): Искомый ключ.
+        Returns:
+            int: Номер строки.
+            None: Если ключа нет.
+        """
+        raw = key.encode('utf-8')
+        if len(raw) > self.key_width:
+            return None
+        raw = raw.ljust(self.key_width, b'\0')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < raw:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == raw:
+            return self._line(lo)
+        return None
+
+
+class IndexSnapshot:
+    """
+    Бинарный снимок текстового индекса для быстрого поиска без разбора файла.
+
+    Файл состоит из заголовка, массива ключей фиксированной ширины
+    (utf-8, дополненных нулевыми байтами) в порядке сортировки и массива
+    номеров строк. Файл отображается в память, поиск - бинарный
+    по отображению, поэтому открытие не читает ключи целиком.
+    Снимок считается устаревшим, если текстовый индекс поменялся
+    после сборки, тогда он собирается заново при следующем поиске.
+    Текущий снапшот доступен как неизменяемый SnapshotView в current.
+    """
+    def __init__(self, path: str, path_index_txt: str) -> None:
+        self.path = path
+        self.path_index_txt = path_index_txt
+        self.current = None
+        self.generation = 0
+        self.rebuilds = 0
+        # Чтобы несколько читателей не собирали один и тот же снапшот одновременно.
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _header(count: int, key_width: int, source_state: tuple, generation: int, body_crc: int) -> bytes:
+        size, mtime = source_state
+        fields = (SNAPSHOT_MAGIC, count, key_width, size, mtime, generation, body_crc)
+        header_crc = zlib.crc32(struct.pack('<4sQIqqQI', *fields))
+        return SNAPSHOT_HEADER.pack(*fields, header_crc)
+
+    def close(self) -> None:
+        # Отображение не закрываем: его могут держать читатели.
+        self.current = None
+
+    def _open(self) -> SnapshotView | None:
+        """
+        Функция отображает файл снапшота в память и проверяет заголовок.
+
+        Returns:
+            SnapshotView: Снапшот, если он целый. Актуальность проверяет вызывающий.
+            None: Если файла нет или он повреждён.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+
+        try:
+            magic, count, key_width, size, mtime, generation, body_crc, header_crc = \
+                SNAPSHOT_HEADER.unpack_from(data)
+        except struct.error:
+            data.close()
+            return None
+        fields = struct.pack('<4sQIqqQI', magic, count, key_width, size, mtime, generation, body_crc)
+        # Обрезанный или чужой файл не используем.
+        if magic != SNAPSHOT_MAGIC or zlib.crc32(fields) != header_crc or \
+                len(data) != SNAPSHOT_HEADER.size + count * (key_width + 8):
+            data.close()
+            return None
+        self.generation = max(self.generation, generation)
+        return SnapshotView(data, count, key_width, (size, mtime), generation)
+
+    def verify(self) -> bool:
+        """
+        Функция проверяет контрольную сумму тела снапшота.
+        При открытии проверяется только заголовок, чтобы не читать весь файл.
+
+        Returns:
+            bool: True, если тело снапшота не повреждено.
+        """
+        view = self.current or self._open()
+        if view is None:
+            return False
+        body_crc = SNAPSHOT_HEADER.unpack_from(view.map)[6]
+        return zlib.crc32(view.map[SNAPSHOT_HEADER.size:]) == body_crc
+
+    def rebuild(self) -> SnapshotView | None:
+        """
+        Функция собирает снапшот по текстовому индексу и атомарно заменяет файл.
+
+        Returns:
+            SnapshotView: Новый снапшот.
+        """
+        keys = list()
+        lines = array('q')
+        with open(self.path_index_txt, 'r', encoding='utf-8', newline='') as f:
+            # Состояние берём у открытого файла: txt заменяется целиком, и путь
+            # может уже указывать на более новую версию.
+            st = os.fstat(f.fileno())
+            state = (st.st_size, st.st_mtime_ns)
+            for line in f:
+                list_line = line.strip().split(';')
+                keys.append(list_line[0].encode('utf-8'))
+                lines.append(int(list_line[-1]))
+
+        # Индекс и так отсортирован, сортировка устойчивая:
+        # из одинаковых ключей первым остаётся первый в файле, как в find_index.
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        key_width = max((len(key) for key in keys), default=0)
+        key_bytes = b''.join(keys[i].ljust(key_width, b'\0') for i in order)
+        line_array = array('q', (lines[i] for i in order))
+        if sys.byteorder != 'little':
+            line_array.byteswap()
+        body = key_bytes + line_array.tobytes()
+
+        self.generation += 1
+        header = self._header(len(keys), key_width, state, self.generation, zlib.crc32(body))
+        # У каждой сборки свой временный файл, сборки из разных процессов не мешают друг другу.
+        fd, tmp_path = tempfile.mkstemp(
+            prefix=os.path.basename(self.path) + '.', suffix='.tmp', dir=os.path.dirname(self.path) or '.'
+        )
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(body)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+        self.rebuilds += 1
+        self.current = self._open()
+        return self.current
+
+    def ensure(self) -> SnapshotView | None:
+        """
+        Функция возвращает снапшот, соответствующий текстовому индексу.
+        Сначала перечитывает файл снапшота (его мог собрать другой процесс),
+        и только если он тоже устарел - собирает заново.
+
+        Returns:
+            SnapshotView: Актуальный снапшот.
+            None: Если текстового индекса нет или снапшот не удалось собрать.
+        """
+        current = _file_state(self.path_index_txt)
+        if current is None:
+            return None
+        view = self.current
+        if view is not None and view.source_state == current:
+            return view
+        with self.lock:
+            view = self.current
+            if view is not None and view.source_state == current:
+                return view
+            view = self._open()
+            if view is None or view.source_state != current:
+                try:
+                    view = self.rebuild()
+                except OSError:
+                    # Например, на Windows файл держит другой процесс.
+                    return None
+            else:
+                self.current = view
+        if view is None or view.source_state != current:
+            return None
+        return view
+
+    def find(self, key: str) -> int | None:
+        """
+        Функция ищет номер строки в текущем снапшоте.
+        Снапшот должен быть проверен через ensure.
+        """
+        return self.current.find(key)
+
+    def stats(self) -> dict:
+        view = self.current
+        return {
+            'snapshot_keys': view.count if view is not None else 0,
+            'snapshot_generation': self.generation,
+            'snapshot_rebuilds': self.rebuilds,
+        }
@@ -0,0 +1,321 @@
+import os
+from . import functions as fn
+from .btree import BTreeIndex
+from .index_snapshot import IndexSnapshot
+from .profiling import profiled
+
+# Поддерживаемые движки индексов.
+INDEX_BACKENDS = ('text', 'btree')
+# Файл с движком индексов в корне хранилища.
+INDEX_BACKEND_FILE = 'index_backend.txt'
+# Сколько изменённых ключей держим поверх снапшота до его пересборки.
+OVERLAY_LIMIT = 4096
+
+
+class _Overlay:
+    """
+    Изменения индекса, сделанные этим процессом после сборки снапшота.
+
+    Как и снапшот, не меняется после создания: запись собирает новый
+    слой и подменяет ссылку, поэтому читатели без блокировки видят
+    либо старый, либо новый слой целиком.
+    Слой верен, пока txt файл в том состоянии, в котором его оставила запись.
+    """
+    __slots__ = ('base', 'changes', 'state')
+
+    def __init__(self, base, changes: dict, state: tuple) -> None:
+        self.base = base
+        # {ключ: номер строки или None, если ключ удалён}
+        self.changes = changes
+        self.state = state
+
+    def find(self, key: str) -> int | None:
+        if key in self.changes:
+            return self.changes[key]
+        return self.base.find(key)
+
+
+class TextIndex:
+    """
+    Старый индекс: отсортированный txt файл 'ключ;номер строки'.
+    Поиск читает файл построчно, любое изменение перезаписывает его целиком.
+    Интерфейс совпадает с BTreeIndex, поэтому CarService работает
+    с любым из них одинаково.
+    Для поиска рядом хранится бинарный снапшот (IndexSnapshot),
+    файл txt читается только при его сборке. Изменения этого процесса
+    складываются в слой поверх снапшота, и снапшот пересобирается
+    только когда слой разрастётся.
+    """
+    def __init__(self, path: str, snapshot: bool = True) -> None:
+        self.path = path
+        self.snapshot = IndexSnapshot(path.replace('.txt', '.snap'), path) if snapshot else None
+        self.overlay = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def state(self) -> tuple | None:
+        """
+        Функция возвращает размер и время изменения индекс файла
+        для проверки фильтра Блума или None, если файла нет.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    def _view(self, rebuild: bool = True):
+        """
+        Функция возвращает актуальный вид индекса: слой изменений
+        или снапшот. Ссылку берём один раз, запись её только подменяет.
+
+        Args:
+            rebuild(bool): Собирать ли снапшот, если готового нет.
+        Returns:
+            _Overlay | SnapshotView: Вид с поиском find.
+            None: Если снапшотов нет или актуального вида нет.
+        """
+        if self.snapshot is None:
+            return None
+        overlay = self.overlay
+        if overlay is not None and overlay.state == self.state():
+            return overlay
+        if rebuild:
+            return self.snapshot.ensure()
+        view = self.snapshot.current
+        if view is not None and view.source_state == self.state():
+            return view
+        return None
+
+    @profiled
+    def find(self, key: str) -> int | None:
+        view = self._view()
+        if view is not None:
+            return view.find(key)
+        # Если файла нет, find_index выбросит FileNotFoundError, как и раньше.
+        return fn.find_index(self.path, key)
+
+    def invalidate(self) -> None:
+        """
+        Функция удаляет снапшот после изменения индекса этим процессом,
+        если изменение нельзя учесть слоем.
+        По времени изменения txt файла это не всегда видно:
+        переименование ключа не меняет размер файла.
+        """
+        if self.snapshot is None:
+            return
+        self.overlay = None
+        self.snapshot.close()
+        try:
+            os.remove(self.snapshot.path)
+        except OSError:
+            pass
+
+    def _publish(self, view, changes: dict) -> None:
+        """
+        Функция после записи в txt файл выкладывает новый слой изменений
+        поверх снапшота или удаляет снапшот, если слой вести нельзя.
+
+        Args:
+            view: Вид индекса до записи (результат _view) или None.
+            changes(dict): Изменения этой записи {ключ: номер строки или None}.
+        """
+        if self.snapshot is None:
+            return
+        if view is None:
+            self.invalidate()
+            return
+        base = view.base if isinstance(view, _Overlay) else view
+        merged = dict(view.changes) if isinstance(view, _Overlay) else dict()
+        merged.update(changes)
+        state = self.state()
+        # По состоянию файла слой нельзя отличить от снапшота - пересобираем.
+        if len(merged) > OVERLAY_LIMIT or state is None or state == base.source_state:
+            self.invalidate()
+            return
+        self.overlay = _Overlay(base, merged, state)
+
+    @profiled
+    def find_many(self, keys: list) -> dict:
+        """
+        Функция ищет номера строк для списка ключей за один проход по индексу.
+
+        Args:
+            keys(list): Искомые ключи.
+        Returns:
+            dict: Словарь {ключ: номер строки} только для найденных ключей.
+        """
+        view = self._view()
+        if view is not None:
+            result = dict()
+            for key in set(keys):
+                line = view.find(key)
+                if line is not None:
+                    result[key] = line
+            return result
+
+        wanted = sorted(set(keys))
+        result = dict()
+        i = 0
+        # Индекс отсортирован, поэтому идём по нему и по ключам одновременно.
+        for key, line in self.items():
+            while i < len(wanted) and wanted[i] < key:
+                i += 1
+            if i == len(wanted):
+                break
+            if wanted[i] == key and key not in result:
+                result[key] = line
+        return result
+
+    def _inserted(self, view, entries: list) -> dict:
+        # При равных ключах merge_index ставит новую запись после старой,
+        # поэтому поиск по-прежнему находит первую.
+        changes = dict()
+        if view is None:
+            return changes
+        for key, value in entries:
+            key = str(key)
+            if key in changes:
+                continue
+            if view.find(key) is None:
+                changes[key] = value
+        return changes
+
+    @profiled
+    def insert(self, key: str, value: int) -> None:
+        view = self._view(rebuild=False)
+        fn.merge_index(self.path, [(key, value)])
+        self._publish(view, self._inserted(view, [(key, value)]))
+
+    @profiled
+    def insert_many(self, entries: list) -> None:
+        view = self._view(rebuild=False)
+        fn.merge_index(self.path, entries)
+        self._publish(view, self._inserted(view, entries))
+
+    def _rewrite(self, key: str, new_key: str | None) -> bool:
+        view = self._view(rebuild=False)
+        found = False
+        result_index = list()
+        for line in fn.read_file(self.path):
+            list_line = line.strip().split(';')
+            if list_line[0] == key:
+                found = True
+                # Удаляем запись или меняем её ключ.
+                if new_key is None:
+                    continue
+                list_line[0] = new_key
+            result_index.append(list_line)
+        result_index.sort(key=lambda x: x[0])
+        fn.write_index(self.path, ((list_line[0], list_line[-1]) for list_line in result_index))
+
+        changes = dict()
+        if view is not None and found:
+            line = view.find(key)
+            changes[key] = None
+            if new_key is not None:
+                # Сортировка устойчивая: переименованная запись встаёт перед
+                # записями с тем же ключом, только если раньше стояла перед ними.
+                if view.find(new_key) is None or key < new_key:
+                    changes[new_key] = line
+        self._publish(view, changes)
+        return found
+
+    @profiled
+    def delete(self, key: str) -> bool:
+        return self._rewrite(key, None)
+
+    @profiled
+    def rename(self, key: str, new_key: str) -> bool:
+        return self._rewrite(key, new_key)
+
+    def items(self):
+        """
+        Генератор возвращает пары (ключ, номер строки) в порядке ключей.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8', newline='') as f:
+                for line in f:
+                    list_line = line.strip().split(';')
+                    yield list_line[0], int(list_line[-1])
+        except FileNotFoundError:
+            return
+
+    def keys(self):
+        for key, _ in self.items():
+            yield key
+
+    @profiled
+    def bulk_build(self, entries) -> None:
+        fn.write_index(self.path, entries)
+        self.invalidate()
+
+    def stats(self) -> dict:
+        state = self.state()
+        stats = {'bytes': state[0] if state else 0}
+        if self.snapshot is not None:
+            stats.update(self.snapshot.stats())
+            overlay = self.overlay
+            stats['overlay_keys'] = len(overlay.changes) if overlay is not None else 0
+        return stats
+
+    def close(self) -> None:
+        if self.snapshot is not None:
+            self.overlay = None
+            self.snapshot.close()
+
+
+def read_index_backend(root_directory_path: str) -> str | None:
+    """
+    Функция читает сохранённый движок индексов хранилища.
+    Хранилище, созданное до появления файла, считается хранилищем
+    B+ дерева, если в нём уже есть файлы .btree.
+
+    Args:
+        root_directory_path(str): Корень хранилища.
+    Returns:
+        str: 'text' или 'btree'.
+        None: Если движок ещё не известен.
+    """
+    try:
+        with open(os.path.join(root_directory_path, INDEX_BACKEND_FILE), 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        names = os.listdir(root_directory_path)
+    except FileNotFoundError:
+        return None
+    return 'btree' if any(name.endswith('.btree') for name in names) else None
+
+
+def write_index_backend(root_directory_path: str, backend: str) -> None:
+    path = os.path.join(root_directory_path, INDEX_BACKEND_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(f'{backend}\n')
+    os.replace(path + '.tmp', path)
+
+
+def open_index(backend: str, path_index_txt: str):
+    """
+    Функция открывает индекс таблицы нужного движка.
+    Если B+ дерева ещё нет, а текстовый индекс есть,
+    дерево строится по нему одним проходом.
+
+    Args:
+        backend(str): 'text' или 'btree'.
+        path_index_txt(str): Путь к текстовому индексу таблицы.
+    Returns:
+        TextIndex | BTreeIndex: Индекс.
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f'Неизвестный движок индекса: {backend}')
+    legacy = TextIndex(path_index_txt)
+    if backend == 'text':
+        return legacy
+
+    index = BTreeIndex(path_index_txt.replace('.txt', '.btree'))
+    if not index.exists() and legacy.exists():
+        index.bulk_build(legacy.items())
+    return index
@@ -0,0 +1,180 @@
+import json
+import os
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+from . import functions as fn
+from .sales_partitions import month_of
+
+# Файл счётчиков в корне хранилища.
+STATS_FILE = 'stats.json'
+
+
+def _timestamp(value: str) -> int:
+    # Даты начала продаж храним суммой целых секунд, чтобы вычитание было точным.
+    return int(fn.decode_datetime(value).timestamp())
+
+
+def _average(total: Decimal, count: int) -> Decimal:
+    return (total / count).quantize(Decimal('0.01'))
+
+
+class InventoryStats:
+    """
+    Счётчики склада, которые меняются вместе с каждой записью в хранилище.
+
+    Хранятся количество машин по статусам, количество и сумма цен машин
+    по моделям, количество и сумма дат начала продаж непроданных машин,
+    количество и сумма живых продаж, в том числе по месяцам.
+    Счётчики сохраняются в stats.json рядом с данными, поэтому
+    статистика отдаётся без чтения cars.txt и sales.txt.
+    Строки машин и продаж передаются списками полей, как они лежат в файлах.
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.reset()
+
+    def reset(self) -> None:
+        # Пока счётчики не сохранены, в памяти не то же, что в файле.
+        self.state = None
+        self.by_status = Counter()
+        # {id модели: [количество машин, сумма цен]}
+        self.models = dict()
+        self.stock = 0
+        self.stock_date_sum = 0
+        self.sales = 0
+        self.revenue = Decimal(0)
+        # {месяц: [количество продаж, выручка]}
+        self.revenue_by_month = dict()
+
+    def stale(self) -> bool:
+        """
+        Функция проверяет, что счётчики в памяти не совпадают с файлом:
+        они ещё не загружены или файл поменял другой процесс.
+        """
+        return self.state is None or self.state != fn.file_state(self.path)
+
+    def load(self) -> bool:
+        """
+        Функция читает счётчики из файла.
+
+        Returns:
+            bool: False, если файла нет.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        self.by_status = Counter(data['by_status'])
+        self.models = {int(model_id): [count, Decimal(total)] for model_id, (count, total) in data['models'].items()}
+        self.stock = data['stock']
+        self.stock_date_sum = data['stock_date_sum']
+        self.sales = data['sales']
+        self.revenue = Decimal(data['revenue'])
+        self.revenue_by_month = {
+            month: [count, Decimal(total)] for month, (count, total) in data['revenue_by_month'].items()
+        }
+        self.state = fn.file_state(self.path)
+        return True
+
+    def save(self) -> None:
+        data = {
+            'by_status': dict(self.by_status),
+            'models': {str(model_id): [count, str(total)] for model_id, (count, total) in self.models.items()},
+            'stock': self.stock,
+            'stock_date_sum': self.stock_date_sum,
+            'sales': self.sales,
+            'revenue': str(self.revenue),
+            'revenue_by_month': {month: [count, str(total)] for month, (count, total) in self.revenue_by_month.items()},
+        }
+        with open(self.path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(self.path + '.tmp', self.path)
+        self.state = fn.file_state(self.path)
+
+    def _car(self, car_info: list, sign: int) -> None:
+        model = self.models.setdefault(int(car_info[1]), [0, Decimal(0)])
+        model[0] += sign
+        model[1] += sign * Decimal(car_info[2])
+        if model[0] == 0:
+            del self.models[int(car_info[1])]
+        self.by_status[car_info[-1]] += sign
+        if car_info[-1] != 'sold':
+            self.stock += sign
+            self.stock_date_sum += sign * _timestamp(car_info[3])
+
+    def car_added(self, car_info: list) -> None:
+        self._car(car_info, 1)
+
+    def car_removed(self, car_info: list) -> None:
+        self._car(car_info, -1)
+
+    def status_changed(self, car_info: list, old_status: str) -> None:
+        """
+        Функция переносит машину в счётчиках из старого статуса в новый.
+
+        Args:
+            car_info(list): Строка машины с новым статусом.
+            old_status(str): Статус до изменения.
+        """
+        self._car([*car_info[:-1], old_status], -1)
+        self._car(car_info, 1)
+
+    def _sale(self, sale_info: list, sign: int) -> None:
+        month = month_of(fn.decode_datetime(sale_info[-1]))
+        self.sales += sign
+        self.revenue += sign * Decimal(sale_info[2])
+        total = self.revenue_by_month.setdefault(month, [0, Decimal(0)])
+        total[0] += sign
+        total[1] += sign * Decimal(sale_info[2])
+        if total[0] == 0:
+            del self.revenue_by_month[month]
+
+    def sale_added(self, sale_info: list) -> None:
+        self._sale(sale_info, 1)
+
+    def sale_removed(self, sale_info: list) -> None:
+        self._sale(sale_info, -1)
+
+    def report(self, models: dict) -> dict:
+        """
+        Функция собирает статистику из счётчиков.
+        Время не зависит от количества машин и продаж, бренды
+        складываются из моделей, которых немного.
+
+        Args:
+            models(dict): Словарь {id модели: Model}.
+        Returns:
+            dict: Статистика склада.
+        """
+        brands = dict()
+        for model_id, (count, total) in self.models.items():
+            model = models.get(model_id)
+            if model is None:
+                continue
+            brand = brands.setdefault(model.brand, [0, Decimal(0)])
+            brand[0] += count
+            brand[1] += total
+
+        average_start = None
+        average_age_days = None
+        if self.stock:
+            average_start = datetime.fromtimestamp(self.stock_date_sum / self.stock)
+            average_age_days = (datetime.now() - average_start).total_seconds() / 86400
+        return {
+            'cars': sum(self.by_status.values()),
+            'cars_by_status': {status: count for status, count in sorted(self.by_status.items()) if count},
+            'sales': self.sales,
+            'revenue': self.revenue,
+            'revenue_by_month': {month: total for month, (_, total) in sorted(self.revenue_by_month.items())},
+            'average_price_by_model': {
+                model_id: _average(total, count) for model_id, (count, total) in sorted(self.models.items())
+            },
+            'average_price_by_brand': {
+                brand: _average(total, count) for brand, (count, total) in sorted(brands.items())
+            },
+            'inventory': self.stock,
+            'average_date_start': average_start,
+            'average_age_days': average_age_days,
+        }
@@ -0,0 +1,228 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+# Стек спанов текущего потока и профилировщик, который его записывает.
+# Если профилировщика нет, спаны ничего не делают.
+_local = threading.local()
+
+
+class _NullSpan:
+    """
+    Спан вне профилируемого вызова: ничего не измеряет.
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+NULL_SPAN = _NullSpan()
+# Метка в _local.profiler: поток внутри корневого вызова, не попавшего в выборку.
+# Вложенные вызовы не разыгрывают свою выборку и не профилируются.
+UNSAMPLED = object()
+
+
+class _UnsampledSpan:
+    """
+    Корневой вызов вне выборки: ничего не измеряет,
+    но до выхода помечает поток, чтобы вложенные вызовы тоже не профилировались.
+    """
+    def __enter__(self):
+        _local.profiler = UNSAMPLED
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        _local.profiler = None
+        return False
+
+
+UNSAMPLED_SPAN = _UnsampledSpan()
+
+
+def _current():
+    # Профилировщик текущего вызова или None, если вызов не профилируется.
+    profiler = getattr(_local, 'profiler', None)
+    return None if profiler is UNSAMPLED else profiler
+
+
+class _Span:
+    __slots__ = ('profiler', 'name', 'start', 'children')
+
+    def __init__(self, profiler, name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        _local.stack.append(self)
+        self.children = 0
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        duration = time.perf_counter_ns() - self.start
+        stack = _local.stack
+        path = tuple(item.name for item in stack)
+        stack.pop()
+        if stack:
+            stack[-1].children += duration
+        else:
+            # Корневой спан закончился, вызов больше не профилируется.
+            _local.profiler = None
+        self.profiler.record(path, self.start, duration, duration - self.children)
+        return False
+
+
+class Profiler:
+    """
+    Профилировщик вызовов CarService по вложенным спанам.
+
+    Профилируется только доля sample_rate корневых вызовов, остальные
+    проходят почти без накладных расходов, поэтому профилировщик
+    можно держать включённым. Собранное выводится как свёрнутые стеки
+    (flamegraph.pl, speedscope) или как Chrome trace (chrome://tracing, Perfetto).
+    """
+    def __init__(self, sample_rate: float = 1.0, max_events: int = 100000) -> None:
+        self.sample_rate = sample_rate
+        self.lock = threading.Lock()
+        # Последние спаны для Chrome trace: (стек, начало, длительность, поток).
+        self.events = deque(maxlen=max_events)
+        # Собственное время каждого стека в наносекундах.
+        self.folded = Counter()
+        self.sampled = 0
+        self.calls = 0
+
+    def sample(self) -> bool:
+        sampled = self.sample_rate >= 1.0 or random.random() < self.sample_rate
+        with self.lock:
+            self.calls += 1
+            if sampled:
+                self.sampled += 1
+        return sampled
+
+    def record(self, path: tuple, start: int, duration: int, self_time: int) -> None:
+        with self.lock:
+            self.events.append((path, start, duration, threading.get_ident()))
+            self.folded[path] += self_time
+
+    def reset(self) -> None:
+        with self.lock:
+            self.events.clear()
+            self.folded.clear()
+            self.sampled = 0
+            self.calls = 0
+
+    def folded_stacks(self) -> str:
+        """
+        Функция возвращает свёрнутые стеки: 'a;b;c время_мкс' на строку.
+
+        Returns:
+            str: Текст для flamegraph.pl или speedscope.
+        """
+        with self.lock:
+            items = sorted(self.folded.items())
+        return ''.join(f'{";".join(path)} {self_time // 1000}\n' for path, self_time in items)
+
+    def chrome_trace(self) -> dict:
+        """
+        Функция возвращает спаны в формате Chrome trace.
+
+        Returns:
+            dict: JSON объект с полным событием 'X' на каждый спан.
+        """
+        pid = os.getpid()
+        with self.lock:
+            events = list(self.events)
+        return {
+            'traceEvents': [
+                {
+                    'name': path[-1],
+                    'cat': path[0],
+                    'ph': 'X',
+                    'ts': start / 1000,
+                    'dur': duration / 1000,
+                    'pid': pid,
+                    'tid': tid,
+                }
+                for path, start, duration, tid in events
+            ],
+            'displayTimeUnit': 'ms',
+        }
+
+    def write_folded(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.folded_stacks())
+
+    def write_chrome_trace(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+def span(name: str):
+    """
+    Функция возвращает спан фазы внутри профилируемого вызова.
+
+    Args:
+        name(str): Имя фазы.
+    Returns:
+        Контекстный менеджер спана.
+    """
+    profiler = _current()
+    if profiler is None:
+        return NULL_SPAN
+    return _Span(profiler, name)
+
+
+def root_span(profiler: Profiler | None, name: str):
+    """
+    Функция начинает профилируемый вызов, если он попал в выборку.
+    Внутри уже профилируемого вызова возвращает обычный вложенный спан,
+    внутри вызова вне выборки - пустой.
+    """
+    current = getattr(_local, 'profiler', None)
+    if current is UNSAMPLED:
+        return NULL_SPAN
+    if current is not None:
+        return _Span(current, name)
+    if profiler is None:
+        return NULL_SPAN
+    if not profiler.sample():
+        return UNSAMPLED_SPAN
+    _local.profiler = profiler
+    _local.stack = list()
+    return _Span(profiler, name)
+
+
+def traced(method):
+    """
+    Декоратор делает метод сервиса корнем профилируемого вызова.
+    Профилировщик берётся из атрибута profiler сервиса.
+    """
+    name = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with root_span(self.profiler, name):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+def profiled(func):
+    """
+    Декоратор записывает спан функции, если она вызвана внутри профилируемого вызова.
+    """
+    name = func.__qualname__
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _current()
+        if profiler is None:
+            return func(*args, **kwargs)
+        with _Span(profiler, name):
+            return func(*args, **kwargs)
+    return wrapper
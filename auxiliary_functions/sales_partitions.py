@@ -0,0 +1,276 @@
+import json
+import lzma
+import os
+import shutil
+from datetime import datetime
+from constants import LINE_SIZE
+from . import functions as fn
+from .indexes import open_index
+
+# Файл со списком партиций в директории продаж.
+MANIFEST_FILE = 'manifest.json'
+ARCHIVE_SUFFIX = '.txt.xz'
+
+
+def month_of(date: datetime) -> str:
+    """
+    Функция возвращает имя партиции для даты продажи: 'YYYY-MM'.
+    """
+    return f'{date.year:04d}-{date.month:02d}'
+
+
+class SalesPartition:
+    """
+    Файл продаж с индексом. Это либо месячная партиция,
+    либо старый sales.txt целиком (тогда name равен None).
+    Архивная партиция хранит данные сжатыми lzma, индекс остаётся как есть.
+    """
+    def __init__(self, name: str | None, path_txt: str, index, archived: bool = False) -> None:
+        self.name = name
+        self.path_txt = path_txt
+        self.index = index
+        self.archived = archived
+
+    @property
+    def path_archive(self) -> str:
+        return self.path_txt[:-len('.txt')] + ARCHIVE_SUFFIX
+
+    def read_line(self, line: int) -> list:
+        if not self.archived:
+            return fn.read_line(self.path_txt, line)
+        return self.read_lines([line]).get(line, list())
+
+    def read_lines(self, lines) -> dict:
+        if not self.archived:
+            return fn.read_lines(self.path_txt, lines)
+        # Строки продаж в ASCII, поэтому смещения в байтах совпадают с символами.
+        result = dict()
+        with lzma.open(self.path_archive, 'rb') as f:
+            for line in sorted(set(lines)):
+                f.seek(line * LINE_SIZE)
+                result[line] = f.read(LINE_SIZE).decode('utf-8').strip().split(';')
+        return result
+
+    def iter_rows(self):
+        if not self.archived:
+            yield from fn.iter_rows(self.path_txt)
+            return
+        with lzma.open(self.path_archive, 'rb') as f:
+            while line := f.read(LINE_SIZE):
+                row = line.decode('utf-8').strip()
+                if not row or row == 'is_deleted':
+                    continue
+                yield row
+
+    def scan_rows(self):
+        """
+        Генератор возвращает живые продажи с номерами строк, читая файл побайтово.
+        """
+        if not self.archived:
+            yield from fn.scan_rows(self.path_txt)
+            return
+        yield from fn.scan_rows(self.path_archive, lzma.open)
+
+
+class SalesPartitions:
+    """
+    Продажи, разложенные по месячным партициям.
+
+    Каждая партиция - пара файлов 'YYYY-MM.txt' и 'YYYY-MM_index.txt'
+    в директории продаж. Список партиций с количеством строк
+    и признаком архива хранится в manifest.json, поэтому запрос
+    за период открывает только партиции нужных месяцев.
+    """
+    def __init__(self, directory: str, index_backend: str = 'text') -> None:
+        self.directory = directory
+        self.index_backend = index_backend
+        self.manifest = dict()
+        self.manifest_state = None
+        self.opened = dict()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_path)
+
+    def load(self) -> dict:
+        """
+        Функция возвращает манифест, перечитывая его, если файл поменял другой процесс.
+
+        Returns:
+            dict: Словарь {имя партиции: {'rows': int, 'archived': bool}}.
+        """
+        state = fn.file_state(self.manifest_path)
+        if state != self.manifest_state:
+            try:
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self.manifest = json.load(f)['partitions']
+            except FileNotFoundError:
+                self.manifest = dict()
+            self.manifest_state = state
+        return self.manifest
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'partitions': dict(sorted(self.manifest.items()))}, f, indent=1)
+        os.replace(tmp_path, self.manifest_path)
+        self.manifest_state = fn.file_state(self.manifest_path)
+
+    def partition(self, name: str) -> SalesPartition:
+        entry = self.load()[name]
+        if name not in self.opened:
+            path_txt = os.path.join(self.directory, f'{name}.txt')
+            index = open_index(self.index_backend, os.path.join(self.directory, f'{name}_index.txt'))
+            self.opened[name] = SalesPartition(name, path_txt, index)
+        partition = self.opened[name]
+        partition.archived = entry['archived']
+        return partition
+
+    def names(self, since: datetime | None = None, until: datetime | None = None) -> list:
+        """
+        Функция возвращает имена партиций, пересекающихся с периодом [since, until).
+
+        Args:
+            since(datetime): Начало периода, включительно.
+            until(datetime): Конец периода, не включительно.
+        Returns:
+            list: Отсортированные имена партиций.
+        """
+        result = list()
+        for name in sorted(self.load()):
+            if since is not None and name < month_of(since):
+                continue
+            # Партиция не нужна, если её месяц начинается не раньше until.
+            if until is not None and datetime(int(name[:4]), int(name[5:]), 1) >= until.replace(tzinfo=None):
+                continue
+            result.append(name)
+        return result
+
+    def partitions(self, since: datetime | None = None, until: datetime | None = None) -> list:
+        return [self.partition(name) for name in self.names(since, until)]
+
+    def for_write(self, name: str) -> SalesPartition:
+        """
+        Функция возвращает партицию для записи, создавая её при необходимости.
+        Архивная партиция сначала распаковывается.
+
+        Args:
+            name(str): Имя партиции.
+        Returns:
+            SalesPartition: Партиция.
+        """
+        if name not in self.load():
+            self.manifest[name] = {'rows': 0, 'archived': False}
+            self.save()
+        partition = self.partition(name)
+        if partition.archived:
+            self.unarchive(name)
+        return partition
+
+    def added(self, name: str, count: int) -> None:
+        self.load()[name]['rows'] += count
+        self.save()
+
+    def archive(self, name: str) -> None:
+        """
+        Функция сжимает данные партиции lzma. Индекс не меняется,
+        поиск по номеру продажи продолжает работать.
+
+        Args:
+            name(str): Имя партиции.
+        """
+        partition = self.partition(name)
+        if partition.archived:
+            return
+        with open(partition.path_txt, 'rb') as src, lzma.open(partition.path_archive + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(partition.path_archive + '.tmp', partition.path_archive)
+        self.manifest[name]['archived'] = True
+        self.save()
+        os.remove(partition.path_txt)
+        partition.archived = True
+
+    def unarchive(self, name: str) -> None:
+        partition = self.partition(name)
+        if not partition.archived:
+            return
+        with lzma.open(partition.path_archive, 'rb') as src, open(partition.path_txt + '.tmp', 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(partition.path_txt + '.tmp', partition.path_txt)
+        self.manifest[name]['archived'] = False
+        self.save()
+        os.remove(partition.path_archive)
+        partition.archived = False
+
+    def find(self, sales_number: str) -> tuple | None:
+        """
+        Функция ищет продажу по номеру, начиная с новых партиций.
+
+        Args:
+            sales_number(str): Номер продажи.
+        Returns:
+            tuple: Партиция и номер строки.
+            None: Если продажи нет.
+        """
+        for name in reversed(self.names()):
+            partition = self.partition(name)
+            if not partition.index.exists():
+                continue
+            line = partition.index.find(sales_number)
+            if line is not None:
+                return partition, line
+        return None
+
+    def migrate(self, path_txt: str) -> int:
+        """
+        Функция раскладывает продажи из старого sales.txt по месячным партициям.
+        Манифест пишется последним, поэтому до него хранилище
+        остаётся старым и миграция при сбое просто повторится.
+
+        Args:
+            path_txt(str): Путь к старому sales.txt.
+        Returns:
+            int: Количество перенесённых продаж.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        files = dict()
+        entries = dict()
+        try:
+            for _, sale_info in fn.scan_rows(path_txt):
+                name = month_of(fn.decode_datetime(sale_info[-1]))
+                if name not in files:
+                    files[name] = open(os.path.join(self.directory, f'{name}.txt'), 'w',
+                                       encoding='utf-8', newline='')
+                    entries[name] = list()
+                entries[name].append((sale_info[0], len(entries[name])))
+                files[name].write(';'.join(sale_info).ljust(LINE_SIZE - 1) + '\n')
+        finally:
+            for f in files.values():
+                f.close()
+
+        for name, partition_entries in entries.items():
+            partition_entries.sort(key=lambda x: x[0])
+            index = open_index(self.index_backend, os.path.join(self.directory, f'{name}_index.txt'))
+            index.bulk_build(partition_entries)
+            index.close()
+            self.manifest[name] = {'rows': len(partition_entries), 'archived': False}
+        self.save()
+        return sum(len(partition_entries) for partition_entries in entries.values())
+
+    def reset(self) -> None:
+        """
+        Функция удаляет все партиции перед полной загрузкой.
+        """
+        for partition in self.opened.values():
+            partition.index.close()
+        self.opened = dict()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.manifest = dict()
+        self.save()
+
+    def stats(self) -> dict:
+        return {name: dict(entry) for name, entry in sorted(self.load().items())}
@@ -0,0 +1,112 @@
+import lzma
+import struct
+import zlib
+
+from my_exceptions import SnapshotFormatError
+
+# Сигнатура файла снапшота и коды поддерживаемых алгоритмов сжатия.
+SNAPSHOT_MAGIC = b'BIBIPSN1'
+COMPRESSION_CODES = {'zlib': 1, 'lzma': 2}
+
+# Коды таблиц внутри снапшота. 0 - маркер конца потока.
+TABLE_CODES = {'models': 1, 'cars': 2, 'sales': 3}
+END_OF_STREAM = 0
+
+# Заголовок записи: код таблицы (1 байт) и длина данных (4 байта).
+RECORD_HEADER = struct.Struct('>BI')
+
+# Размер блока при потоковом чтении и записи.
+CHUNK_SIZE = 1 << 20
+
+
+def _compressor(compression: str):
+    if compression == 'zlib':
+        return zlib.compressobj(6)
+    return lzma.LZMACompressor()
+
+
+def _decompressor(code: int):
+    if code == COMPRESSION_CODES['zlib']:
+        return zlib.decompressobj()
+    return lzma.LZMADecompressor()
+
+
+def write_snapshot(path: str, tables: dict, compression: str = 'zlib') -> int:
+    """
+    Функция потоково записывает строки таблиц в сжатый бинарный снапшот.
+    Каждая запись хранится как код таблицы, длина и данные строки.
+
+    Args:
+        path(str): Путь к файлу снапшота.
+        tables(dict): Словарь {имя таблицы: итератор строк}.
+        compression(str): Алгоритм сжатия: 'zlib' или 'lzma'.
+    Returns:
+        int: Количество записанных строк.
+    """
+    if compression not in COMPRESSION_CODES:
+        raise SnapshotFormatError
+
+    compressor = _compressor(compression)
+    count = 0
+    with open(path, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + bytes([COMPRESSION_CODES[compression]]))
+        buffer = bytearray()
+        for table, rows in tables.items():
+            code = TABLE_CODES[table]
+            for row in rows:
+                payload = row.encode('utf-8')
+                buffer += RECORD_HEADER.pack(code, len(payload))
+                buffer += payload
+                count += 1
+
+                # Сжимаем накопленный блок, чтобы не держать всё в памяти.
+                if len(buffer) >= CHUNK_SIZE:
+                    f.write(compressor.compress(bytes(buffer)))
+                    buffer.clear()
+        buffer += RECORD_HEADER.pack(END_OF_STREAM, 0)
+        f.write(compressor.compress(bytes(buffer)))
+        f.write(compressor.flush())
+    return count
+
+
+def read_snapshot(path: str):
+    """
+    Генератор потоково читает снапшот и возвращает пары (таблица, строка).
+
+    Args:
+        path(str): Путь к файлу снапшота.
+    Yields:
+        tuple: Имя таблицы и строка без выравнивания.
+    """
+    names = {code: name for name, code in TABLE_CODES.items()}
+    with open(path, 'rb') as f:
+        header = f.read(len(SNAPSHOT_MAGIC) + 1)
+        if len(header) != len(SNAPSHOT_MAGIC) + 1 or not header.startswith(SNAPSHOT_MAGIC):
+            raise SnapshotFormatError
+        if header[-1] not in COMPRESSION_CODES.values():
+            raise SnapshotFormatError
+
+        decompressor = _decompressor(header[-1])
+        buffer = bytearray()
+        pos = 0
+        while True:
+            # Разбираем все полные записи, которые уже есть в буфере.
+            while len(buffer) - pos >= RECORD_HEADER.size:
+                code, length = RECORD_HEADER.unpack_from(buffer, pos)
+                if code == END_OF_STREAM:
+                    return
+                start = pos + RECORD_HEADER.size
+                if len(buffer) - start < length:
+                    break
+                if code not in names:
+                    raise SnapshotFormatError
+                yield names[code], buffer[start:start + length].decode('utf-8')
+                pos = start + length
+
+            del buffer[:pos]
+            pos = 0
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                # Поток закончился без маркера конца - файл обрезан.
+                raise SnapshotFormatError
+            buffer += decompressor.decompress(chunk)
@@ -1 +1,2 @@
 LINE_SIZE = 501  # Длина строки с учетом символа \n
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'  # Формат дат в старых файлах
@@ -1 +1,9 @@
-from .exceptions import InvalidCharacterStr, CarNotFoundError
+from .exceptions import (
+    InvalidCharacterStr,
+    CarNotFoundError,
+    SnapshotFormatError,
+    ShardCountMismatchError,
+    IndexBackendMismatchError,
+    RemoteServiceError,
+    ReplicaOutOfSyncError
+)
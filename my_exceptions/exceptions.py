@@ -14,3 +14,57 @@ class CarNotFoundError(ValueError):
     """
     def __str__(self):
         return 'Такой машины нет в файле.'
+
+
+class SnapshotFormatError(ValueError):
+    """
+    Исключение, возникающее если файл снапшота повреждён или имеет неизвестный формат.
+    """
+    def __str__(self):
+        return 'Файл снапшота повреждён или имеет неизвестный формат.'
+
+
+class ShardCountMismatchError(ValueError):
+    """
+    Исключение, возникающее если число шардов не совпадает с сохранённым в хранилище.
+
+    Число шардов меняется только офлайн перебалансировкой.
+    """
+    def __str__(self):
+        return 'Число шардов не совпадает с хранилищем. Используйте перебалансировку.'
+
+
+class IndexBackendMismatchError(ValueError):
+    """
+    Исключение, возникающее если хранилище с индексами B+ дерева
+    открывают с текстовыми индексами.
+
+    Записи через другой движок не попадают в индексы хранилища.
+    """
+    def __str__(self):
+        return 'Движок индексов не совпадает с хранилищем.'
+
+
+class RemoteServiceError(RuntimeError):
+    """
+    Исключение, возникающее если сервер вернул ошибку,
+    для которой нет отдельного исключения на стороне клиента.
+    """
+    def __init__(self, error_type: str, message: str):
+        super().__init__(error_type, message)
+        self.error_type = error_type
+        self.message = message
+
+    def __str__(self):
+        return f'Ошибка сервера {self.error_type}: {self.message}'
+
+
+class ReplicaOutOfSyncError(RuntimeError):
+    """
+    Исключение, возникающее если реплика не может продолжить применять журнал:
+    в журнале пропуск или снапшот из события уже удалён.
+
+    Такую реплику нужно заново скопировать с основного хранилища.
+    """
+    def __str__(self):
+        return 'Реплика отстала от журнала, нужна полная синхронизация.'
@@ -0,0 +1,2 @@
+from .client import CarServiceClient
+from .server import CarServiceServer, serve
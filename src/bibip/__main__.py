@@ -0,0 +1,94 @@
+import argparse
+import json
+import sys
+from auxiliary_functions.indexes import INDEX_BACKENDS
+from .loadtest import check_invariants, format_report, parse_mix, read_events, replay, run_load
+from .server import serve
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog='python -m bibip', description='Автосалон Бибип.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = commands.add_parser('serve', help='Запустить HTTP/JSON сервер.')
+    serve_parser.add_argument('--root', required=True, help='Директория хранилища.')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--max-batch', type=int, default=256, help='Максимум записей в пачке.')
+    serve_parser.add_argument(
+        '--batch-window', type=float, default=0.0,
+        help='Сколько секунд ждать попутные записи перед пакетной записью.'
+    )
+    serve_parser.add_argument(
+        '--profile-rate', type=float, default=0.0,
+        help='Доля профилируемых вызовов, например 0.01.'
+    )
+    serve_parser.add_argument(
+        '--profile-out',
+        help='Файл профиля: .json - Chrome trace, иначе свёрнутые стеки для flame graph.'
+    )
+
+    load_parser = commands.add_parser('loadtest', help='Нагрузочный тест хранилища или сервера.')
+    load_parser.add_argument('--root', help='Директория хранилища. С --url нужна только для проверки.')
+    load_parser.add_argument('--url', help='Адрес сервера, например http://127.0.0.1:8080.')
+    load_parser.add_argument(
+        '--mix', type=parse_mix,
+        help='Доли операций, например add_car=3,sell_car=2,get_cars=2,get_car_info=10,update_vin=1,revert_sale=1.'
+    )
+    load_parser.add_argument('--rate', type=float, default=0.0, help='Операций в секунду всего, 0 - без ограничения.')
+    load_parser.add_argument('--duration', type=float, help='Сколько секунд работать.')
+    load_parser.add_argument('--ops', type=int, help='Сколько операций выполнить.')
+    load_parser.add_argument('--workers', type=int, default=4)
+    load_parser.add_argument('--mode', choices=('threads', 'processes'), default='threads')
+    load_parser.add_argument('--seed', type=int, default=1)
+    load_parser.add_argument('--record', help='Записать выполненные операции для replay.')
+    load_parser.add_argument('--json', help='Сохранить отчёт в JSON.')
+    load_parser.add_argument('--no-check', action='store_true', help='Не проверять хранилище после нагрузки.')
+
+    replay_parser = commands.add_parser('replay', help='Проиграть записанные операции или журнал changes/.')
+    replay_parser.add_argument('--root', help='Директория хранилища. С --url нужна только для проверки.')
+    replay_parser.add_argument('--url', help='Адрес сервера.')
+    replay_parser.add_argument('--log', required=True, help='Файл записи loadtest или директория changes/.')
+    replay_parser.add_argument('--speed', type=float, default=0.0, help='Ускорение относительно записи, 0 - без пауз.')
+    replay_parser.add_argument('--json', help='Сохранить отчёт в JSON.')
+    replay_parser.add_argument('--no-check', action='store_true', help='Не проверять хранилище после проигрывания.')
+
+    for command_parser in (serve_parser, load_parser, replay_parser):
+        command_parser.add_argument(
+            '--index-backend', choices=INDEX_BACKENDS,
+            help='Движок индексов. По умолчанию - сохранённый в хранилище, для нового хранилища text.'
+        )
+
+    args = parser.parse_args()
+    if args.command in ('loadtest', 'replay'):
+        if not args.root and not args.url:
+            parser.error('нужен --root или --url')
+        if args.command == 'loadtest':
+            if args.duration is None and args.ops is None:
+                parser.error('нужен --duration или --ops')
+            try:
+                report = run_load(args.root, args.url, args.mix, args.rate, args.duration, args.ops,
+                                  args.workers, args.mode, args.seed, args.record, args.index_backend)
+            except ValueError as e:
+                parser.error(str(e))
+        else:
+            report = replay(read_events(args.log), args.root, args.url, args.speed, args.index_backend)
+        print(format_report(report))
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=1)
+
+        if args.root and not args.no_check:
+            problems = check_invariants(args.root, args.index_backend)
+            for problem in problems:
+                print(f'Нарушение: {problem}')
+            print('Проверка хранилища: ' + ('ошибки' if problems else 'ок'))
+            if problems:
+                sys.exit(1)
+    elif args.command == 'serve':
+        serve(args.root, args.host, args.port, args.max_batch, args.batch_window,
+              args.profile_rate, args.profile_out, args.index_backend)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+import http.client
+import json
+from datetime import datetime
+from urllib.parse import urlsplit
+from models import Car, CarFullInfo, CarStatus, Model, ModelSaleStats, Sale
+from my_exceptions import CarNotFoundError, InvalidCharacterStr, RemoteServiceError
+from .server import READ_OPERATIONS
+
+
+class CarServiceClient:
+    """
+    Клиент сервера bibip с тем же интерфейсом, что и у CarService.
+    Держит одно keep-alive соединение, поэтому каждому потоку нужен свой клиент.
+    """
+    def __init__(self, base_url: str = 'http://127.0.0.1:8080', timeout: float = 30.0) -> None:
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self.connection = None
+
+    def close(self) -> None:
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def call(self, op: str, body: dict | None = None):
+        """
+        Функция вызывает операцию на сервере и возвращает JSON результат.
+
+        Args:
+            op(str): Имя операции.
+            body(dict): Аргументы операции.
+        Returns:
+            Результат операции в виде JSON.
+        """
+        payload = json.dumps(body or dict()).encode('utf-8')
+        headers = {'Content-Type': 'application/json'}
+        # Одна повторная попытка. Запись повторяем, только если запрос не удалось
+        # отправить в уже открытое соединение (сервер закрыл его, пока оно простаивало):
+        # после отправки сервер мог её выполнить, и повтор записал бы её дважды.
+        for attempt in range(2):
+            reused = self.connection is not None
+            if not reused:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.connection.request('POST', f'/{op}', payload, headers)
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt or not reused:
+                    raise
+                continue
+            try:
+                response = self.connection.getresponse()
+                data = json.loads(response.read())
+                break
+            except (ConnectionError, http.client.HTTPException):
+                self.close()
+                if attempt or op not in READ_OPERATIONS:
+                    raise
+
+        if 'error' in data:
+            error = data['error']
+            if error['type'] == 'CarNotFoundError':
+                raise CarNotFoundError
+            if error['type'] == 'InvalidCharacterStr':
+                raise InvalidCharacterStr
+            raise RemoteServiceError(error['type'], error['message'])
+        return data['result']
+
+    def add_model(self, model: Model) -> Model:
+        return Model(**self.call('add_model', {'model': model.model_dump(mode='json')}))
+
+    def add_car(self, car: Car) -> Car:
+        return Car(**self.call('add_car', {'car': car.model_dump(mode='json')}))
+
+    def sell_car(self, sale: Sale) -> Car:
+        return Car(**self.call('sell_car', {'sale': sale.model_dump(mode='json')}))
+
+    def get_cars(self, status: CarStatus) -> list[Car]:
+        return [Car(**car) for car in self.call('get_cars', {'status': str(status)})]
+
+    def get_car_info(self, vin: str) -> CarFullInfo | None:
+        result = self.call('get_car_info', {'vin': vin})
+        return None if result is None else CarFullInfo(**result)
+
+    def get_car_infos(self, vins: list[str]) -> list[CarFullInfo | None]:
+        infos = self.call('get_car_infos', {'vins': vins})
+        return [None if info is None else CarFullInfo(**info) for info in infos]
+
+    def update_vin(self, vin: str, new_vin: str) -> Car:
+        return Car(**self.call('update_vin', {'vin': vin, 'new_vin': new_vin}))
+
+    def revert_sale(self, sales_number: str) -> Car:
+        return Car(**self.call('revert_sale', {'sales_number': sales_number}))
+
+    def top_models_by_sales(self, since: datetime | None = None,
+                            until: datetime | None = None) -> list[ModelSaleStats]:
+        body = {
+            'since': since.isoformat() if since else None,
+            'until': until.isoformat() if until else None,
+        }
+        return [ModelSaleStats(**stats) for stats in self.call('top_models_by_sales', body)]
+
+    def sales_between(self, start: datetime, end: datetime) -> list[Sale]:
+        sales = self.call('sales_between', {'start': start.isoformat(), 'end': end.isoformat()})
+        return [Sale(**sale) for sale in sales]
@@ -0,0 +1,578 @@
+import json
+import lzma
+import math
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from decimal import Decimal
+from bibip_car_service import CarService, TABLES
+from constants import LINE_SIZE
+from models import Car, CarStatus, Model, Sale
+from replicated_car_service import mutation_call
+from .client import CarServiceClient
+
+# Операции нагрузки и их доли по умолчанию.
+OPERATIONS = ('add_car', 'sell_car', 'get_cars', 'get_car_info', 'update_vin', 'revert_sale')
+DEFAULT_MIX = {'add_car': 3, 'sell_car': 2, 'get_cars': 2, 'get_car_info': 10, 'update_vin': 1, 'revert_sale': 1}
+
+# Модели, на которые ссылаются машины нагрузки.
+LOAD_MODELS = [
+    Model(id=1, name='Optima', brand='Kia'),
+    Model(id=2, name='Sorento', brand='Kia'),
+    Model(id=3, name='3', brand='Mazda'),
+    Model(id=4, name='Pathfinder', brand='Nissan'),
+]
+
+
+def parse_mix(text: str) -> dict:
+    """
+    Функция разбирает доли операций вида 'add_car=3,get_cars=5'.
+
+    Args:
+        text(str): Доли операций через запятую.
+    Returns:
+        dict: Словарь {операция: доля}.
+    """
+    mix = dict()
+    for item in text.split(','):
+        op, _, weight = item.partition('=')
+        op = op.strip()
+        if op not in OPERATIONS:
+            raise ValueError(f'Неизвестная операция: {op}')
+        mix[op] = float(weight)
+    return mix
+
+
+class LatencyHistogram:
+    """
+    Логарифмическая гистограмма задержек в наносекундах.
+    На каждое удвоение приходится SUB_BUCKETS корзин, то есть точность около 4%.
+    Гистограммы потоков и процессов складываются через merge.
+    """
+    SUB_BUCKETS = 16
+
+    def __init__(self) -> None:
+        self.buckets = Counter()
+        self.count = 0
+        self.max = 0
+
+    def record(self, ns: int) -> None:
+        ns = max(ns, 1)
+        self.buckets[int(math.log2(ns) * self.SUB_BUCKETS)] += 1
+        self.count += 1
+        self.max = max(self.max, ns)
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p: float) -> int:
+        """
+        Функция возвращает верхнюю границу корзины, в которую попал перцентиль.
+
+        Args:
+            p(float): Перцентиль от 0 до 100.
+        Returns:
+            int: Задержка в наносекундах.
+        """
+        if not self.count:
+            return 0
+        rank = math.ceil(self.count * p / 100)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(int(2 ** ((bucket + 1) / self.SUB_BUCKETS)), self.max)
+        return self.max
+
+
+class LoadStats:
+    """
+    Результаты нагрузки: гистограммы задержек и ошибки по операциям,
+    а также число завершённых операций по секундам от старта.
+    """
+    def __init__(self) -> None:
+        self.latency = dict()
+        self.errors = Counter()
+        self.timeline = Counter()
+
+    def record(self, op: str, ns: int, second: int, error: bool = False) -> None:
+        self.latency.setdefault(op, LatencyHistogram()).record(ns)
+        self.timeline[second] += 1
+        if error:
+            self.errors[op] += 1
+
+    def merge(self, other: 'LoadStats') -> None:
+        for op, histogram in other.latency.items():
+            self.latency.setdefault(op, LatencyHistogram()).merge(histogram)
+        self.errors.update(other.errors)
+        self.timeline.update(other.timeline)
+
+    @property
+    def total(self) -> int:
+        return sum(histogram.count for histogram in self.latency.values())
+
+    def report(self, elapsed: float) -> dict:
+        """
+        Функция собирает отчёт в JSON совместимом виде.
+
+        Args:
+            elapsed(float): Длительность нагрузки в секундах.
+        Returns:
+            dict: Перцентили в миллисекундах по операциям, пропускная способность и ряд по секундам.
+        """
+        operations = dict()
+        for op, histogram in sorted(self.latency.items()):
+            operations[op] = {
+                'count': histogram.count,
+                'errors': self.errors[op],
+                'p50_ms': histogram.percentile(50) / 1e6,
+                'p90_ms': histogram.percentile(90) / 1e6,
+                'p99_ms': histogram.percentile(99) / 1e6,
+                'max_ms': histogram.max / 1e6,
+            }
+        return {
+            'elapsed_s': elapsed,
+            'total': self.total,
+            'throughput': self.total / elapsed if elapsed else 0.0,
+            'operations': operations,
+            'timeline': [self.timeline[second] for second in range(max(self.timeline, default=-1) + 1)],
+        }
+
+
+def format_report(report: dict) -> str:
+    lines = [f'{"операция":<14}{"всего":>9}{"ошибок":>8}{"p50 мс":>10}{"p90 мс":>10}{"p99 мс":>10}{"max мс":>10}']
+    for op, row in report['operations'].items():
+        lines.append(
+            f'{op:<14}{row["count"]:>9}{row["errors"]:>8}{row["p50_ms"]:>10.3f}'
+            f'{row["p90_ms"]:>10.3f}{row["p99_ms"]:>10.3f}{row["max_ms"]:>10.3f}'
+        )
+    lines.append(f'Всего {report["total"]} операций за {report["elapsed_s"]:.1f} с, '
+                 f'{report["throughput"]:.1f} оп/с')
+    lines.append('По секундам: ' + ' '.join(map(str, report['timeline'])))
+    return '\n'.join(lines)
+
+
+class Recorder:
+    """
+    Запись выполненных операций в формате журнала изменений:
+    JSON строка {'seq', 'op', 'ts', 'data'} на операцию.
+    Такой файл, как и сам журнал changes/, можно проиграть через replay.
+    """
+    def __init__(self, path: str) -> None:
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.lock = threading.Lock()
+        self.seq = 0
+
+    def write(self, op: str, data: dict) -> None:
+        with self.lock:
+            self.seq += 1
+            event = {'seq': self.seq, 'op': op, 'ts': time.time(), 'data': data}
+            self.file.write(json.dumps(event, separators=(',', ':'), ensure_ascii=False) + '\n')
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class Target:
+    """
+    Куда идут операции: CarService в этом процессе или сервер по URL.
+    Чтения локального сервиса идут под его блокировкой, как в сервере,
+    чтобы не прочитать индекс посреди перезаписи.
+    """
+    def __init__(self, service) -> None:
+        self.service = service
+        self.lock = service.lock if isinstance(service, CarService) else None
+
+    def call(self, op: str, *args):
+        if self.lock is None:
+            return getattr(self.service, op)(*args)
+        with self.lock:
+            return getattr(self.service, op)(*args)
+
+
+class Worker:
+    """
+    Поток нагрузки. Каждый поток работает только со своими машинами
+    (VIN начинается с зерна и номера потока), поэтому потокам и процессам
+    не нужно договариваться, а продаются, отменяются и переименовываются
+    только машины в подходящем состоянии.
+    """
+    def __init__(self, number: int, target: Target, mix: dict, seed: int,
+                 recorder: Recorder | None = None) -> None:
+        self.number = number
+        self.target = target
+        self.seed = seed
+        self.rnd = random.Random(seed * 1000 + number)
+        self.ops = [op for op in OPERATIONS if mix.get(op, 0) > 0]
+        self.weights = [mix[op] for op in self.ops]
+        self.recorder = recorder
+        self.counter = 0
+        self.available = list()
+        # Проданные машины: пары (VIN, номер продажи).
+        self.sold = list()
+
+    def new_vin(self) -> str:
+        self.counter += 1
+        # Зерно в VIN: повторный запуск с другим зерном не пересекается с прошлым.
+        return f'{self.seed % 1000:03d}{self.number:03d}{self.counter:011d}'
+
+    def pick(self) -> str:
+        op = self.rnd.choices(self.ops, self.weights)[0]
+        # Пока нечего продавать или отменять, добавляем машины.
+        if op in ('sell_car', 'update_vin') and not self.available:
+            return 'add_car'
+        if op == 'revert_sale' and not self.sold:
+            return 'add_car'
+        return op
+
+    def execute(self, op: str, data: dict, *args):
+        result = self.target.call(op, *args)
+        if self.recorder is not None:
+            self.recorder.write(op, data)
+        return result
+
+    def run_op(self, op: str) -> None:
+        rnd = self.rnd
+        if op == 'add_car':
+            car = Car(
+                vin=self.new_vin(),
+                model=rnd.choice(LOAD_MODELS).id,
+                price=Decimal(rnd.randrange(100000, 10000000)) / 100,
+                date_start=datetime(2024, 1, 1) + timedelta(minutes=rnd.randrange(525600)),
+                status=CarStatus.available,
+            )
+            self.execute(op, car.model_dump(mode='json'), car)
+            self.available.append(car.vin)
+        elif op == 'sell_car':
+            i = rnd.randrange(len(self.available))
+            vin = self.available[i]
+            date = datetime(2024, 1, 1) + timedelta(minutes=rnd.randrange(525600))
+            sale = Sale(
+                sales_number=f'{date:%Y%m%d}#{vin}',
+                car_vin=vin,
+                sales_date=date,
+                cost=Decimal(rnd.randrange(100000, 10000000)) / 100,
+            )
+            self.execute(op, sale.model_dump(mode='json'), sale)
+            self.available[i] = self.available[-1]
+            self.available.pop()
+            self.sold.append((vin, sale.sales_number))
+        elif op == 'revert_sale':
+            i = rnd.randrange(len(self.sold))
+            vin, sales_number = self.sold[i]
+            self.execute(op, {'sales_number': sales_number}, sales_number)
+            self.sold[i] = self.sold[-1]
+            self.sold.pop()
+            self.available.append(vin)
+        elif op == 'update_vin':
+            # Переименовываем только непроданные машины:
+            # номер продажи содержит VIN и после переименования потерялся бы.
+            i = rnd.randrange(len(self.available))
+            vin, new_vin = self.available[i], self.new_vin()
+            self.execute(op, {'vin': vin, 'new_vin': new_vin}, vin, new_vin)
+            self.available[i] = new_vin
+        elif op == 'get_cars':
+            status = CarStatus.available if rnd.random() < 0.8 else CarStatus.sold
+            self.execute(op, {'status': str(status)}, status)
+        elif op == 'get_car_info':
+            known = len(self.available) + len(self.sold)
+            i = rnd.randrange(known) if known else -1
+            if i < 0:
+                vin = 'UNKNOWN0000000000'
+            elif i < len(self.available):
+                vin = self.available[i]
+            else:
+                vin = self.sold[i - len(self.available)][0]
+            self.execute(op, {'vin': vin}, vin)
+
+    def run(self, start: float, rate: float, duration: float | None, ops: int | None) -> LoadStats:
+        """
+        Функция выполняет операции с заданной частотой.
+        Задержка считается от запланированного момента операции,
+        поэтому отставание от расписания тоже попадает в задержку.
+
+        Args:
+            start(float): Общее время старта (time.time()) для ряда по секундам.
+            rate(float): Операций в секунду для этого потока, 0 - без ограничения.
+            duration(float): Сколько секунд работать.
+            ops(int): Сколько операций выполнить.
+        Returns:
+            LoadStats: Результаты потока.
+        """
+        stats = LoadStats()
+        interval = 1 / rate if rate else 0.0
+        began = time.perf_counter()
+        next_at = began
+        done = 0
+        while (ops is None or done < ops) and (duration is None or time.perf_counter() - began < duration):
+            if interval:
+                now = time.perf_counter()
+                if next_at > now:
+                    time.sleep(next_at - now)
+                intended = next_at
+                next_at += interval
+            else:
+                intended = time.perf_counter()
+            op = self.pick()
+            error = False
+            try:
+                self.run_op(op)
+            except Exception:
+                error = True
+            stats.record(op, int((time.perf_counter() - intended) * 1e9), int(time.time() - start), error)
+            done += 1
+        return stats
+
+
+def _process_worker(number: int, url: str, mix: dict, seed: int, start: float, rate: float,
+                    duration: float | None, ops: int | None) -> LoadStats:
+    # Процессу нужен свой клиент: соединение нельзя передать между процессами.
+    client = CarServiceClient(url)
+    try:
+        return Worker(number, Target(client), mix, seed).run(start, rate, duration, ops)
+    finally:
+        client.close()
+
+
+def setup_models(target: Target, recorder: Recorder | None = None) -> None:
+    """
+    Функция добавляет модели нагрузки, которых ещё нет в хранилище.
+    У клиента нет чтения моделей, поэтому через сервер они добавляются всегда.
+    """
+    service = target.service
+    for model in LOAD_MODELS:
+        if isinstance(service, CarService) and service.get_model(model.id) is not None:
+            continue
+        target.call('add_model', model)
+        if recorder is not None:
+            recorder.write('add_model', model.model_dump(mode='json'))
+
+
+def run_load(root: str | None = None, url: str | None = None, mix: dict | None = None,
+             rate: float = 0.0, duration: float | None = None, ops: int | None = None,
+             workers: int = 4, mode: str = 'threads', seed: int = 1,
+             record: str | None = None, index_backend: str | None = None) -> dict:
+    """
+    Функция запускает нагрузку и возвращает отчёт.
+
+    Args:
+        root(str): Директория хранилища для работы без сервера.
+        url(str): Адрес сервера, если нагрузка идёт через HTTP.
+        mix(dict): Доли операций.
+        rate(float): Общая частота операций в секунду, 0 - без ограничения.
+        duration(float): Сколько секунд работать.
+        ops(int): Сколько операций выполнить всего.
+        workers(int): Количество потоков или процессов.
+        mode(str): 'threads' или 'processes'. Процессы работают только через сервер.
+        seed(int): Зерно генератора, одинаковое зерно даёт одинаковую нагрузку.
+        record(str): Файл для записи выполненных операций.
+        index_backend(str): Движок индексов, None - сохранённый в хранилище.
+    Returns:
+        dict: Отчёт LoadStats.report.
+    """
+    mix = mix or DEFAULT_MIX
+    if mode not in ('threads', 'processes'):
+        raise ValueError(f'Неизвестный режим: {mode}')
+    if mode == 'processes' and (url is None or record):
+        # Процессы не могут делить CarService и общий файл записи.
+        raise ValueError('Режим processes работает только через --url и без --record')
+    if duration is None and ops is None:
+        raise ValueError('Нужно задать duration или ops')
+
+    per_rate = rate / workers if rate else 0.0
+    per_ops = math.ceil(ops / workers) if ops is not None else None
+    recorder = Recorder(record) if record else None
+    service = CarServiceClient(url) if url else CarService(root, index_backend=index_backend)
+    setup_models(Target(service), recorder)
+
+    stats = LoadStats()
+    start = time.time()
+    began = time.perf_counter()
+    try:
+        if mode == 'processes':
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(_process_worker, number, url, mix, seed, start, per_rate, duration, per_ops)
+                    for number in range(workers)
+                ]
+                for future in futures:
+                    stats.merge(future.result())
+        else:
+            clients = [CarServiceClient(url) if url else service for _ in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futures = [
+                    pool.submit(Worker(number, Target(client), mix, seed, recorder).run,
+                                start, per_rate, duration, per_ops)
+                    for number, client in enumerate(clients)
+                ]
+                for future in futures:
+                    stats.merge(future.result())
+            if url:
+                for client in clients:
+                    client.close()
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if url:
+            service.close()
+    return stats.report(time.perf_counter() - began)
+
+
+def read_events(path: str):
+    """
+    Генератор читает записанные операции: файл Recorder
+    или директорию журнала изменений changes/ с сегментами *.log.
+
+    Args:
+        path(str): Файл или директория.
+    Yields:
+        dict: Событие {'seq', 'op', 'ts', 'data'}.
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.log')]
+    else:
+        paths = [path]
+    for file_path in paths:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def event_call(op: str, data: dict) -> tuple | None:
+    """
+    Функция превращает событие в имя метода CarService и его аргументы.
+
+    Returns:
+        tuple: Имя метода и аргументы.
+        None: Если операцию нельзя проиграть (например, import_snapshot).
+    """
+    if op == 'get_car_info':
+        return op, (data['vin'],)
+    if op == 'get_cars':
+        return op, (CarStatus(data['status']),)
+    if op == 'import_snapshot':
+        # Файла снапшота при проигрывании может уже не быть.
+        return None
+    return mutation_call(op, data)
+
+
+def replay(events, root: str | None = None, url: str | None = None, speed: float = 0.0,
+           index_backend: str | None = None) -> dict:
+    """
+    Функция проигрывает записанные операции по порядку в одном потоке.
+
+    Args:
+        events: Итератор событий read_events.
+        root(str): Директория хранилища.
+        url(str): Адрес сервера.
+        speed(float): Во сколько раз быстрее записи проигрывать, 0 - без пауз.
+        index_backend(str): Движок индексов, None - сохранённый в хранилище.
+    Returns:
+        dict: Отчёт LoadStats.report.
+    """
+    service = CarServiceClient(url) if url else CarService(root, index_backend=index_backend)
+    target = Target(service)
+    stats = LoadStats()
+    start = time.time()
+    began = time.perf_counter()
+    first_ts = None
+    for event in events:
+        call = event_call(event['op'], event['data'])
+        if call is None:
+            continue
+        if speed and 'ts' in event:
+            if first_ts is None:
+                first_ts = event['ts']
+            delay = began + (event['ts'] - first_ts) / speed - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        op, args = call
+        intended = time.perf_counter()
+        error = False
+        try:
+            target.call(op, *args)
+        except Exception:
+            error = True
+        stats.record(op, int((time.perf_counter() - intended) * 1e9), int(time.time() - start), error)
+    if url:
+        service.close()
+    return stats.report(time.perf_counter() - began)
+
+
+def _numbered_rows(path: str, archive: str | None = None):
+    # Живые строки файла вместе с номерами строк.
+    try:
+        f = lzma.open(archive, 'rb') if archive else open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        number = 0
+        while line := f.read(LINE_SIZE):
+            row = line.decode('utf-8').strip()
+            if row and row != 'is_deleted':
+                yield number, row.split(';')
+            number += 1
+
+
+def _compare_index(name: str, rows: list, index, problems: list) -> None:
+    expected = Counter(rows)
+    actual = Counter(index.items())
+    missing = expected - actual
+    stale = actual - expected
+    if missing:
+        problems.append(f'{name}: {sum(missing.values())} строк нет в индексе, например {next(iter(missing))}')
+    if stale:
+        problems.append(f'{name}: {sum(stale.values())} лишних записей индекса, например {next(iter(stale))}')
+
+
+def check_invariants(root: str, index_backend: str | None = None) -> list[str]:
+    """
+    Функция проверяет согласованность хранилища после нагрузки:
+    индексы совпадают с данными, у каждой проданной машины
+    ровно одна живая продажа, у непроданной - ни одной,
+    а счётчики склада совпадают с пересчётом.
+
+    Args:
+        root(str): Директория хранилища.
+        index_backend(str): Движок индексов, None - сохранённый в хранилище.
+    Returns:
+        list[str]: Найденные нарушения, пустой список - всё согласовано.
+    """
+    service = CarService(root, change_feed=False, index_backend=index_backend)
+    problems = list()
+
+    for table in ('models', 'cars'):
+        rows = [(fields[0], number) for number, fields in _numbered_rows(service.paths[TABLES[table][0]])]
+        _compare_index(table, rows, service.index(table), problems)
+
+    cars = {fields[0]: fields[-1] for _, fields in _numbered_rows(service.paths['cars.txt'])}
+    live_sales = Counter()
+    for partition in service.sale_partitions():
+        archive = partition.path_archive if partition.archived else None
+        rows = list()
+        for number, fields in _numbered_rows(partition.path_txt, archive):
+            rows.append((fields[0], number))
+            live_sales[fields[1]] += 1
+        _compare_index(partition.name or 'sales', rows, partition.index, problems)
+
+    for vin, status in cars.items():
+        expected = 1 if status == CarStatus.sold else 0
+        if live_sales[vin] != expected:
+            problems.append(f'{vin}: статус {status}, живых продаж {live_sales[vin]}')
+    for vin in live_sales.keys() - cars.keys():
+        problems.append(f'{vin}: продажа машины, которой нет в cars.txt')
+
+    # Счётчики склада должны совпасть с полным пересчётом. Возраст зависит от текущего времени.
+    counted = service.stats()
+    recounted = service.stats(recompute=True)
+    for key in counted.keys() - {'average_age_days'}:
+        if counted[key] != recounted[key]:
+            problems.append(f'stats {key}: счётчики {counted[key]}, пересчёт {recounted[key]}')
+    return problems
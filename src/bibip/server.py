@@ -0,0 +1,262 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydantic import BaseModel, ValidationError
+from bibip_car_service import CarService
+from auxiliary_functions.profiling import Profiler
+from models import Car, CarStatus, Model, Sale
+from my_exceptions import CarNotFoundError, InvalidCharacterStr
+
+# Операции, которые меняют хранилище и проходят через очередь записи.
+WRITE_OPERATIONS = ('add_model', 'add_car', 'sell_car', 'update_vin', 'revert_sale')
+READ_OPERATIONS = ('get_cars', 'get_car_info', 'get_car_infos', 'top_models_by_sales', 'sales_between')
+
+# Операции, которые можно склеить в одну пакетную запись.
+BATCH_METHODS = {'add_model': 'add_models', 'add_car': 'add_cars'}
+
+
+def parse_args(op: str, body: dict) -> tuple:
+    """
+    Функция превращает JSON тело запроса в аргументы метода CarService.
+
+    Args:
+        op(str): Имя операции.
+        body(dict): Тело запроса.
+    Returns:
+        tuple: Аргументы метода.
+    """
+    if op == 'add_model':
+        return (Model(**body['model']),)
+    if op == 'add_car':
+        return (Car(**body['car']),)
+    if op == 'sell_car':
+        return (Sale(**body['sale']),)
+    if op == 'get_cars':
+        return (CarStatus(body['status']),)
+    if op == 'get_car_info':
+        return (body['vin'],)
+    if op == 'get_car_infos':
+        return (list(body['vins']),)
+    if op == 'update_vin':
+        return (body['vin'], body['new_vin'])
+    if op == 'revert_sale':
+        return (body['sales_number'],)
+    if op == 'top_models_by_sales':
+        # Границы периода необязательны.
+        return tuple(
+            datetime.fromisoformat(body[name]) if body.get(name) else None
+            for name in ('since', 'until')
+        )
+    if op == 'sales_between':
+        return (datetime.fromisoformat(body['start']), datetime.fromisoformat(body['end']))
+    return tuple()
+
+
+def dump_result(result):
+    """
+    Функция превращает результат метода CarService в JSON совместимое значение.
+    """
+    if isinstance(result, BaseModel):
+        return result.model_dump(mode='json')
+    if isinstance(result, list):
+        return [dump_result(item) for item in result]
+    return result
+
+
+class BatchingWriter:
+    """
+    Поток записи, через который проходят все изменяющие операции.
+
+    Запросы, пришедшие одновременно, забираются из очереди пачкой.
+    Подряд идущие add_car и add_model склеиваются в один вызов
+    add_cars / add_models, то есть в одну перезапись индекса.
+    """
+    def __init__(self, service: CarService, max_batch: int = 256, batch_window: float = 0.0) -> None:
+        self.service = service
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.coalesced = 0
+        self.thread = threading.Thread(target=self.run, name='bibip-writer', daemon=True)
+        self.thread.start()
+
+    def submit(self, op: str, args: tuple) -> Future:
+        future = Future()
+        self.queue.put((op, args, future))
+        return future
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+
+    def collect(self, first) -> list:
+        """
+        Функция забирает из очереди все уже пришедшие запросы,
+        при заданном окне ещё немного ждёт новых.
+        """
+        batch = [first]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Сигнал остановки возвращаем в очередь.
+                self.queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def run(self) -> None:
+        while (item := self.queue.get()) is not None:
+            batch = self.collect(item)
+            i = 0
+            while i < len(batch):
+                op = batch[i][0]
+                j = i + 1
+                if op in BATCH_METHODS:
+                    while j < len(batch) and batch[j][0] == op:
+                        j += 1
+                self.execute(batch[i:j])
+                i = j
+
+    def execute(self, group: list) -> None:
+        op = group[0][0]
+        self.batches += 1
+        if len(group) > 1:
+            try:
+                method = getattr(self.service, BATCH_METHODS[op])
+                results = method([args[0] for _, args, _ in group])
+                self.coalesced += len(group)
+                for (_, _, future), result in zip(group, results):
+                    future.set_result(result)
+                return
+            except InvalidCharacterStr:
+                # Символы пачки проверяются до записи, поэтому выполняем
+                # запросы по одному и отдаём ошибку только виновнику.
+                pass
+            except Exception as e:
+                # Часть пачки могла уже записаться: повтор по одному записал бы её дважды.
+                for _, _, future in group:
+                    future.set_exception(e)
+                return
+
+        for op, args, future in group:
+            try:
+                future.set_result(getattr(self.service, op)(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class CarServiceServer(ThreadingHTTPServer):
+    """
+    HTTP сервер, владеющий одним CarService.
+    Чтения выполняются под блокировкой хранилища, чтобы не увидеть
+    индекс файл посреди перезаписи, записи идут через BatchingWriter.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: tuple, service: CarService, max_batch: int = 256,
+                 batch_window: float = 0.0) -> None:
+        super().__init__(address, RequestHandler)
+        self.service = service
+        self.writer = BatchingWriter(service, max_batch, batch_window)
+
+    def call(self, op: str, args: tuple):
+        if op in WRITE_OPERATIONS:
+            return self.writer.submit(op, args).result()
+        with self.service.lock:
+            return getattr(self.service, op)(*args)
+
+    def server_close(self) -> None:
+        self.writer.close()
+        super().server_close()
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями: без TCP_NODELAY
+    # на keep-alive соединении каждый ответ ждёт отложенный ACK клиента.
+    disable_nagle_algorithm = True
+
+    def send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status: int, e: Exception) -> None:
+        self.send_json(status, {'error': {'type': type(e).__name__, 'message': str(e)}})
+
+    def do_GET(self) -> None:
+        if self.path == '/health':
+            writer = self.server.writer
+            self.send_json(200, {'status': 'ok', 'batches': writer.batches, 'coalesced': writer.coalesced})
+        else:
+            self.send_json(404, {'error': {'type': 'NotFound', 'message': self.path}})
+
+    def do_POST(self) -> None:
+        op = self.path.strip('/')
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b'{}'
+        if op not in WRITE_OPERATIONS + READ_OPERATIONS:
+            self.send_json(404, {'error': {'type': 'NotFound', 'message': self.path}})
+            return
+        try:
+            args = parse_args(op, json.loads(raw or b'{}'))
+            result = self.server.call(op, args)
+        except CarNotFoundError as e:
+            self.send_error_json(404, e)
+        except (InvalidCharacterStr, ValidationError, KeyError, ValueError) as e:
+            self.send_error_json(400, e)
+        except Exception as e:
+            self.send_error_json(500, e)
+        else:
+            self.send_json(200, {'result': dump_result(result)})
+
+    def log_message(self, format: str, *args) -> None:
+        # Не печатаем каждый запрос.
+        pass
+
+
+def serve(root_directory_path: str, host: str = '127.0.0.1', port: int = 8080,
+          max_batch: int = 256, batch_window: float = 0.0, profile_rate: float = 0.0,
+          profile_out: str | None = None, index_backend: str | None = None) -> None:
+    """
+    Функция запускает сервер и обслуживает запросы до остановки.
+
+    Args:
+        root_directory_path(str): Директория хранилища.
+        host(str): Адрес.
+        port(int): Порт.
+        max_batch(int): Максимум записей в одной пачке.
+        batch_window(float): Сколько секунд ждать попутные записи.
+        profile_rate(float): Доля профилируемых вызовов, 0 - без профилирования.
+        profile_out(str): Куда записать профиль при остановке:
+            '.json' - Chrome trace, иначе свёрнутые стеки.
+        index_backend(str): Движок индексов, None - сохранённый в хранилище.
+    """
+    profiler = Profiler(profile_rate) if profile_rate > 0 else None
+    service = CarService(root_directory_path, index_backend=index_backend, profiler=profiler)
+    server = CarServiceServer((host, port), service, max_batch, batch_window)
+    print(f'bibip слушает http://{host}:{server.server_address[1]}, хранилище {root_directory_path}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if profiler is not None and profile_out:
+            if profile_out.endswith('.json'):
+                profiler.write_chrome_trace(profile_out)
+            else:
+                profiler.write_folded(profile_out)
@@ -1,13 +1,59 @@
-from datetime import datetime as dt
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from datetime import datetime
 from decimal import Decimal
+from functools import wraps
 from constants import LINE_SIZE
 from models import Car, CarFullInfo, CarStatus, Model, ModelSaleStats, Sale
-from my_exceptions import InvalidCharacterStr, CarNotFoundError
+from my_exceptions import InvalidCharacterStr, CarNotFoundError, IndexBackendMismatchError, SnapshotFormatError
 from auxiliary_functions import functions as fn
+from auxiliary_functions import snapshot as snap
+from auxiliary_functions.bloom import BloomFilter
+from auxiliary_functions.change_feed import ChangeFeed
+from auxiliary_functions.indexes import (
+    INDEX_BACKEND_FILE, INDEX_BACKENDS, open_index, read_index_backend, write_index_backend
+)
+from auxiliary_functions.inventory_stats import STATS_FILE, InventoryStats
+from auxiliary_functions.profiling import Profiler, profiled, span, traced
+from auxiliary_functions.sales_partitions import SalesPartition, SalesPartitions, month_of
+
+# Таблицы хранилища: имя таблицы -> (файл данных, индекс файл).
+TABLES = {
+    'models': ('models.txt', 'models_index.txt'),
+    'cars': ('cars.txt', 'cars_index.txt'),
+    'sales': ('sales.txt', 'sales_index.txt'),
+}
+
+# Если проданных машин больше, чем одна на столько строк cars.txt,
+# модели берутся одним проходом по файлу, а не поиском по индексу.
+SCAN_RATIO = 32
+
+
+def locked(method):
+    """
+    Декоратор выполняет метод сервиса под блокировкой хранилища,
+    чтобы изменения файлов не перемежались между потоками.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
 
 
 class CarService:
-    def __init__(self, root_directory_path: str) -> None:
+    def __init__(
+        self,
+        root_directory_path: str,
+        bloom_fp_rate: float = 0.01,
+        change_feed: bool = True,
+        index_backend: str | None = None,
+        sales_partitions: bool = False,
+        profiler: Profiler | None = None
+    ) -> None:
         self.root_directory_path = root_directory_path
         # Создаем переменные пути для работы с файлами.
         self.paths = {
@@ -16,10 +62,355 @@ class CarService:
             'models.txt': f'{self.root_directory_path}/models.txt',
             'models_index.txt': f'{self.root_directory_path}/models_index.txt',
             'sales.txt': f'{self.root_directory_path}/sales.txt',
-            'sales_index.txt': f'{self.root_directory_path}/sales_index.txt'
+            'sales_index.txt': f'{self.root_directory_path}/sales_index.txt',
+            'models_index.bloom': f'{self.root_directory_path}/models_index.bloom',
+            'cars_index.bloom': f'{self.root_directory_path}/cars_index.bloom',
+            'sales_index.bloom': f'{self.root_directory_path}/sales_index.bloom',
+            'stats.json': f'{self.root_directory_path}/{STATS_FILE}'
         }
+        # Блокировка для изменяющих операций и снятия снапшота.
+        self.lock = threading.RLock()
+        # Движок индексов: 'text' (старые *_index.txt) или 'btree'.
+        # Он хранится в index_backend.txt, без явного движка берётся сохранённый.
+        self.index_backend, self.index_backend_saved = self.resolve_index_backend(index_backend)
+        self.indexes = dict()
+        # Фильтры Блума по индексам создаются при первом обращении.
+        self.bloom_fp_rate = bloom_fp_rate
+        self.blooms = dict()
+        # Таблица моделей в памяти: загружается при первом обращении.
+        self.models_cache = None
+        self.models_state = None
+        # Кеш get_cars: {статус: {номер строки: Car}} и готовые списки по статусам.
+        # Записи этого экземпляра обновляют его построчно.
+        self.cars_cache = None
+        self.cars_lists = dict()
+        self.cars_state = None
+        # Счётчики склада для stats(), меняются вместе с каждой записью.
+        self.counters = InventoryStats(self.paths['stats.json'])
+        # Журнал изменений для потребителей (поиск, BI).
+        self.feed = ChangeFeed(f'{self.root_directory_path}/changes') if change_feed else None
+        # Продажи по месячным партициям вместо одного sales.txt.
+        # Хранилище, в котором партиции уже есть, открывается в этом режиме и без флага.
+        partitions = SalesPartitions(f'{self.root_directory_path}/sales', self.index_backend)
+        self.partitions = partitions if sales_partitions or partitions.exists() else None
+        if sales_partitions and not partitions.exists() and os.path.exists(self.paths['sales.txt']):
+            self.migrate_sales()
+        # Профилировщик вызовов, по умолчанию выключен.
+        self.profiler = profiler
+
+    def migrate_sales(self) -> int:
+        """
+        Функция переводит старое хранилище на месячные партиции:
+        продажи из sales.txt переносятся в партиции, а sales.txt
+        и его индекс удаляются.
+
+        Returns:
+            int: Количество перенесённых продаж.
+        """
+        with self.lock:
+            try:
+                count = self.partitions.migrate(self.paths['sales.txt'])
+                for path in (
+                    self.paths['sales.txt'], self.paths['sales_index.txt'], self.paths['sales_index.bloom'],
+                    self.paths['sales_index.txt'].replace('.txt', '.snap'),
+                    self.paths['sales_index.txt'].replace('.txt', '.btree'),
+                ):
+                    if os.path.exists(path):
+                        os.remove(path)
+            except Exception as e:
+                print(f'Ошибка переноса продаж в партиции: {e}')
+                raise
+        return count
+
+    def resolve_index_backend(self, index_backend: str | None) -> tuple:
+        """
+        Функция выбирает движок индексов по сохранённому в хранилище.
+        Хранилище с текстовыми индексами можно перевести на B+ дерево:
+        деревья строятся заново по текстовым индексам. Обратно нельзя,
+        текстовые индексы после этого не обновляются.
+
+        Args:
+            index_backend(str): Запрошенный движок или None.
+        Returns:
+            tuple: Движок и признак того, что он уже записан в хранилище.
+        """
+        if index_backend is not None and index_backend not in INDEX_BACKENDS:
+            raise ValueError(f'Неизвестный движок индекса: {index_backend}')
+        stored = read_index_backend(self.root_directory_path)
+        if stored is None or index_backend is None or index_backend == stored:
+            backend = stored or index_backend or 'text'
+            saved = os.path.exists(os.path.join(self.root_directory_path, INDEX_BACKEND_FILE))
+            return backend, saved and backend == stored
+        if stored == 'btree':
+            raise IndexBackendMismatchError
+        # Старые деревья могли отстать от текстовых индексов, строим их заново.
+        for directory in (self.root_directory_path, f'{self.root_directory_path}/sales'):
+            for name in os.listdir(directory) if os.path.isdir(directory) else ():
+                if name.endswith('.btree'):
+                    os.remove(os.path.join(directory, name))
+        write_index_backend(self.root_directory_path, index_backend)
+        return index_backend, True
+
+    def index(self, table: str):
+        """
+        Функция возвращает индекс таблицы выбранного движка.
+
+        Args:
+            table(str): Имя таблицы: 'models', 'cars' или 'sales'.
+        Returns:
+            TextIndex | BTreeIndex: Индекс таблицы.
+        """
+        if not self.index_backend_saved and os.path.isdir(self.root_directory_path):
+            # Хранилище создано без директории, движок записываем при первом обращении.
+            write_index_backend(self.root_directory_path, self.index_backend)
+            self.index_backend_saved = True
+        if table not in self.indexes:
+            self.indexes[table] = open_index(self.index_backend, self.paths[TABLES[table][1]])
+        return self.indexes[table]
+
+    def bloom(self, table: str) -> BloomFilter:
+        """
+        Функция возвращает фильтр Блума для индекса таблицы.
+
+        Args:
+            table(str): Имя таблицы: 'models', 'cars' или 'sales'.
+        Returns:
+            BloomFilter: Фильтр по ключам индекса.
+        """
+        if table not in self.blooms:
+            file_index = TABLES[table][1]
+            self.blooms[table] = BloomFilter(
+                self.paths[file_index.replace('.txt', '.bloom')],
+                self.index(table),
+                self.bloom_fp_rate
+            )
+        return self.blooms[table]
+
+    def inventory(self) -> InventoryStats:
+        """
+        Функция возвращает счётчики склада.
+        Счётчики перечитываются, если stats.json изменил другой процесс,
+        и считаются заново, если файла ещё нет (хранилище создано до счётчиков).
+        Записи берут счётчики до изменения файлов, чтобы пересчёт не учёл запись дважды.
+
+        Returns:
+            InventoryStats: Счётчики.
+        """
+        if self.counters.stale() and not self.counters.load():
+            self.counters = self.recount_inventory()
+            self.counters.save()
+        return self.counters
+
+    @profiled
+    def recount_inventory(self) -> InventoryStats:
+        """
+        Функция заново считает счётчики склада полным проходом по машинам и продажам.
+        Считает в новый экземпляр: текущие счётчики и stats.json не меняются.
+
+        Returns:
+            InventoryStats: Пересчитанные и не сохранённые счётчики.
+        """
+        counters = InventoryStats(self.paths['stats.json'])
+        for _, car_info in fn.scan_rows(self.paths['cars.txt']):
+            counters.car_added(car_info)
+        for partition in self.sale_partitions():
+            for _, sale_info in partition.scan_rows():
+                counters.sale_added(sale_info)
+        return counters
+
+    @profiled
+    def find_line(self, table: str, key: str) -> int | None:
+        """
+        Функция ищет номер строки по ключу таблицы.
+        Если фильтр Блума говорит, что ключа нет, индекс не читается.
+
+        Args:
+            table(str): Имя таблицы.
+            key(str): Искомый ключ.
+        Returns:
+            int: Номер строки.
+            None: Если ничего не найдено.
+        """
+        if not self.bloom(table).might_contain(key):
+            return None
+        return self.index(table).find(key)
+
+    @profiled
+    def models(self) -> dict:
+        """
+        Функция возвращает таблицу моделей, загруженную в память.
+        models.txt маленький, поэтому он читается целиком при первом обращении
+        и заново, только если файл изменили в обход этого экземпляра.
+        Названия и бренды интернируются, чтобы повторяющиеся строки
+        были общими во всех результатах.
+
+        Returns:
+            dict: Словарь {id модели: Model}.
+        """
+        state = fn.file_state(self.paths['models.txt'])
+        if self.models_cache is None or state != self.models_state:
+            models = dict()
+            for row in fn.iter_rows(self.paths['models.txt']):
+                list_model = row.split(';')
+                # Как и поиск по индексу, берем первую модель с таким id.
+                models.setdefault(int(list_model[0]), Model(
+                    id=int(list_model[0]),
+                    name=sys.intern(list_model[1]),
+                    brand=sys.intern(list_model[2])
+                ))
+            self.models_cache = models
+            self.models_state = state
+        return self.models_cache
+
+    def get_model(self, model_id: str | int) -> Model | None:
+        """
+        Функция возвращает модель по id из таблицы в памяти.
+
+        Args:
+            model_id(str | int): Id модели.
+        Returns:
+            Model: Модель.
+            None: Если модели нет.
+        """
+        return self.models().get(int(model_id))
+
+    def remember_models(self, models: list[Model], state: tuple | None) -> None:
+        """
+        Функция добавляет только что записанные модели в таблицу в памяти.
+
+        Args:
+            models(list[Model]): Записанные модели.
+            state(tuple): Состояние models.txt до записи.
+        """
+        if self.models_cache is None or self.models_state is None or state != self.models_state:
+            # Таблица ещё не загружена или файл до записи менял кто-то другой:
+            # её прочитают заново при первом обращении.
+            self.models_cache = None
+            return
+        for model in models:
+            self.models_cache.setdefault(model.id, Model(
+                id=model.id,
+                name=sys.intern(model.name),
+                brand=sys.intern(model.brand)
+            ))
+        self.models_state = fn.file_state(self.paths['models.txt'])
+
+    def car_from_row(self, car_info: list) -> Car:
+        """
+        Функция создает обьект машины из строки cars.txt.
+        """
+        return Car(
+            vin=car_info[0],
+            model=int(car_info[1]),
+            price=Decimal(car_info[2]),
+            date_start=fn.decode_datetime(car_info[3]),
+            status=CarStatus(car_info[4])
+        )
+
+    @profiled
+    def cars_by_status(self, status: CarStatus) -> dict:
+        """
+        Функция возвращает машины с нужным статусом из кеша.
+        Статусы загружаются по мере запросов: cars.txt просматривается
+        побайтово, и в Car разбираются только строки с этим статусом.
+        cars.txt читается заново, только если его изменили в обход этого экземпляра.
+
+        Args:
+            status(CarStatus): Искомый статус.
+        Returns:
+            dict: Словарь {номер строки: Car}.
+        """
+        state = fn.file_state(self.paths['cars.txt'])
+        if self.cars_cache is None or state != self.cars_state:
+            self.cars_cache = dict()
+            self.cars_lists = dict()
+            self.cars_state = state
+        if status not in self.cars_cache:
+            # Если такого файла не существует, произойдет исключение.
+            self.cars_cache[status] = {
+                number: self.car_from_row(car_info)
+                for number, car_info in fn.scan_status(self.paths['cars.txt'], status)
+            }
+        return self.cars_cache[status]
+
+    def patch_cars(self, changes: dict, state: tuple | None) -> None:
+        """
+        Функция обновляет кеш get_cars после записи в cars.txt.
+
+        Args:
+            changes(dict): Словарь {номер строки: новая строка списком или None, если строка удалена}.
+            state(tuple): Состояние cars.txt до записи.
+        """
+        if self.cars_cache is None:
+            return
+        if state != self.cars_state:
+            # До записи cars.txt менял кто-то другой, кеш устарел.
+            self.cars_cache = None
+            self.cars_lists = dict()
+            return
+        for number, car_info in changes.items():
+            for status, cars in self.cars_cache.items():
+                if cars.pop(number, None) is not None:
+                    self.cars_lists.pop(status, None)
+            # Незагруженные статусы прочитаются из файла при первом запросе.
+            if car_info is not None and car_info[-1] in self.cars_cache:
+                car = self.car_from_row(car_info)
+                self.cars_cache[car.status][number] = car
+                self.cars_lists.pop(car.status, None)
+        self.cars_state = fn.file_state(self.paths['cars.txt'])
+
+    def sale_partitions(self, since: datetime | None = None, until: datetime | None = None) -> list:
+        """
+        Функция возвращает файлы продаж, в которых могут быть продажи за период [since, until).
+        Без партиций это всегда один sales.txt.
+
+        Args:
+            since(datetime): Начало периода, включительно.
+            until(datetime): Конец периода, не включительно.
+        Returns:
+            list[SalesPartition]: Файлы продаж от старых к новым.
+        """
+        if self.partitions is None:
+            return [SalesPartition(None, self.paths['sales.txt'], self.index('sales'))]
+        return self.partitions.partitions(since, until)
+
+    @profiled
+    def find_sale(self, sales_number: str) -> tuple | None:
+        """
+        Функция ищет продажу по номеру.
+
+        Args:
+            sales_number(str): Номер продажи.
+        Returns:
+            tuple: Файл продаж (SalesPartition) и номер строки в нём.
+            None: Если ничего не найдено.
+        """
+        if self.partitions is not None:
+            return self.partitions.find(sales_number)
+        line = self.find_line('sales', sales_number)
+        return None if line is None else (self.sale_partitions()[0], line)
+
+    @profiled
+    def find_sale_by_vin(self, vin: str) -> tuple | None:
+        """
+        Функция ищет продажу по VIN машины.
+        Ключ продажи имеет вид 'дата#VIN', поэтому просматриваются все ключи.
+
+        Args:
+            vin(str): VIN проданной машины.
+        Returns:
+            tuple: Файл продаж (SalesPartition) и номер строки в нём.
+            None: Если ничего не найдено.
+        """
+        for partition in reversed(self.sale_partitions()):
+            for key, line in partition.index.items():
+                if key.split('#')[1] == vin:
+                    return partition, line
+        return None
 
     # Задание 1. Сохранение автомобилей и моделей
+    @traced
+    @locked
     def add_model(self, model: Model) -> Model:
         """
         Функция добавляет модель и её индекс в файлы.
@@ -35,7 +426,14 @@ class CarService:
         params = (model.id, model.name, model.brand)
         try:
             if model:
-                fn.insert_in_file(params, self.paths['models.txt'], self.paths['models_index.txt'])
+                # Фильтр открываем до записи, чтобы он не построился уже с новым ключом.
+                bloom = self.bloom('models')
+                models_state = fn.file_state(self.paths['models.txt'])
+                line_num = fn.append_rows([params], self.paths['models.txt'])
+                self.index('models').insert(str(model.id), line_num)
+                bloom.add(str(model.id))
+                self.remember_models([model], models_state)
+                self.emit('add_model', model.model_dump(mode='json'))
         except InvalidCharacterStr as e:
             print(f'Ошибка: {e}')
             raise
@@ -45,6 +443,8 @@ class CarService:
         return model
 
     # Задание 1. Сохранение автомобилей и моделей
+    @traced
+    @locked
     def add_car(self, car: Car) -> Car:
         """
         Функция добавляет машину и её индекс в файлы.
@@ -66,7 +466,18 @@ class CarService:
         )
         try:
             if car:
-                fn.insert_in_file(params, self.paths['cars.txt'], self.paths['cars_index.txt'])
+                # Фильтр открываем до записи, чтобы он не построился уже с новым ключом.
+                bloom = self.bloom('cars')
+                counters = self.inventory()
+                cars_state = fn.file_state(self.paths['cars.txt'])
+                line_num = fn.append_rows([params], self.paths['cars.txt'])
+                self.index('cars').insert(car.vin, line_num)
+                bloom.add(car.vin)
+                car_info = ';'.join(map(str, params)).split(';')
+                self.patch_cars({line_num: car_info}, cars_state)
+                counters.car_added(car_info)
+                counters.save()
+                self.emit('add_car', car.model_dump(mode='json'))
         except InvalidCharacterStr as e:
             print(f'Ошибка: {e}')
             raise
@@ -75,7 +486,78 @@ class CarService:
             raise
         return car
 
+    # Пакетная запись моделей.
+    @traced
+    @locked
+    def add_models(self, models: list[Model]) -> list[Model]:
+        """
+        Функция добавляет пачку моделей с одной перезаписью индекса.
+
+        Args:
+            models(list[Model]): Добавляемые модели.
+
+        Returns:
+            list[Model]: Добавленные модели.
+        """
+        params_list = [(model.id, model.name, model.brand) for model in models]
+        try:
+            bloom = self.bloom('models')
+            models_state = fn.file_state(self.paths['models.txt'])
+            first_line = fn.append_rows(params_list, self.paths['models.txt'])
+            self.index('models').insert_many(
+                [(str(model.id), first_line + i) for i, model in enumerate(models)]
+            )
+            bloom.add_many([str(model.id) for model in models])
+            self.remember_models(models, models_state)
+            for model in models:
+                self.emit('add_model', model.model_dump(mode='json'))
+        except InvalidCharacterStr as e:
+            print(f'Ошибка: {e}')
+            raise
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return models
+
+    # Пакетная запись машин.
+    @traced
+    @locked
+    def add_cars(self, cars: list[Car]) -> list[Car]:
+        """
+        Функция добавляет пачку машин с одной перезаписью индекса.
+
+        Args:
+            cars(list[Car]): Добавляемые машины.
+
+        Returns:
+            list[Car]: Добавленные машины.
+        """
+        params_list = [(car.vin, car.model, car.price, car.date_start, car.status) for car in cars]
+        try:
+            bloom = self.bloom('cars')
+            counters = self.inventory()
+            cars_state = fn.file_state(self.paths['cars.txt'])
+            first_line = fn.append_rows(params_list, self.paths['cars.txt'])
+            self.index('cars').insert_many([(car.vin, first_line + i) for i, car in enumerate(cars)])
+            bloom.add_many([car.vin for car in cars])
+            rows = {first_line + i: ';'.join(map(str, params)).split(';') for i, params in enumerate(params_list)}
+            self.patch_cars(rows, cars_state)
+            for car_info in rows.values():
+                counters.car_added(car_info)
+            counters.save()
+            for car in cars:
+                self.emit('add_car', car.model_dump(mode='json'))
+        except InvalidCharacterStr as e:
+            print(f'Ошибка: {e}')
+            raise
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return cars
+
     # Задание 2. Сохранение продаж.
+    @traced
+    @locked
     def sell_car(self, sale: Sale) -> Car:
         """
         Функция сохранения новых продаж.
@@ -94,20 +576,37 @@ class CarService:
             sale.sales_date
         )
         try:
-            fn.insert_in_file(params, self.paths['sales.txt'], self.paths['sales_index.txt'])
-
             # Ищем строку где хранится машина в cars.txt.
-            str_number = fn.find_index(self.paths['cars_index.txt'], sale.car_vin)
+            str_number = self.find_line('cars', sale.car_vin)
 
-            # Если совпадений не найдено, выбрасывааем исключение.
+            # Если совпадений не найдено, выбрасывааем исключение
+            # до записи продажи.
             if str_number is None:
                 raise CarNotFoundError('Такой машины нет в cars.txt')
 
+            counters = self.inventory()
+            if self.partitions is None:
+                bloom = self.bloom('sales')
+                line_num = fn.append_rows([params], self.paths['sales.txt'])
+                self.index('sales').insert(sale.sales_number, line_num)
+                bloom.add(sale.sales_number)
+            else:
+                # Продажа пишется в партицию месяца её даты.
+                partition = self.partitions.for_write(month_of(sale.sales_date))
+                line_num = fn.append_rows([params], partition.path_txt)
+                partition.index.insert(sale.sales_number, line_num)
+                self.partitions.added(partition.name, 1)
+
             # Меняем статус машины.
-            list_strings = fn.change_machine_status(self.paths['cars.txt'], str_number, 'sold')
+            cars_state = fn.file_state(self.paths['cars.txt'])
+            list_strings = fn.change_machine_status(self.paths['cars.txt'], str_number, 'sold', counters)
+            self.patch_cars({str_number: list_strings}, cars_state)
+            counters.sale_added(';'.join(map(str, params)).split(';'))
+            counters.save()
 
             # Записываем измененный обьект для return.
             object_car = fn.create_car_object(list_strings)
+            self.emit('sell_car', sale.model_dump(mode='json'))
         except CarNotFoundError as e:
             print(str(e))
             raise
@@ -123,10 +622,13 @@ class CarService:
         return object_car
 
     # Задание 3. Доступные к продаже
+    @traced
     def get_cars(self, status: CarStatus) -> list[Car]:
         """
         Функция ищет все автомобили с нужным статусом.
         Вовзращает список таких автомобилей.
+        Результат берется из кеша, поэтому между записями cars.txt не читается.
+        Возвращаются копии машин из кеша, их можно менять.
 
         Args:
             status(CarStatus): Искомый статус.
@@ -136,28 +638,13 @@ class CarService:
         """
         try:
             result = list()
-            # Открываем файл на чтение.
-            # Если такого файла не существует, произойдет исключение.
-            with open(self.paths['cars.txt'], 'r', encoding='utf-8', newline='') as f:
-
-                # Читаем по 501 символу за один раз.
-                while line := f.read(LINE_SIZE):
-                    car_info = line.strip().split(';')
-
-                    # Если автомобиль с нужным статусом найден,
-                    # то записываем его в список.
-                    if car_info[-1] == status:
-
-                        # Я бы мог написать просто need_car = fn.create_car_object(car_info).
-                        # Но пайтесты почему-то падают с ошибкой, хотя обьекты одинаковы.
-                        need_car = Car(
-                            vin=car_info[0],
-                            model=int(car_info[1]),
-                            price=Decimal(car_info[2]),
-                            date_start=dt.strptime(car_info[3], '%Y-%m-%d %H:%M:%S'),
-                            status=CarStatus(car_info[4])
-                        )
-                        result.append(need_car)
+            # Кеш меняют записи под этой же блокировкой.
+            with self.lock:
+                cars = self.cars_by_status(status)
+                if status not in self.cars_lists:
+                    # Машины в порядке строк cars.txt, как при чтении файла.
+                    self.cars_lists[status] = [cars[number] for number in sorted(cars)]
+                result = [car.model_copy() for car in self.cars_lists[status]]
         except FileNotFoundError as e:
             print(f'Такого файла нет. Ошибка: {e}')
         except InvalidCharacterStr as e:
@@ -173,6 +660,7 @@ class CarService:
         return result
 
     # Задание 4. Детальная информация
+    @traced
     def get_car_info(self, vin: str) -> CarFullInfo | None:
         """
         Функция выводит информацию о машине по VIN коду.
@@ -186,46 +674,44 @@ class CarService:
         try:
             result = None
             # Ищем строку где искать нужную машину
-            number_line_car = fn.find_index(self.paths['cars_index.txt'], vin)
+            number_line_car = self.find_line('cars', vin)
 
             # Если не найдена, возвращаем None
             if number_line_car is None:
                 return None
 
-            # Получаем индекс модели из car и ищем его аналогично.
+            # Получаем id модели из car и берем модель из таблицы в памяти.
             list_car = fn.read_line(self.paths['cars.txt'], number_line_car)
-            number_line_model = fn.find_index(self.paths['models_index.txt'], list_car[1])
+            model = self.get_model(list_car[1])
 
-            if number_line_model is None:
+            if model is None:
                 return None
 
-            # Ищем модель.
-            list_model = fn.read_line(self.paths['models.txt'], number_line_model)
-
             # Заранее устанавливаем переменные продажи.
             sales_date = None
             sales_cost = None
 
             # Если продажа существует, то ищем в файле информацию.
             if list_car[-1] == 'sold':
-                number_line_sold = fn.find_index_sold_vin(self.paths['sales_index.txt'], list_car[0])
+                found_sale = self.find_sale_by_vin(list_car[0])
 
-                if number_line_sold is None:
+                if found_sale is None:
                     return None
 
                 # Ищем продажу.
-                list_sale = fn.read_line(self.paths['sales.txt'], number_line_sold)
+                partition, number_line_sold = found_sale
+                list_sale = partition.read_line(number_line_sold)
 
-                sales_date = dt.strptime(list_sale[-1], '%Y-%m-%d %H:%M:%S')
+                sales_date = fn.decode_datetime(list_sale[-1])
                 sales_cost = Decimal(list_sale[-2])
 
             # Сохраняем все в переменную CarFullInfo.
             result = CarFullInfo(
                 vin=list_car[0],
-                car_model_name=list_model[1],
-                car_model_brand=list_model[-1],
+                car_model_name=model.name,
+                car_model_brand=model.brand,
                 price=Decimal(list_car[2]),
-                date_start=dt.strptime(list_car[-2], '%Y-%m-%d %H:%M:%S'),
+                date_start=fn.decode_datetime(list_car[-2]),
                 status=CarStatus(list_car[-1]),
                 sales_date=sales_date,
                 sales_cost=sales_cost
@@ -241,7 +727,84 @@ class CarService:
             raise
         return result
 
+    # Пакетное получение детальной информации.
+    @traced
+    def get_car_infos(self, vins: list[str]) -> list[CarFullInfo | None]:
+        """
+        Функция выводит информацию о машинах по списку VIN кодов.
+        Все VIN ищутся одним проходом по индексу машин, строки машин
+        читаются по возрастанию номера строки, а каждая модель и
+        продажа читаются один раз на всю пачку.
+
+        Args:
+            vins(list[str]): VIN искомых машин.
+
+        Returns:
+            list[CarFullInfo | None]: Информация в порядке запроса, None для ненайденных.
+        """
+        try:
+            # Отбрасываем VIN, которых точно нет.
+            bloom = self.bloom('cars')
+            wanted = [vin for vin in set(vins) if bloom.might_contain(vin)]
+            car_lines = self.index('cars').find_many(wanted)
+            cars = fn.read_lines(self.paths['cars.txt'], car_lines.values())
+
+            # Модели берем из таблицы в памяти.
+            models = self.models()
+
+            # Продажи: один проход по индексу каждого файла продаж для всех проданных машин.
+            sold = {vin for vin, line in car_lines.items() if cars[line][-1] == 'sold'}
+            sale_lines = dict()
+            sales = dict()
+            if sold:
+                for partition in reversed(self.sale_partitions()):
+                    lines = list()
+                    for key, line in partition.index.items():
+                        vin = key.split('#')[1]
+                        if vin in sold and vin not in sale_lines:
+                            sale_lines[vin] = (partition.name, line)
+                            lines.append(line)
+                    for line, list_sale in partition.read_lines(lines).items():
+                        sales[partition.name, line] = list_sale
+
+            infos = dict()
+            for vin, line in car_lines.items():
+                list_car = cars[line]
+                model = models.get(int(list_car[1]))
+                if model is None:
+                    continue
+
+                sales_date = None
+                sales_cost = None
+                if vin in sold:
+                    if vin not in sale_lines:
+                        continue
+                    list_sale = sales[sale_lines[vin]]
+                    sales_date = fn.decode_datetime(list_sale[-1])
+                    sales_cost = Decimal(list_sale[-2])
+
+                infos[vin] = CarFullInfo(
+                    vin=list_car[0],
+                    car_model_name=model.name,
+                    car_model_brand=model.brand,
+                    price=Decimal(list_car[2]),
+                    date_start=fn.decode_datetime(list_car[-2]),
+                    status=CarStatus(list_car[-1]),
+                    sales_date=sales_date,
+                    sales_cost=sales_cost
+                )
+            result = [infos.get(vin) for vin in vins]
+        except FileNotFoundError as e:
+            print(f'Такого файла нет. Ошибка: {e}')
+            result = [None] * len(vins)
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return result
+
     # Задание 5. Обновление ключевого поля
+    @traced
+    @locked
     def update_vin(self, vin: str, new_vin: str) -> Car:
         """
         Функция меняет старый VIN код на новый.
@@ -254,10 +817,13 @@ class CarService:
         """
         try:
             result = None
-            number_line_car = fn.find_index(self.paths['cars_index.txt'], vin)
+            number_line_car = self.find_line('cars', vin)
 
             if number_line_car is None:
                 raise CarNotFoundError
+            # Проверяем до записи: два ключа с одним VIN индекс не различит.
+            if new_vin != vin and self.find_line('cars', new_vin) is not None:
+                raise ValueError(f'Машина с VIN {new_vin} уже есть')
 
             # Находим и меняем строку, которую нужно поменять.
             list_car = fn.read_line(self.paths['cars.txt'], number_line_car)
@@ -265,28 +831,19 @@ class CarService:
             new_str = ';'.join(list_car).ljust(LINE_SIZE - 1) + '\n'
 
             # Перезаписываем строку
+            cars_state = fn.file_state(self.paths['cars.txt'])
             with open(self.paths['cars.txt'], 'r+', encoding='utf-8', newline='') as f:
                 f.seek(number_line_car * (LINE_SIZE))
                 f.write(new_str)
 
-            # Чтобы поменять в индексах vin, нужно получить список всех строк.
-            list_indexs = fn.read_file(self.paths['cars_index.txt'])
-            result_index = list()
-
-            for line in list_indexs:
-                list_line = line.strip().split(';')
-                vin_car = list_line[0]
-                if vin_car == vin:
-                    list_line[0] = new_vin
-                new_str = ';'.join(list_line) + '\n'
-                result_index.append(new_str)
-            result_index.sort(key=lambda x: x.split(';')[0])
-
-            with open(self.paths['cars_index.txt'], 'w', encoding='utf-8', newline='') as f:
-                f.writelines(result_index)
+            # Меняем vin в индексе.
+            self.index('cars').rename(vin, new_vin)
+            self.bloom('cars').add(new_vin)
+            self.patch_cars({number_line_car: list_car}, cars_state)
 
             # Записываем информацию о машине.
             result = fn.create_car_object(list_car)
+            self.emit('update_vin', {'vin': vin, 'new_vin': new_vin})
 
         except CarNotFoundError as e:
             print(str(e))
@@ -303,6 +860,8 @@ class CarService:
         return result
 
     # Задание 6. Удаление продажи
+    @traced
+    @locked
     def revert_sale(self, sales_number: str) -> Car:
         """
         Функция удаляет продажу
@@ -316,58 +875,50 @@ class CarService:
         """
         try:
             # Ищем индекс продажи.
-            num_sale_index = fn.find_index_sold_sale_num(self.paths['sales_index.txt'], sales_number)
+            found_sale = self.find_sale(sales_number)
 
             # Если такой продажи нет, выбрасываем исключение.
-            if num_sale_index is None:
+            if found_sale is None:
                 raise CarNotFoundError
+            partition, num_sale_index = found_sale
+            counters = self.inventory()
 
-            # Перезапимываем индексы продаж
-            list_indexs = fn.read_file(self.paths['sales_index.txt'])
-            result_index = list()
-
-            vin_car = None
-            for line in list_indexs:
-                list_line = line.strip().split(';')
-                current_sale_num = list_line[0]
-                if current_sale_num == sales_number:
+            # Запишем vin авто, которой нужно поменять статус.
+            # Номер продажи имеет вид 'дата#VIN'.
+            vin_car = sales_number.split('#')[1]
 
-                    # Запишем vin авто, которой нужно поменять статус.
-                    vin_car = current_sale_num.split('#')[1]
-                    if vin_car is None:
-                        raise CarNotFoundError
-                    continue
-
-                new_str = ';'.join(list_line) + '\n'
-                result_index.append(new_str)
-
-            if vin_car is None:
-                raise CarNotFoundError
-
-            # Если result индекс не существует после удаление продажи,
-            # то файл просто перезапишется на пустой. В ином случае
-            # запись произойдет в отсортированном порядке.
-            result_index.sort(key=lambda x: x.split(';')[0])
-            with open(self.paths['sales_index.txt'], 'w', encoding='utf-8', newline='') as f:
-                f.writelines(result_index)
+            # Удаляем продажу из индекса.
+            partition.index.delete(sales_number)
+            if self.partitions is None:
+                self.bloom('sales').mark_synced()
+            elif partition.archived:
+                self.partitions.unarchive(partition.name)
 
             # Ищем текущею продажу и удаляем её записью is_deleted.
-            with open(self.paths['sales.txt'], 'r+', encoding='utf-8', newline='') as f:
+            sale_info = partition.read_line(num_sale_index)
+            with open(partition.path_txt, 'r+', encoding='utf-8', newline='') as f:
                 f.seek(num_sale_index * (LINE_SIZE))
                 delete_sail = 'is_deleted'.ljust(LINE_SIZE - 1) + '\n'
                 f.write(delete_sail)
+            # Продажа уже удалена, даже если машину дальше не найдём.
+            counters.sale_removed(sale_info)
+            counters.save()
 
             # Ищем строку где хранится автомобиль.
-            num_car_index = fn.find_index(self.paths['cars_index.txt'], vin_car)
+            num_car_index = self.index('cars').find(vin_car)
 
             if num_car_index is None:
                 raise CarNotFoundError
 
             # Находим автомобиль и меняем статус.
-            list_current_cur = fn.change_machine_status(self.paths['cars.txt'], num_car_index, 'available')
+            cars_state = fn.file_state(self.paths['cars.txt'])
+            list_current_cur = fn.change_machine_status(self.paths['cars.txt'], num_car_index, 'available', counters)
+            self.patch_cars({num_car_index: list_current_cur}, cars_state)
+            counters.save()
 
             # Сохраняем автомобиль для return.
             result = fn.create_car_object(list_current_cur)
+            self.emit('revert_sale', {'sales_number': sales_number})
 
         except CarNotFoundError as e:
             print(str(e))
@@ -384,83 +935,491 @@ class CarService:
         return result
 
     # Задание 7. Самые продаваемые модели
-    def top_models_by_sales(self) -> list[ModelSaleStats]:
+    @traced
+    def top_models_by_sales(self, since: datetime | None = None,
+                            until: datetime | None = None) -> list[ModelSaleStats]:
         """
         Функция находит топ 3 самых продаваемых моделей и
         возвращает их в виде списка ModelSaleStats.
 
+        Args:
+            since(datetime): Учитывать продажи начиная с этой даты.
+            until(datetime): Учитывать продажи до этой даты, не включительно.
         Returns:
             list[ModelSaleStats]: Список моделей.
         """
         try:
-            # Сначала вытаскиваем все vin и цену проданных машин в список.
-            info_sale = list()
-            with open(self.paths['sales.txt'], 'r', encoding='utf-8') as f:
-                while line := f.read(LINE_SIZE).strip():
+            result = self.top_models_from_totals(self.model_sales_totals(since, until))
+        except CarNotFoundError as e:
+            print(str(e))
+            raise
+        except FileNotFoundError as e:
+            print(f'Такого файла нет. Ошибка: {e}')
+            raise
+        except InvalidCharacterStr as e:
+            print(f'Ошибка: {e}')
+            raise
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return result
 
-                    # Если продажа удалена, то пропускаем строку.
-                    if line == 'is_deleted':
-                        continue
-                    line_list = line.split(';')
-                    car_vin, sale_price = line_list[1], Decimal(line_list[2])
-                    info_sale.append([car_vin, sale_price])
-
-            # Далее нужно узнать позицию в cars.txt каждой машины.
-            for i in info_sale:
-                car_vin = i[0]
-                index_car = fn.find_index(self.paths['cars_index.txt'], car_vin)
-
-                # Заменяем vin на index. Так как vin нам больше не нужен.
-                i[0] = index_car
-
-            # Создаем словарь моделей
-            model_dect = dict()
-            for i in info_sale:
-                pointer = i[0]
-                line_list = fn.read_line(self.paths['cars.txt'], pointer)
-                model_id = line_list[1]
-
-                # Ищем информацию где хранится модель.
-                model_line = fn.find_index(self.paths['models_index.txt'], model_id)
-                price_sale = i[1]
-                if model_line not in model_dect:
-                    # Первое значение количество продаж этой модели.
-                    # Второе цена продажи этой модели.
-                    model_dect[model_line] = [1, price_sale] 
-                else:
-                    model_dect[model_line][0] += 1
-                    model_dect[model_line][1] = max(model_dect[model_line][1], price_sale)
-
-            # # Сортируем словарь, сначала по продажам потом по цене.
-            top_list = sorted(
-                model_dect.items(),
-                key=lambda x: (x[1][0], x[1][1]),
-                reverse=True
+    @profiled
+    def models_of_cars(self, vins: set) -> dict:
+        """
+        Функция возвращает id модели для каждого vin.
+        Если машин много относительно размера cars.txt, файл просматривается
+        один раз побайтово и разбираются только строки проданных машин.
+        Иначе и для машин, не найденных среди проданных, строки ищутся по индексу.
+
+        Args:
+            vins(set): Множество vin.
+        Returns:
+            dict: Словарь {vin: id модели}.
+        """
+        result = dict()
+        if not vins:
+            return result
+        state = fn.file_state(self.paths['cars.txt'])
+        rows = state[0] // LINE_SIZE if state is not None else 0
+        if len(vins) * SCAN_RATIO >= rows:
+            with span('scan cars'):
+                for _, car_info in fn.scan_status(self.paths['cars.txt'], CarStatus.sold):
+                    if car_info[0] in vins:
+                        result.setdefault(car_info[0], car_info[1])
+
+        missing = [vin for vin in vins if vin not in result]
+        if missing:
+            with span('find cars'):
+                lines = self.index('cars').find_many(missing)
+            with span('read cars'):
+                rows_by_line = fn.read_lines(self.paths['cars.txt'], [lines[vin] for vin in missing])
+            for vin in missing:
+                result[vin] = rows_by_line[lines[vin]][1]
+        return result
+
+    @traced
+    def model_sales_totals(self, since: datetime | None = None, until: datetime | None = None) -> dict:
+        """
+        Функция считает продажи по моделям за период [since, until).
+        Для каждой модели хранится количество продаж и максимальная цена продажи.
+        С партициями читаются только файлы месяцев периода.
+
+        Args:
+            since(datetime): Начало периода, включительно.
+            until(datetime): Конец периода, не включительно.
+        Returns:
+            dict: Словарь {id модели: [количество продаж, максимальная цена]}.
+        """
+        # Сначала вытаскиваем все vin и цену проданных машин в список.
+        # Удаленные продажи scan_rows отбрасывает по первым байтам строки.
+        info_sale = list()
+        with span('scan sales'):
+            for partition in self.sale_partitions(since, until):
+                for _, line_list in partition.scan_rows():
+                    if since is not None or until is not None:
+                        sales_date = fn.decode_datetime(line_list[-1])
+                        if (since is not None and sales_date < since) or (until is not None and sales_date >= until):
+                            continue
+                    info_sale.append((line_list[1], Decimal(line_list[2])))
+
+        # Далее нужно узнать модель каждой проданной машины.
+        car_models = self.models_of_cars({car_vin for car_vin, _ in info_sale})
+
+        # Создаем словарь моделей
+        model_dect = dict()
+        for car_vin, price_sale in info_sale:
+            model_id = car_models[car_vin]
+            if model_id not in model_dect:
+                # Первое значение количество продаж этой модели.
+                # Второе цена продажи этой модели.
+                model_dect[model_id] = [1, price_sale]
+            else:
+                model_dect[model_id][0] += 1
+                model_dect[model_id][1] = max(model_dect[model_id][1], price_sale)
+        return model_dect
+
+    @profiled
+    def top_models_from_totals(self, totals: dict, limit: int = 3) -> list[ModelSaleStats]:
+        """
+        Функция сортирует модели по продажам, а затем по цене продажи,
+        и возвращает самые продаваемые из них.
+
+        Args:
+            totals(dict): Словарь {id модели: [количество продаж, максимальная цена]}.
+            limit(int): Сколько моделей вернуть.
+        Returns:
+            list[ModelSaleStats]: Список моделей.
+        """
+        # Сортируем словарь, сначала по продажам потом по цене.
+        top_list = sorted(
+            totals.items(),
+            key=lambda x: (x[1][0], x[1][1]),
+            reverse=True
+        )
+        # Создаем список самых дорогих авто.
+        result = list()
+        for model_id, (sales_count, _) in top_list[:limit]:
+            model = self.get_model(model_id)
+            model_object = ModelSaleStats(
+                car_model_name=model.name,
+                brand=model.brand,
+                sales_number=sales_count
             )
-            # Создаем список самых дорогих авто.
+            result.append(model_object)
+        return result
+
+    # Продажи за период.
+    @traced
+    def sales_between(self, start: datetime, end: datetime) -> list[Sale]:
+        """
+        Функция возвращает продажи за период [start, end), отсортированные по дате.
+        С партициями читаются только файлы месяцев периода.
+
+        Args:
+            start(datetime): Начало периода, включительно.
+            end(datetime): Конец периода, не включительно.
+        Returns:
+            list[Sale]: Список продаж.
+        """
+        try:
             result = list()
-            count_auto = 3 if len(top_list) > 2 else len(top_list)
-            for i in range(count_auto):
-                line_list = fn.read_line(self.paths['models.txt'], top_list[i][0])
-                model_name = line_list[1]
-                brand_name = line_list[2]
-                sales_count = top_list[i][1][0]
-                model_object = ModelSaleStats(
-                    car_model_name=model_name,
-                    brand=brand_name,
-                    sales_number=sales_count
-                )
-                result.append(model_object)
+            for partition in self.sale_partitions(start, end):
+                for row in partition.iter_rows():
+                    line_list = row.split(';')
+                    sales_date = fn.decode_datetime(line_list[-1])
+                    if start <= sales_date < end:
+                        result.append(Sale(
+                            sales_number=line_list[0],
+                            car_vin=line_list[1],
+                            cost=Decimal(line_list[2]),
+                            sales_date=sales_date
+                        ))
+            result.sort(key=lambda sale: sale.sales_date)
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return result
+
+    # Продажи. Архивирование старых партиций.
+    @traced
+    @locked
+    def archive_sales(self, before: datetime) -> list[str]:
+        """
+        Функция сжимает партиции продаж всех месяцев раньше месяца before.
+        Запись новых продаж идёт в несжатые партиции и не замедляется.
+
+        Args:
+            before(datetime): Дата, месяцы до которой архивируются.
+        Returns:
+            list[str]: Имена заархивированных партиций.
+        """
+        if self.partitions is None:
+            raise ValueError('Хранилище без партиций продаж')
+        archived = list()
+        for name in self.partitions.names(until=datetime(before.year, before.month, 1)):
+            if not self.partitions.partition(name).archived:
+                self.partitions.archive(name)
+                archived.append(name)
+        return archived
+
+    # Резервное копирование. Экспорт снапшота.
+    @traced
+    def export_snapshot(self, path: str, compression: str = 'zlib') -> int:
+        """
+        Функция сохраняет согласованный снимок базы в сжатый бинарный файл.
+        Под блокировкой файлы данных только копируются, а сжатие
+        выполняется уже без блокировки, чтобы не задерживать запись.
+
+        Args:
+            path(str): Путь к файлу снапшота.
+            compression(str): Алгоритм сжатия: 'zlib' или 'lzma'.
+        Returns:
+            int: Количество сохранённых строк.
+        """
+        try:
+            with tempfile.TemporaryDirectory(dir=self.root_directory_path) as tmp:
+                # Копируем файлы данных, индексы при импорте строятся заново.
+                with self.lock:
+                    copies = dict()
+                    for table, (file_txt, _) in TABLES.items():
+                        copies[table] = os.path.join(tmp, file_txt)
+                        if table == 'sales' and self.partitions is not None:
+                            # Партиции в снапшоте снова становятся одним sales.txt.
+                            with open(copies[table], 'w', encoding='utf-8', newline='') as f:
+                                for partition in self.sale_partitions():
+                                    f.writelines(row.ljust(LINE_SIZE - 1) + '\n' for row in partition.iter_rows())
+                        elif os.path.exists(self.paths[file_txt]):
+                            shutil.copyfile(self.paths[file_txt], copies[table])
+
+                tables = {table: fn.iter_rows(copy) for table, copy in copies.items()}
+                result = snap.write_snapshot(path, tables, compression)
+        except SnapshotFormatError as e:
+            print(f'Ошибка: {e}')
+            raise
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return result
+
+    # Резервное копирование. Импорт снапшота.
+    @traced
+    @locked
+    def import_snapshot(self, path: str) -> int:
+        """
+        Функция восстанавливает базу из снапшота, полностью заменяя текущие файлы.
+
+        Args:
+            path(str): Путь к файлу снапшота.
+        Returns:
+            int: Количество восстановленных строк.
+        """
+        try:
+            count = self.bulk_load(snap.read_snapshot(path))
+            # В журнал пишем только путь: потребителям нужно перечитать базу целиком.
+            self.emit('import_snapshot', {'path': os.path.abspath(path)})
+        except SnapshotFormatError as e:
+            print(f'Ошибка: {e}')
+            raise
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return count
+
+    @traced
+    @locked
+    def bulk_load(self, rows) -> int:
+        """
+        Функция заполняет хранилище строками, полностью заменяя текущие файлы.
+        Строки пишутся последовательно, а индексы строятся
+        одной сортировкой в конце вместо вставки по одной строке.
+        Файлы хранилища заменяются только после того, как прочитаны все строки.
+
+        Args:
+            rows: Итератор пар (имя таблицы, строка без выравнивания).
+        Returns:
+            int: Количество записанных строк.
+        """
+        # Сначала все строки пишутся во временную директорию. Если итератор
+        # упадёт посередине (например, снапшот обрезан), текущие файлы не тронуты.
+        staging = tempfile.mkdtemp(prefix='bulk_load_', dir=self.root_directory_path)
+        files = dict()
+        # Счётчики склада считаются по тем же строкам во время загрузки.
+        counters = InventoryStats(self.paths['stats.json'])
+        try:
+            try:
+                entries = {table: list() for table in TABLES}
+                for table, (file_txt, _) in TABLES.items():
+                    files[table] = open(os.path.join(staging, file_txt), 'w', encoding='utf-8', newline='')
+
+                count = 0
+                for table, row in rows:
+                    # Первое поле строки - ключ таблицы.
+                    key = row.split(';', 1)[0]
+                    if table == 'cars':
+                        counters.car_added(row.split(';'))
+                    elif table == 'sales':
+                        counters.sale_added(row.split(';'))
+                    if table == 'sales' and self.partitions is not None:
+                        # Продажа идёт в партицию месяца, дата - последнее поле.
+                        table = month_of(fn.decode_datetime(row.rsplit(';', 1)[1]))
+                        if table not in files:
+                            files[table] = open(os.path.join(staging, f'{table}.txt'), 'w',
+                                                encoding='utf-8', newline='')
+                            entries[table] = list()
+                    entries[table].append((key, len(entries[table])))
+                    files[table].write(row.ljust(LINE_SIZE - 1) + '\n')
+                    count += 1
+            finally:
+                for f in files.values():
+                    f.close()
+
+            # Все строки прочитаны, подменяем файлы хранилища.
+            for table, (file_txt, _) in TABLES.items():
+                os.replace(os.path.join(staging, file_txt), self.paths[file_txt])
+            if self.partitions is not None:
+                self.partitions.reset()
+                for name in entries.keys() - TABLES.keys():
+                    os.replace(os.path.join(staging, f'{name}.txt'), self.partitions.for_write(name).path_txt)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        for name in entries.keys() - TABLES.keys():
+            entries[name].sort(key=lambda x: x[0])
+            self.partitions.partition(name).index.bulk_build(entries[name])
+            self.partitions.added(name, len(entries[name]))
+
+        for table in TABLES:
+            entries[table].sort(key=lambda x: x[0])
+            self.index(table).bulk_build(entries[table])
+            self.bloom(table).rebuild()
+        self.counters = counters
+        counters.save()
+        self.models_cache = None
+        self.cars_cache = None
+        return count
+
+    # Удаление машины.
+    @traced
+    @locked
+    def remove_car(self, vin: str) -> Car:
+        """
+        Функция удаляет машину: строка в cars.txt заменяется на 'is_deleted',
+        а запись убирается из индекса. Продажи машины не трогаются.
+
+        Args:
+            vin(str): VIN удаляемой машины.
+        Returns:
+            Car: Удалённая машина.
+        """
+        try:
+            number_line_car = self.find_line('cars', vin)
+            if number_line_car is None:
+                raise CarNotFoundError
+
+            counters = self.inventory()
+            list_car = fn.read_line(self.paths['cars.txt'], number_line_car)
+            cars_state = fn.file_state(self.paths['cars.txt'])
+            with open(self.paths['cars.txt'], 'r+', encoding='utf-8', newline='') as f:
+                f.seek(number_line_car * (LINE_SIZE))
+                f.write('is_deleted'.ljust(LINE_SIZE - 1) + '\n')
+
+            # Убираем машину из индекса.
+            self.index('cars').delete(vin)
+            self.bloom('cars').mark_synced()
+            self.patch_cars({number_line_car: None}, cars_state)
+            counters.car_removed(list_car)
+            counters.save()
+
+            result = fn.create_car_object(list_car)
+            self.emit('remove_car', {'vin': vin})
         except CarNotFoundError as e:
             print(str(e))
             raise
         except FileNotFoundError as e:
             print(f'Такого файла нет. Ошибка: {e}')
             raise
-        except InvalidCharacterStr as e:
-            print(f'Ошибка: {e}')
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
             raise
+        return result
+
+    # Статистика склада.
+    @traced
+    @locked
+    def stats(self, recompute: bool = False) -> dict:
+        """
+        Функция возвращает статистику склада по счётчикам: машины по статусам,
+        выручку всего и по месяцам, среднюю цену машин по моделям и брендам,
+        количество непроданных машин и их средний возраст.
+        Счётчики меняются при каждой записи, поэтому файлы данных не читаются.
+
+        Args:
+            recompute(bool): Пересчитать счётчики полным проходом по файлам.
+            Нужен для проверки: результат должен совпасть с обычным вызовом.
+            Пересчёт ничего не сохраняет, исправить счётчики можно через repair_stats.
+        Returns:
+            dict: Статистика склада.
+        """
+        try:
+            counters = self.recount_inventory() if recompute else self.inventory()
+            result = counters.report(self.models())
         except Exception as e:
             print(f'Неизвестная ошибка: {e}')
             raise
         return result
+
+    @traced
+    @locked
+    def repair_stats(self) -> dict:
+        """
+        Функция пересчитывает счётчики склада полным проходом по файлам
+        и сохраняет их вместо текущих, если те разошлись с данными.
+
+        Returns:
+            dict: Статистика склада по пересчитанным счётчикам.
+        """
+        try:
+            self.counters = self.recount_inventory()
+            self.counters.save()
+            result = self.counters.report(self.models())
+        except Exception as e:
+            print(f'Неизвестная ошибка: {e}')
+            raise
+        return result
+
+    # Фильтры Блума. Перестроение.
+    @locked
+    def rebuild_bloom_filters(self) -> None:
+        """
+        Функция заново строит фильтры Блума всех индексов.
+        Удалённые ключи при этом перестают давать ложные срабатывания.
+        """
+        for table in TABLES:
+            self.bloom(table).rebuild()
+
+    # Фильтры Блума. Статистика.
+    def bloom_stats(self) -> dict:
+        """
+        Функция возвращает статистику фильтров Блума по таблицам.
+
+        Returns:
+            dict: Словарь {имя таблицы: статистика фильтра}.
+        """
+        return {table: self.bloom(table).stats() for table in TABLES}
+
+    # Журнал изменений. Запись события.
+    def emit(self, op: str, data: dict) -> int | None:
+        """
+        Функция записывает событие об изменении в журнал, если он включен.
+
+        Args:
+            op(str): Имя операции.
+            data(dict): Данные операции.
+        Returns:
+            int: Номер события.
+            None: Если журнал выключен.
+        """
+        if self.feed is None:
+            return None
+        return self.feed.append(op, data)
+
+    # Журнал изменений. Чтение событий.
+    def changes_since(self, seq: int = 0):
+        """
+        Генератор возвращает события журнала с номером больше seq.
+        Потребитель сохраняет номер последнего события и
+        в следующий раз читает только новые изменения.
+
+        Args:
+            seq(int): Номер последнего обработанного события.
+        Yields:
+            dict: Событие с полями seq, op, ts и data.
+        """
+        if self.feed is None:
+            return
+        yield from self.feed.read_since(seq)
+
+    # Журнал изменений. Подтверждение потребителя.
+    def ack_changes(self, consumer: str, seq: int) -> None:
+        """
+        Функция сохраняет отметку потребителя и усекает журнал
+        до минимальной отметки всех потребителей.
+
+        Args:
+            consumer(str): Имя потребителя.
+            seq(int): Номер последнего обработанного события.
+        """
+        if self.feed is not None:
+            with self.lock:
+                self.feed.ack(consumer, seq)
+
+    # Индексы. Статистика.
+    def index_stats(self) -> dict:
+        """
+        Функция возвращает статистику индексов по таблицам.
+
+        Returns:
+            dict: Словарь {имя таблицы: статистика индекса}.
+        """
+        return {table: self.index(table).stats() for table in TABLES}
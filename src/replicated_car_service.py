@@ -0,0 +1,392 @@
+import itertools
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from bibip_car_service import CarService, TABLES
+from models import Car, CarFullInfo, CarStatus, Model, ModelSaleStats, Sale
+from my_exceptions import ReplicaOutOfSyncError
+from auxiliary_functions import functions as fn
+from auxiliary_functions.change_feed import ChangeFeed
+
+# Файлы реплики: применённая позиция журнала и копия журнала основного хранилища.
+REPLICA_STATE_FILE = 'replica.json'
+SHIPPED_DIR = 'shipped'
+# Потребитель копии журнала на реплике.
+APPLY_CONSUMER = 'apply'
+
+
+def mutation_call(op: str, data: dict) -> tuple | None:
+    """
+    Функция превращает событие журнала в имя изменяющего метода CarService и его аргументы.
+
+    Args:
+        op(str): Имя операции.
+        data(dict): Данные операции.
+    Returns:
+        tuple: Имя метода и аргументы.
+        None: Если операция ничего не меняет.
+    """
+    if op == 'add_model':
+        return op, (Model(**data),)
+    if op == 'add_car':
+        return op, (Car(**data),)
+    if op == 'sell_car':
+        return op, (Sale(**data),)
+    if op == 'update_vin':
+        return op, (data['vin'], data['new_vin'])
+    if op == 'revert_sale':
+        return op, (data['sales_number'],)
+    if op == 'remove_car':
+        return op, (data['vin'],)
+    if op == 'import_snapshot':
+        return op, (data['path'],)
+    return None
+
+
+def consumer_name(replica) -> str:
+    # Отметка реплики в журнале основного хранилища.
+    return f'replica:{os.path.abspath(replica.root_directory_path)}'
+
+
+class Follower:
+    """
+    Реплика для чтения в своей директории.
+
+    Основное хранилище копирует события своего журнала изменений
+    в журнал реплики (директория shipped), а реплика применяет их
+    по порядку к своим cars.txt, sales.txt и индексам через обычный CarService.
+    Номер последнего применённого события хранится в replica.json,
+    поэтому реплика продолжает с него после перезапуска.
+    """
+    def __init__(self, root_directory_path: str, **options) -> None:
+        self.root_directory_path = root_directory_path
+        os.makedirs(root_directory_path, exist_ok=True)
+        # Реплика не пишет свой журнал: её изменения уже есть в журнале основного хранилища.
+        self.service = CarService(root_directory_path, change_feed=False, **options)
+        self.log = ChangeFeed(os.path.join(root_directory_path, SHIPPED_DIR))
+        self.applied_seq, self.applied_ts = self.load_state()
+
+    @property
+    def state_path(self) -> str:
+        return os.path.join(self.root_directory_path, REPLICA_STATE_FILE)
+
+    def load_state(self) -> tuple:
+        """
+        Функция читает позицию реплики в журнале.
+
+        Returns:
+            tuple: Номер последнего применённого события и его время,
+            (None, None) для реплики, которую ещё не копировали.
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None, None
+        return state['applied_seq'], state['applied_ts']
+
+    def save_state(self) -> None:
+        with open(self.state_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump({'applied_seq': self.applied_seq, 'applied_ts': self.applied_ts}, f)
+        os.replace(self.state_path + '.tmp', self.state_path)
+
+    def synced(self) -> bool:
+        return self.applied_seq is not None
+
+    def shipped_seq(self) -> int:
+        """
+        Функция возвращает номер последнего события, скопированного на реплику.
+        """
+        return self.log.last() or self.applied_seq or 0
+
+    def apply(self, limit: int | None = None) -> int:
+        """
+        Функция применяет скопированные события по порядку.
+        Позиция сохраняется после каждого события.
+
+        Args:
+            limit(int): Сколько событий применить за раз, None - все.
+        Returns:
+            int: Количество применённых событий.
+        """
+        if not self.synced():
+            return 0
+        count = 0
+        with self.service.lock:
+            for event in self.log.read_since(self.applied_seq):
+                if event['seq'] != self.applied_seq + 1:
+                    raise ReplicaOutOfSyncError
+                call = mutation_call(event['op'], event['data'])
+                if call is not None:
+                    name, args = call
+                    if name == 'import_snapshot' and not os.path.exists(args[0]):
+                        raise ReplicaOutOfSyncError
+                    try:
+                        getattr(self.service, name)(*args)
+                    except Exception as e:
+                        # Изменение прошло на основном хранилище, значит реплика разошлась с ним.
+                        raise ReplicaOutOfSyncError from e
+                self.applied_seq, self.applied_ts = event['seq'], event['ts']
+                self.save_state()
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+            if count:
+                self.log.ack(APPLY_CONSUMER, self.applied_seq)
+        return count
+
+    def reset(self, rows, seq: int) -> int:
+        """
+        Функция заменяет данные реплики строками основного хранилища.
+
+        Args:
+            rows: Итератор пар (таблица, строка), как для bulk_load.
+            seq(int): Номер события журнала, которому соответствуют строки.
+        Returns:
+            int: Количество загруженных строк.
+        """
+        with self.service.lock:
+            count = self.service.bulk_load(rows)
+            # Старая копия журнала больше не нужна, новая начнётся с seq + 1.
+            shutil.rmtree(self.log.directory, ignore_errors=True)
+            self.log = ChangeFeed(self.log.directory)
+            self.applied_seq, self.applied_ts = seq, time.time()
+            self.save_state()
+        return count
+
+    def lag(self, primary: CarService | None = None) -> dict:
+        """
+        Функция возвращает отставание реплики.
+
+        Args:
+            primary(CarService): Основное хранилище. Без него отставание
+            считается только по уже скопированным событиям.
+        Returns:
+            dict: Применённый и скопированный номера, отставание в событиях
+            и возраст самого старого неприменённого события в секундах.
+        """
+        applied = self.applied_seq or 0
+        shipped = self.shipped_seq()
+        head = max(shipped, primary.feed.last() if primary is not None else 0)
+        pending = None
+        if shipped > applied:
+            pending = next(self.log.read_since(applied), None)
+        elif head > applied:
+            pending = next(primary.changes_since(applied), None)
+        return {
+            'applied_seq': applied,
+            'shipped_seq': shipped,
+            'lag_events': head - applied,
+            'lag_seconds': max(time.time() - pending['ts'], 0.0) if pending else 0.0,
+        }
+
+
+def primary_rows(primary: CarService):
+    """
+    Генератор возвращает все живые строки основного хранилища для bulk_load.
+    """
+    yield from (('models', row) for row in fn.iter_rows(primary.paths[TABLES['models'][0]]))
+    yield from (('cars', row) for row in fn.iter_rows(primary.paths[TABLES['cars'][0]]))
+    for partition in primary.sale_partitions():
+        yield from (('sales', row) for row in partition.iter_rows())
+
+
+def resync(primary: CarService, replica: Follower) -> int:
+    """
+    Функция полностью копирует основное хранилище на реплику.
+    Запись в основное хранилище на время копирования блокируется,
+    чтобы строки совпали с номером события журнала.
+
+    Args:
+        primary(CarService): Основное хранилище.
+        replica(Follower): Реплика.
+    Returns:
+        int: Количество скопированных строк.
+    """
+    with primary.lock:
+        seq = primary.feed.last()
+        count = replica.reset(primary_rows(primary), seq)
+        primary.ack_changes(consumer_name(replica), seq)
+    return count
+
+
+def ship_log(primary: CarService, replica: Follower) -> int:
+    """
+    Функция копирует новые события журнала основного хранилища в журнал реплики.
+    Журнал основного хранилища не усекается, пока события не скопированы.
+    Новая реплика сначала копируется целиком.
+
+    Args:
+        primary(CarService): Основное хранилище.
+        replica(Follower): Реплика.
+    Returns:
+        int: Количество скопированных событий.
+    """
+    if not replica.synced():
+        resync(primary, replica)
+        return 0
+    shipped = replica.shipped_seq()
+    if primary.feed.last() < shipped:
+        # Журнал основного хранилища начали заново.
+        raise ReplicaOutOfSyncError
+    count = 0
+    for event in primary.changes_since(shipped):
+        if event['seq'] != shipped + 1:
+            # Нужные события уже удалены из журнала.
+            raise ReplicaOutOfSyncError
+        shipped = replica.log.append_event(event)
+        count += 1
+    if count:
+        # Отметку ставим под блокировкой хранилища, как и все его потребители.
+        primary.ack_changes(consumer_name(replica), shipped)
+    return count
+
+
+class ReplicatedCarService:
+    """
+    Хранилище с репликами для чтения.
+
+    Записи идут в основное хранилище и попадают в его журнал изменений,
+    журнал копируется в директории реплик, и реплики применяют его к своим файлам.
+    Чтения раздаются репликам по кругу. Реплика, отставшая больше чем
+    на max_lag событий, пропускается, а если таких нет - читает основное хранилище.
+    С sync_writes=True каждая запись сразу доходит до реплик,
+    иначе реплики догоняют через sync() или фоновый поток start().
+    Остальные именованные аргументы передаются в CarService основного хранилища и реплик.
+    """
+    def __init__(self, root_directory_path: str, replica_paths: list[str], max_lag: int | None = 0,
+                 sync_writes: bool = True, **options) -> None:
+        options.pop('change_feed', None)
+        os.makedirs(root_directory_path, exist_ok=True)
+        self.primary = CarService(root_directory_path, change_feed=True, **options)
+        self.replicas = [Follower(path, **options) for path in replica_paths]
+        self.max_lag = max_lag
+        self.sync_writes = sync_writes
+        self.sync_lock = threading.Lock()
+        self.turn = itertools.count()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def sync(self) -> int:
+        """
+        Функция копирует журнал на все реплики и применяет его.
+        Разошедшаяся с журналом реплика копируется заново.
+
+        Returns:
+            int: Количество применённых событий.
+        """
+        count = 0
+        with self.sync_lock:
+            for replica in self.replicas:
+                try:
+                    ship_log(self.primary, replica)
+                    count += replica.apply()
+                except ReplicaOutOfSyncError as e:
+                    print(f'Ошибка: {e}')
+                    resync(self.primary, replica)
+        return count
+
+    def start(self, interval: float = 0.1) -> None:
+        """
+        Функция запускает фоновый поток, который раз в interval секунд синхронизирует реплики.
+        """
+        def loop():
+            while not self.stopped.wait(interval):
+                self.sync()
+        self.stopped.clear()
+        self.thread = threading.Thread(target=loop, name='bibip-replication', daemon=True)
+        self.thread.start()
+
+    def close(self) -> None:
+        if self.thread is not None:
+            self.stopped.set()
+            self.thread.join()
+            self.thread = None
+
+    def replication_status(self) -> list[dict]:
+        """
+        Функция возвращает отставание каждой реплики.
+
+        Returns:
+            list[dict]: Путь реплики и её отставание, как в Follower.lag.
+        """
+        return [
+            {'path': replica.root_directory_path, **replica.lag(self.primary)}
+            for replica in self.replicas
+        ]
+
+    def route(self) -> CarService:
+        """
+        Функция выбирает хранилище для очередного чтения.
+
+        Returns:
+            CarService: Реплика, если есть достаточно свежая, иначе основное хранилище.
+        """
+        head = self.primary.feed.last()
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[next(self.turn) % len(self.replicas)]
+            if not replica.synced():
+                continue
+            if self.max_lag is None or head - replica.applied_seq <= self.max_lag:
+                return replica.service
+        return self.primary
+
+    def write(self, method: str, *args):
+        result = getattr(self.primary, method)(*args)
+        if self.sync_writes:
+            self.sync()
+        return result
+
+    def add_model(self, model: Model) -> Model:
+        return self.write('add_model', model)
+
+    def add_car(self, car: Car) -> Car:
+        return self.write('add_car', car)
+
+    def add_models(self, models: list[Model]) -> list[Model]:
+        return self.write('add_models', models)
+
+    def add_cars(self, cars: list[Car]) -> list[Car]:
+        return self.write('add_cars', cars)
+
+    def sell_car(self, sale: Sale) -> Car:
+        return self.write('sell_car', sale)
+
+    def update_vin(self, vin: str, new_vin: str) -> Car:
+        return self.write('update_vin', vin, new_vin)
+
+    def revert_sale(self, sales_number: str) -> Car:
+        return self.write('revert_sale', sales_number)
+
+    def remove_car(self, vin: str) -> Car:
+        return self.write('remove_car', vin)
+
+    def import_snapshot(self, path: str) -> int:
+        return self.write('import_snapshot', path)
+
+    def bulk_load(self, rows) -> int:
+        # Полная загрузка не пишется в журнал, поэтому реплики копируются заново.
+        count = self.primary.bulk_load(rows)
+        with self.sync_lock:
+            for replica in self.replicas:
+                resync(self.primary, replica)
+        return count
+
+    def get_cars(self, status: CarStatus) -> list[Car]:
+        return self.route().get_cars(status)
+
+    def get_car_info(self, vin: str) -> CarFullInfo | None:
+        return self.route().get_car_info(vin)
+
+    def get_car_infos(self, vins: list[str]) -> list[CarFullInfo | None]:
+        return self.route().get_car_infos(vins)
+
+    def top_models_by_sales(self, since: datetime | None = None,
+                            until: datetime | None = None) -> list[ModelSaleStats]:
+        return self.route().top_models_by_sales(since, until)
+
+    def sales_between(self, start: datetime, end: datetime) -> list[Sale]:
+        return self.route().sales_between(start, end)
@@ -0,0 +1,355 @@
+import argparse
+import os
+import shutil
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from bibip_car_service import CarService, TABLES
+from models import Car, CarFullInfo, CarStatus, Model, ModelSaleStats, Sale
+from my_exceptions import CarNotFoundError, ShardCountMismatchError
+from auxiliary_functions import functions as fn
+
+# Файл с числом шардов в корне хранилища.
+SHARDS_FILE = 'shards.txt'
+DEFAULT_SHARD_COUNT = 4
+
+
+def shard_for(vin: str, shard_count: int) -> int:
+    """
+    Функция возвращает номер шарда для VIN.
+    Используется crc32, чтобы номер не зависел от запуска интерпретатора.
+
+    Args:
+        vin(str): VIN машины.
+        shard_count(int): Количество шардов.
+    Returns:
+        int: Номер шарда.
+    """
+    return zlib.crc32(vin.encode('utf-8')) % shard_count
+
+
+def shard_path(root_directory_path: str, number: int) -> str:
+    return os.path.join(root_directory_path, f'shard_{number:03d}')
+
+
+def read_shard_count(root_directory_path: str) -> int | None:
+    """
+    Функция читает сохранённое число шардов.
+
+    Args:
+        root_directory_path(str): Корень хранилища.
+    Returns:
+        int: Число шардов.
+        None: Если хранилище ещё не создано.
+    """
+    try:
+        with open(os.path.join(root_directory_path, SHARDS_FILE), 'r', encoding='utf-8') as f:
+            return int(f.read().strip())
+    except FileNotFoundError:
+        return None
+
+
+def write_shard_count(root_directory_path: str, shard_count: int) -> None:
+    path = os.path.join(root_directory_path, SHARDS_FILE)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(f'{shard_count}\n')
+    os.replace(path + '.tmp', path)
+
+
+class ShardedCarService:
+    """
+    Хранилище, разбитое на шарды по VIN.
+
+    Каждый шард - отдельная директория с обычным CarService.
+    Машины и продажи лежат в шарде своего VIN, модели копируются во все шарды.
+    Точечные операции идут в один шард, списки и рейтинги
+    собираются параллельно со всех шардов. Остальные именованные
+    аргументы передаются в CarService каждого шарда.
+    """
+    def __init__(self, root_directory_path: str, shard_count: int | None = None, **options) -> None:
+        self.root_directory_path = root_directory_path
+        stored = read_shard_count(root_directory_path)
+        if stored is None:
+            self.shard_count = shard_count or DEFAULT_SHARD_COUNT
+            os.makedirs(root_directory_path, exist_ok=True)
+            write_shard_count(root_directory_path, self.shard_count)
+        elif shard_count is not None and shard_count != stored:
+            raise ShardCountMismatchError
+        else:
+            self.shard_count = stored
+
+        self.shards = list()
+        for number in range(self.shard_count):
+            os.makedirs(shard_path(root_directory_path, number), exist_ok=True)
+            self.shards.append(CarService(shard_path(root_directory_path, number), **options))
+        self.pool = ThreadPoolExecutor(max_workers=self.shard_count)
+
+    def shard(self, vin: str) -> CarService:
+        """
+        Функция возвращает шард, в котором хранится машина.
+
+        Args:
+            vin(str): VIN машины.
+        Returns:
+            CarService: Шард.
+        """
+        return self.shards[shard_for(vin, self.shard_count)]
+
+    def scatter(self, method: str, *args) -> list:
+        """
+        Функция параллельно вызывает метод на всех шардах.
+
+        Args:
+            method(str): Имя метода CarService.
+        Returns:
+            list: Результаты в порядке шардов.
+        """
+        futures = [self.pool.submit(getattr(shard, method), *args) for shard in self.shards]
+        return [future.result() for future in futures]
+
+    def close(self) -> None:
+        """
+        Функция останавливает пул потоков для запросов к шардам.
+        """
+        self.pool.shutdown()
+
+    def add_model(self, model: Model) -> Model:
+        """
+        Функция добавляет модель во все шарды.
+
+        Args:
+            model(Model): Добавляемая модель.
+        Returns:
+            Model: Добавленная модель.
+        """
+        # Модели нужны в каждом шарде для get_car_info.
+        for shard in self.shards:
+            shard.add_model(model)
+        return model
+
+    def add_car(self, car: Car) -> Car:
+        """
+        Функция добавляет машину в шард её VIN.
+
+        Args:
+            car(Car): Добавляемая машина.
+        Returns:
+            Car: Добавленная машина.
+        """
+        return self.shard(car.vin).add_car(car)
+
+    def sell_car(self, sale: Sale) -> Car:
+        """
+        Функция записывает продажу в шард проданной машины.
+
+        Args:
+            sale(Sale): Продажа.
+        Returns:
+            Car: Проданная машина.
+        """
+        return self.shard(sale.car_vin).sell_car(sale)
+
+    def get_cars(self, status: CarStatus) -> list[Car]:
+        """
+        Функция собирает машины с нужным статусом со всех шардов.
+
+        Args:
+            status(CarStatus): Искомый статус.
+        Returns:
+            list[Car]: Машины в порядке шардов.
+        """
+        result = list()
+        for cars in self.scatter('get_cars', status):
+            result.extend(cars)
+        return result
+
+    def get_car_info(self, vin: str) -> CarFullInfo | None:
+        """
+        Функция возвращает информацию о машине из шарда её VIN.
+
+        Args:
+            vin(str): VIN машины.
+        Returns:
+            CarFullInfo: Информация о машине.
+            None: Если машины нет.
+        """
+        return self.shard(vin).get_car_info(vin)
+
+    def get_car_infos(self, vins: list[str]) -> list[CarFullInfo | None]:
+        """
+        Функция возвращает информацию о пачке машин, опрашивая шарды параллельно.
+
+        Args:
+            vins(list[str]): VIN машин.
+        Returns:
+            list[CarFullInfo | None]: Информация в порядке vins, None для ненайденных.
+        """
+        # Раскладываем VIN по шардам и запрашиваем шарды параллельно.
+        groups = dict()
+        for vin in set(vins):
+            groups.setdefault(shard_for(vin, self.shard_count), list()).append(vin)
+        futures = {
+            number: self.pool.submit(self.shards[number].get_car_infos, group)
+            for number, group in groups.items()
+        }
+        infos = dict()
+        for number, future in futures.items():
+            infos.update(zip(groups[number], future.result()))
+        return [infos[vin] for vin in vins]
+
+    def update_vin(self, vin: str, new_vin: str) -> Car:
+        """
+        Функция меняет VIN машины.
+        Если новый VIN попадает в другой шард, машина переносится в него.
+        Машину с продажей так перенести нельзя: продажа остаётся
+        в шарде VIN из её номера, и отмена продажи её не найдёт.
+
+        Args:
+            vin(str): VIN старой машины.
+            new_vin(str): VIN на который нужно поменять.
+        Returns:
+            Car: Возвращает измененный обьект.
+        """
+        old_shard = self.shard(vin)
+        new_shard = self.shard(new_vin)
+        if old_shard is new_shard:
+            return old_shard.update_vin(vin, new_vin)
+
+        number_line_car = old_shard.find_line('cars', vin)
+        if number_line_car is None:
+            print(str(CarNotFoundError()))
+            raise CarNotFoundError
+        if old_shard.find_sale_by_vin(vin) is not None:
+            print(f'Ошибка: у машины {vin} есть продажа, VIN из другого шарда не подходит')
+            raise ValueError(f'Машину {vin} с продажей нельзя перенести в другой шард')
+        car = fn.create_car_object(fn.read_line(old_shard.paths['cars.txt'], number_line_car))
+        moved = Car(**{**car.model_dump(), 'vin': new_vin})
+
+        # Сначала пишем в новый шард, чтобы машина не потерялась при сбое.
+        new_shard.add_car(moved)
+        old_shard.remove_car(vin)
+        return moved
+
+    def revert_sale(self, sales_number: str) -> Car:
+        """
+        Функция отменяет продажу в шарде машины из номера продажи.
+
+        Args:
+            sales_number(str): Номер продажи вида 'дата#VIN'.
+        Returns:
+            Car: Машина, снова доступная для продажи.
+        """
+        # Номер продажи имеет вид 'дата#VIN'.
+        vin = sales_number.split('#')[1]
+        return self.shard(vin).revert_sale(sales_number)
+
+    def top_models_by_sales(self, since: datetime | None = None,
+                            until: datetime | None = None) -> list[ModelSaleStats]:
+        """
+        Функция возвращает три самые продаваемые модели за период [since, until)
+        по продажам всех шардов.
+
+        Args:
+            since(datetime): Начало периода, включительно.
+            until(datetime): Конец периода, не включительно.
+        Returns:
+            list[ModelSaleStats]: Модели с количеством продаж.
+        """
+        # Складываем продажи моделей со всех шардов и сортируем вместе.
+        totals = dict()
+        for shard_totals in self.scatter('model_sales_totals', since, until):
+            for model_id, (count, price) in shard_totals.items():
+                if model_id not in totals:
+                    totals[model_id] = [count, price]
+                else:
+                    totals[model_id][0] += count
+                    totals[model_id][1] = max(totals[model_id][1], price)
+        return self.shards[0].top_models_from_totals(totals)
+
+    def sales_between(self, start: datetime, end: datetime) -> list[Sale]:
+        """
+        Функция собирает продажи за период [start, end) со всех шардов.
+
+        Args:
+            start(datetime): Начало периода, включительно.
+            end(datetime): Конец периода, не включительно.
+        Returns:
+            list[Sale]: Продажи, отсортированные по дате.
+        """
+        result = list()
+        for sales in self.scatter('sales_between', start, end):
+            result.extend(sales)
+        result.sort(key=lambda sale: sale.sales_date)
+        return result
+
+
+def rebalance(root_directory_path: str, new_shard_count: int) -> int:
+    """
+    Офлайн перебалансировка: строки всех шардов раскладываются
+    по новому числу шардов. Новые шарды собираются рядом и
+    подменяют старые только после полной записи.
+    Во время перебалансировки хранилище нельзя использовать.
+
+    Args:
+        root_directory_path(str): Корень хранилища.
+        new_shard_count(int): Новое число шардов.
+    Returns:
+        int: Количество перенесённых строк.
+    """
+    old_count = read_shard_count(root_directory_path)
+    if old_count is None:
+        raise FileNotFoundError(os.path.join(root_directory_path, SHARDS_FILE))
+
+    old_paths = [shard_path(root_directory_path, number) for number in range(old_count)]
+    staging = os.path.join(root_directory_path, 'rebalance_new')
+    shutil.rmtree(staging, ignore_errors=True)
+
+    old_shards = [CarService(path, change_feed=False) for path in old_paths]
+    # Новые шарды хранят продажи так же, как старые.
+    partitioned = old_shards[0].partitions is not None
+
+    def sale_rows(shard: CarService):
+        for partition in shard.sale_partitions():
+            yield from partition.iter_rows()
+
+    def rows_for(number: int):
+        # Модели одинаковы во всех шардах, берём из первого.
+        models_txt = os.path.join(old_paths[0], TABLES['models'][0])
+        for row in fn.iter_rows(models_txt):
+            yield 'models', row
+        for table in ('cars', 'sales'):
+            for shard in old_shards:
+                rows = fn.iter_rows(shard.paths['cars.txt']) if table == 'cars' else sale_rows(shard)
+                for row in rows:
+                    fields = row.split(';')
+                    # У машины VIN первое поле, у продажи - второе.
+                    vin = fields[0] if table == 'cars' else fields[1]
+                    if shard_for(vin, new_shard_count) == number:
+                        yield table, row
+
+    count = 0
+    for number in range(new_shard_count):
+        path = shard_path(staging, number)
+        os.makedirs(path)
+        count += CarService(path, sales_partitions=partitioned).bulk_load(rows_for(number))
+
+    # Подменяем шарды.
+    retired = os.path.join(root_directory_path, 'rebalance_old')
+    shutil.rmtree(retired, ignore_errors=True)
+    os.makedirs(retired)
+    for path in old_paths:
+        os.replace(path, os.path.join(retired, os.path.basename(path)))
+    for number in range(new_shard_count):
+        os.replace(shard_path(staging, number), shard_path(root_directory_path, number))
+    write_shard_count(root_directory_path, new_shard_count)
+    shutil.rmtree(staging)
+    shutil.rmtree(retired)
+    return count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Офлайн перебалансировка шардов хранилища.')
+    parser.add_argument('root', help='Корень шардированного хранилища.')
+    parser.add_argument('shards', type=int, help='Новое число шардов.')
+    args = parser.parse_args()
+    print(f'Перенесено строк: {rebalance(args.root, args.shards)}')
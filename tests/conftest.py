@@ -1,10 +1,13 @@
 import os
 import tempfile
 from datetime import UTC, datetime
+from decimal import Decimal
 from uuid import uuid4
 
 import pytest
 
+from models import Car, CarStatus, Model
+
 
 @pytest.fixture
 def tmp_dir_root() -> str:
@@ -24,3 +27,97 @@ def run_id() -> str:
 @pytest.fixture
 def tmpdir(run_id: str, tmp_dir_root: str) -> str:
     return tempfile.mkdtemp(prefix=f"{run_id}", dir=tmp_dir_root)
+
+
+@pytest.fixture
+def car_data():
+    return [
+        Car(
+            vin="KNAGM4A77D5316538",
+            model=1,
+            price=Decimal("2000"),
+            date_start=datetime(2024, 2, 8),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="5XYPH4A10GG021831",
+            model=2,
+            price=Decimal("2300"),
+            date_start=datetime(2024, 2, 20),
+            status=CarStatus.reserve,
+        ),
+        Car(
+            vin="KNAGH4A48A5414970",
+            model=1,
+            price=Decimal("2100"),
+            date_start=datetime(2024, 4, 4),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="JM1BL1TFXD1734246",
+            model=3,
+            price=Decimal("2276.65"),
+            date_start=datetime(2024, 5, 17),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="JM1BL1M58C1614725",
+            model=3,
+            price=Decimal("2549.10"),
+            date_start=datetime(2024, 5, 17),
+            status=CarStatus.reserve,
+        ),
+        Car(
+            vin="KNAGR4A63D5359556",
+            model=1,
+            price=Decimal("2376"),
+            date_start=datetime(2024, 5, 17),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="5N1CR2MN9EC641864",
+            model=4,
+            price=Decimal("3100"),
+            date_start=datetime(2024, 6, 1),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="JM1BL1L83C1660152",
+            model=3,
+            price=Decimal("2635.17"),
+            date_start=datetime(2024, 6, 1),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="5N1CR2TS0HW037674",
+            model=4,
+            price=Decimal("3100"),
+            date_start=datetime(2024, 6, 1),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="5N1AR2MM4DC605884",
+            model=4,
+            price=Decimal("3200"),
+            date_start=datetime(2024, 7, 15),
+            status=CarStatus.available,
+        ),
+        Car(
+            vin="VF1LZL2T4BC242298",
+            model=5,
+            price=Decimal("2280.76"),
+            date_start=datetime(2024, 8, 31),
+            status=CarStatus.delivery,
+        ),
+    ]
+
+
+@pytest.fixture
+def model_data():
+    return [
+        Model(id=1, name="Optima", brand="Kia"),
+        Model(id=2, name="Sorento", brand="Kia"),
+        Model(id=3, name="3", brand="Mazda"),
+        Model(id=4, name="Pathfinder", brand="Nissan"),
+        Model(id=5, name="Logan", brand="Renault"),
+    ]
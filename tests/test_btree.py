@@ -0,0 +1,36 @@
+import os
+import random
+
+from auxiliary_functions.btree import BTreeIndex
+
+
+def test_btree_splits_deletes_and_bulk_build(tmpdir: str):
+    path = os.path.join(tmpdir, "cars_index.btree")
+    index = BTreeIndex(path, cache_pages=4, page_size=512)
+    rnd = random.Random(42)
+    keys = [f"VIN{rnd.randrange(10 ** 14):014d}" for _ in range(3000)]
+
+    expected = dict()
+    for line, key in enumerate(keys):
+        index.insert(key, line)
+        expected.setdefault(key, line)
+    assert index.stats()["pages"] > 10
+    assert all(index.find(key) == line for key, line in expected.items())
+    assert list(index.items()) == sorted(expected.items())
+
+    for key in keys[::3]:
+        index.delete(key)
+        expected.pop(key, None)
+    assert index.find(keys[0]) is None
+    assert index.rename(keys[1], "AAA00000000000000")
+    expected["AAA00000000000000"] = expected.pop(keys[1])
+    # Переименование в существующий ключ не теряет запись.
+    assert not index.rename(keys[2], "AAA00000000000000")
+    assert index.find(keys[2]) == expected[keys[2]]
+
+    # Другой экземпляр видит изменения и может перестроить дерево.
+    other = BTreeIndex(path)
+    assert list(other.items()) == sorted(expected.items())
+    other.bulk_build(sorted(expected.items()))
+    assert index.find("AAA00000000000000") == expected["AAA00000000000000"]
+    assert index.find_many(list(expected)[:50]) == dict(list(expected.items())[:50])
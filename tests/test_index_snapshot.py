@@ -0,0 +1,111 @@
+import os
+import random
+import threading
+
+import pytest
+
+from auxiliary_functions import functions as fn
+from auxiliary_functions.indexes import TextIndex
+
+
+def test_text_index_snapshot(tmpdir: str):
+    path = os.path.join(tmpdir, "cars_index.txt")
+    rnd = random.Random(7)
+    keys = sorted({f"VIN{rnd.randrange(10 ** 14):014d}" for _ in range(2000)})
+    fn.write_index(path, [(key, line) for line, key in enumerate(keys)])
+
+    index = TextIndex(path)
+    assert index.find(keys[10]) == 10
+    assert index.find("UNKNOWN") is None
+    assert index.find("VIN" + "9" * 30) is None
+    snap_path = os.path.join(tmpdir, "cars_index.snap")
+    assert os.path.exists(snap_path)
+    assert index.snapshot.verify()
+
+    # Второй экземпляр открывает готовый снапшот без пересборки.
+    other = TextIndex(path)
+    assert other.find(keys[-1]) == len(keys) - 1
+    assert other.stats()["snapshot_rebuilds"] == 0
+
+    # Изменения индекса ложатся слоем поверх снапшота.
+    assert index.rename(keys[0], "AAA")
+    index.insert("ZZZ", 5000)
+    assert index.find("AAA") == 0
+    assert index.find(keys[0]) is None
+    assert index.find_many(["ZZZ", keys[1], "NONE"]) == {"ZZZ": 5000, keys[1]: 1}
+
+    # Другой экземпляр замечает изменение txt файла.
+    assert other.find("ZZZ") == 5000
+
+    # Повреждённый заголовок - снапшот собирается заново.
+    index.close()
+    other.close()
+    with open(snap_path, "r+b") as f:
+        f.write(b"XXXX")
+    assert TextIndex(path).find("AAA") == 0
+
+    # Без индекс файла поиск ведёт себя как раньше.
+    missing = TextIndex(os.path.join(tmpdir, "sales_index.txt"))
+    with pytest.raises(FileNotFoundError):
+        missing.find("x")
+
+
+def test_text_index_overlay(tmpdir: str):
+    path = os.path.join(tmpdir, "cars_index.txt")
+    keys = [f"VIN{i:014d}" for i in range(0, 4000, 2)]
+    fn.write_index(path, [(key, line) for line, key in enumerate(keys)])
+    index = TextIndex(path)
+    assert index.find(keys[0]) == 0
+
+    # Запись не заставляет следующий поиск пересобирать снапшот.
+    index.insert(keys[5], 9000)
+    index.insert_many([("VIN00000000000001", 9001), ("VIN00000000000001", 9002)])
+    assert index.rename(keys[3], "VIN00000000000003")
+    assert index.rename(keys[7], keys[8])
+    assert index.delete(keys[9])
+    assert index.stats()["snapshot_rebuilds"] == 1
+    assert index.stats()["overlay_keys"] > 0
+
+    # Слой отвечает так же, как полный разбор txt файла.
+    fresh = TextIndex(path, snapshot=False)
+    for key in keys[:12] + ["VIN00000000000001", "VIN00000000000003"]:
+        assert index.find(key) == fresh.find(key)
+
+
+def test_text_index_concurrent_readers(tmpdir: str):
+    path = os.path.join(tmpdir, "cars_index.txt")
+    keys = [f"VIN{i:014d}" for i in range(3000)]
+    fn.write_index(path, [(key, line) for line, key in enumerate(keys)])
+    index = TextIndex(path)
+    errors = list()
+    done = threading.Event()
+
+    def read():
+        rnd = random.Random()
+        try:
+            while not done.is_set():
+                i = rnd.randrange(len(keys))
+                # Исходные ключи не меняются, поэтому ответ всегда известен.
+                assert index.find(keys[i]) == i
+                assert index.find_many([keys[i], "NONE"]) == {keys[i]: i}
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    try:
+        for i in range(200):
+            index.insert(f"NEW{i:04d}", 5000 + i)
+            if i % 3 == 0:
+                assert index.rename(f"NEW{i:04d}", f"OLD{i:04d}")
+            if i % 50 == 0:
+                index.bulk_build(index.items())
+    finally:
+        done.set()
+        for reader in readers:
+            reader.join()
+
+    assert errors == []
+    assert index.find("NEW0001") == 5001
+    assert index.find("OLD0003") == 5003 and index.find("NEW0003") is None
@@ -0,0 +1,33 @@
+import os
+
+from bibip.loadtest import check_invariants, read_events, replay, run_load
+from bibip_car_service import CarService
+from models import CarStatus
+
+
+def test_load_record_and_replay(tmpdir: str):
+    root = os.path.join(tmpdir, "load")
+    log = os.path.join(tmpdir, "load.log")
+    os.makedirs(root)
+    report = run_load(root, ops=400, workers=3, seed=7, record=log)
+
+    assert report["total"] >= 400
+    assert sum(row["errors"] for row in report["operations"].values()) == 0
+    assert set(report["operations"]) >= {"add_car", "sell_car", "get_car_info"}
+    assert sum(report["timeline"]) == report["total"]
+    assert check_invariants(root) == []
+
+    # Записанные операции воспроизводят то же хранилище.
+    copy = os.path.join(tmpdir, "copy")
+    os.makedirs(copy)
+    replay(read_events(log), copy)
+    assert check_invariants(copy) == []
+    for status in (CarStatus.available, CarStatus.sold):
+        assert CarService(copy).get_cars(status) == CarService(root).get_cars(status)
+
+    # Испорченный индекс находится проверкой.
+    service = CarService(root)
+    vin = service.get_cars(CarStatus.sold)[0].vin
+    service.index("cars").delete(vin)
+    problems = check_invariants(root)
+    assert len(problems) == 1 and vin in problems[0]
@@ -0,0 +1,139 @@
+import os
+import threading
+from datetime import datetime
+from decimal import Decimal
+
+from replicated_car_service import Follower, ReplicatedCarService
+from bibip_car_service import CarService
+from models import CarStatus, Sale
+
+
+def _sale(vin: str, day: int, cost: str) -> Sale:
+    return Sale(
+        sales_number=f"2024090{day}#{vin}",
+        car_vin=vin,
+        sales_date=datetime(2024, 9, day),
+        cost=Decimal(cost),
+    )
+
+
+def _state(service) -> tuple:
+    return (
+        [service.get_cars(status) for status in CarStatus],
+        service.top_models_by_sales(),
+        service.sales_between(datetime(2024, 1, 1), datetime(2025, 1, 1)),
+    )
+
+
+def test_replicas_follow_primary(tmpdir: str, car_data, model_data):
+    replicas = [f"{tmpdir}/replica_{i}" for i in range(2)]
+
+    # Данные, записанные до появления реплик, копируются при первой синхронизации.
+    seed = CarService(f"{tmpdir}/primary")
+    os.makedirs(seed.root_directory_path)
+    for model in model_data:
+        seed.add_model(model)
+    seed.add_cars(car_data[:5])
+
+    service = ReplicatedCarService(f"{tmpdir}/primary", replicas)
+    service.sync()
+    service.add_cars(car_data[5:])
+    service.sell_car(_sale("KNAGM4A77D5316538", 3, "1999.09"))
+    service.sell_car(_sale("JM1BL1M58C1614725", 5, "2334"))
+    service.update_vin("KNAGH4A48A5414970", "KNAGH4A48A5414971")
+    service.revert_sale("20240905#JM1BL1M58C1614725")
+    service.remove_car("5N1CR2TS0HW037674")
+
+    expected = _state(service.primary)
+    for replica in service.replicas:
+        assert _state(replica.service) == expected
+    assert all(status["lag_events"] == 0 for status in service.replication_status())
+
+    # Чтения раздаются репликам по кругу.
+    assert [service.route() for _ in range(4)] == [replica.service for replica in service.replicas] * 2
+    assert service.get_car_info("KNAGM4A77D5316538") == service.primary.get_car_info("KNAGM4A77D5316538")
+
+
+def test_replica_lag(tmpdir: str, car_data, model_data):
+    service = ReplicatedCarService(f"{tmpdir}/primary", [f"{tmpdir}/replica"], sync_writes=False)
+    for model in model_data:
+        service.add_model(model)
+    service.sync()
+    service.add_car(car_data[0])
+    service.add_car(car_data[1])
+
+    status = service.replication_status()[0]
+    assert status["lag_events"] == 2 and status["shipped_seq"] == status["applied_seq"]
+    assert status["lag_seconds"] >= 0
+    # Отставшая реплика не читается, пока не догонит.
+    assert service.route() is service.primary
+    assert service.replicas[0].service.get_car_info(car_data[0].vin) is None
+    assert service.get_car_info(car_data[0].vin) is not None
+
+    service.sync()
+    assert service.replication_status()[0]["lag_events"] == 0
+    assert service.route() is service.replicas[0].service
+
+    # После перезапуска реплика продолжает с сохранённой позиции.
+    service.add_car(car_data[2])
+    service.sync()
+    restarted = Follower(f"{tmpdir}/replica")
+    assert restarted.applied_seq == service.primary.feed.last()
+    assert _state(restarted.service) == _state(service.primary)
+
+
+def test_diverged_replica_is_resynced(tmpdir: str, car_data, model_data):
+    service = ReplicatedCarService(f"{tmpdir}/primary", [f"{tmpdir}/replica"])
+    for model in model_data:
+        service.add_model(model)
+    service.add_cars(car_data)
+
+    # Машину удалили прямо на реплике, продажа с основного хранилища на ней не применится.
+    replica = service.replicas[0]
+    replica.service.remove_car("KNAGM4A77D5316538")
+    service.sell_car(_sale("KNAGM4A77D5316538", 3, "1999.09"))
+
+    assert _state(replica.service) == _state(service.primary)
+    assert replica.applied_seq == service.primary.feed.last()
+
+
+def test_concurrent_writes_and_reads(tmpdir: str, car_data, model_data):
+    service = ReplicatedCarService(f"{tmpdir}/primary", [f"{tmpdir}/replica_{i}" for i in range(2)])
+    for model in model_data:
+        service.add_model(model)
+    errors = []
+    done = threading.Event()
+
+    def write(cars):
+        try:
+            for car in cars:
+                service.add_car(car)
+        except Exception as e:
+            errors.append(e)
+
+    def read():
+        try:
+            while not done.is_set():
+                service.route().get_cars(CarStatus.available)
+                service.replication_status()
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    writers = [threading.Thread(target=write, args=(car_data[i::2],)) for i in range(2)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    # Номера событий не повторяются и идут подряд.
+    seqs = [event["seq"] for event in service.primary.changes_since(0)]
+    assert seqs == list(range(1, len(model_data) + len(car_data) + 1))
+    service.sync()
+    for replica in service.replicas:
+        assert replica.applied_seq == seqs[-1]
+        assert _state(replica.service) == _state(service.primary)
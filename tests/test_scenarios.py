@@ -1,104 +1,15 @@
+import json
+import os
+import tempfile
 from datetime import datetime
 from decimal import Decimal
 
 import pytest
 
+from auxiliary_functions.profiling import Profiler
 from bibip_car_service import CarService
 from models import Car, CarFullInfo, CarStatus, Model, ModelSaleStats, Sale
-
-
-@pytest.fixture
-def car_data():
-    return [
-        Car(
-            vin="KNAGM4A77D5316538",
-            model=1,
-            price=Decimal("2000"),
-            date_start=datetime(2024, 2, 8),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="5XYPH4A10GG021831",
-            model=2,
-            price=Decimal("2300"),
-            date_start=datetime(2024, 2, 20),
-            status=CarStatus.reserve,
-        ),
-        Car(
-            vin="KNAGH4A48A5414970",
-            model=1,
-            price=Decimal("2100"),
-            date_start=datetime(2024, 4, 4),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="JM1BL1TFXD1734246",
-            model=3,
-            price=Decimal("2276.65"),
-            date_start=datetime(2024, 5, 17),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="JM1BL1M58C1614725",
-            model=3,
-            price=Decimal("2549.10"),
-            date_start=datetime(2024, 5, 17),
-            status=CarStatus.reserve,
-        ),
-        Car(
-            vin="KNAGR4A63D5359556",
-            model=1,
-            price=Decimal("2376"),
-            date_start=datetime(2024, 5, 17),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="5N1CR2MN9EC641864",
-            model=4,
-            price=Decimal("3100"),
-            date_start=datetime(2024, 6, 1),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="JM1BL1L83C1660152",
-            model=3,
-            price=Decimal("2635.17"),
-            date_start=datetime(2024, 6, 1),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="5N1CR2TS0HW037674",
-            model=4,
-            price=Decimal("3100"),
-            date_start=datetime(2024, 6, 1),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="5N1AR2MM4DC605884",
-            model=4,
-            price=Decimal("3200"),
-            date_start=datetime(2024, 7, 15),
-            status=CarStatus.available,
-        ),
-        Car(
-            vin="VF1LZL2T4BC242298",
-            model=5,
-            price=Decimal("2280.76"),
-            date_start=datetime(2024, 8, 31),
-            status=CarStatus.delivery,
-        ),
-    ]
-
-
-@pytest.fixture
-def model_data():
-    return [
-        Model(id=1, name="Optima", brand="Kia"),
-        Model(id=2, name="Sorento", brand="Kia"),
-        Model(id=3, name="3", brand="Mazda"),
-        Model(id=4, name="Pathfinder", brand="Nissan"),
-        Model(id=5, name="Logan", brand="Renault"),
-    ]
+from my_exceptions import CarNotFoundError, IndexBackendMismatchError, SnapshotFormatError
 
 
 class TestCarServiceScenarios:
@@ -290,3 +201,544 @@ class TestCarServiceScenarios:
             ModelSaleStats(car_model_name="Pathfinder", brand="Nissan", sales_number=1),
         ]
         assert service.top_models_by_sales() == top_3_models
+
+    def test_snapshot_export_import(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir)
+
+        self._fill_initial_data(service, car_data, model_data)
+
+        sales = [
+            Sale(
+                sales_number="20240903#KNAGM4A77D5316538",
+                car_vin="KNAGM4A77D5316538",
+                sales_date=datetime(2024, 9, 3),
+                cost=Decimal("2999.99"),
+            ),
+            Sale(
+                sales_number="20240904#JM1BL1TFXD1734246",
+                car_vin="JM1BL1TFXD1734246",
+                sales_date=datetime(2024, 9, 4),
+                cost=Decimal("2100"),
+            ),
+        ]
+        for sale in sales:
+            service.sell_car(sale)
+        service.revert_sale("20240904#JM1BL1TFXD1734246")
+
+        snapshot_path = os.path.join(tmpdir, "backup.snap")
+        assert service.export_snapshot(snapshot_path) == len(model_data) + len(car_data) + 1
+
+        restored = CarService(tempfile.mkdtemp(dir=tmpdir))
+        assert restored.import_snapshot(snapshot_path) == len(model_data) + len(car_data) + 1
+
+        assert restored.get_cars(CarStatus.available) == service.get_cars(CarStatus.available)
+        for car in car_data:
+            assert restored.get_car_info(car.vin) == service.get_car_info(car.vin)
+        assert restored.top_models_by_sales() == service.top_models_by_sales()
+
+    def test_snapshot_corrupt_import(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        source = CarService(tempfile.mkdtemp(dir=tmpdir))
+        for model in model_data:
+            source.add_model(model)
+        source.add_cars([
+            Car(**{**car_data[i % len(car_data)].model_dump(), "vin": f"BULK{i:013d}"}) for i in range(3000)
+        ])
+        snapshot_path = os.path.join(tmpdir, "backup.snap")
+        source.export_snapshot(snapshot_path)
+        # Обрезаем снапшот наполовину.
+        with open(snapshot_path, "r+b") as f:
+            f.truncate(os.path.getsize(snapshot_path) // 2)
+
+        service = CarService(tempfile.mkdtemp(dir=tmpdir))
+        self._fill_initial_data(service, car_data, model_data)
+        before = [service.get_cars(status) for status in CarStatus]
+        stats = service.stats()
+
+        with pytest.raises(SnapshotFormatError):
+            service.import_snapshot(snapshot_path)
+
+        # Хранилище не изменилось, временных файлов не осталось.
+        assert [service.get_cars(status) for status in CarStatus] == before
+        assert [CarService(service.root_directory_path).get_car_info(car.vin) for car in car_data] == \
+            [service.get_car_info(car.vin) for car in car_data]
+        assert service.stats()["cars_by_status"] == stats["cars_by_status"]
+        assert not [name for name in os.listdir(service.root_directory_path) if name.startswith("bulk_load_")]
+
+    def test_bloom_filter_negative_lookups(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir, bloom_fp_rate=0.001)
+
+        self._fill_initial_data(service, car_data, model_data)
+
+        service.sell_car(
+            Sale(
+                sales_number="20240903#JM1BL1M58C1614725",
+                car_vin="JM1BL1M58C1614725",
+                sales_date=datetime(2024, 9, 3),
+                cost=Decimal("2399.99"),
+            )
+        )
+
+        assert service.get_car_info("UNKNOWN0000000000") is None
+        with pytest.raises(CarNotFoundError):
+            service.revert_sale("20240903#UNKNOWN0000000000")
+        with pytest.raises(CarNotFoundError):
+            service.sell_car(
+                Sale(
+                    sales_number="20240903#UNKNOWN0000000000",
+                    car_vin="UNKNOWN0000000000",
+                    sales_date=datetime(2024, 9, 3),
+                    cost=Decimal("1"),
+                )
+            )
+
+        stats = service.bloom_stats()
+        assert stats["cars"]["keys"] == len(car_data)
+        assert stats["cars"]["fp_rate"] == 0.001
+        assert stats["cars"]["negatives"] + stats["sales"]["negatives"] >= 2
+
+        # Фильтр сохраняется на диске и подхватывается новым экземпляром.
+        service.update_vin("KNAGM4A77D5316538", "UPDGM4A77D5316538")
+        reopened = CarService(tmpdir, bloom_fp_rate=0.001)
+        for car in car_data[1:]:
+            assert reopened.bloom("cars").might_contain(car.vin)
+        assert reopened.get_car_info("UPDGM4A77D5316538") is not None
+        assert reopened.bloom_stats()["cars"]["rebuilds"] == 0
+
+    def test_change_feed(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir)
+        service.feed.segment_size = 4
+
+        self._fill_initial_data(service, car_data, model_data)
+
+        events = list(service.changes_since(0))
+        assert [event["seq"] for event in events] == list(range(1, len(model_data) + len(car_data) + 1))
+        assert events[0]["op"] == "add_model"
+        assert Car(**events[len(model_data)]["data"]) == car_data[0]
+
+        last_seq = events[-1]["seq"]
+        sale = Sale(
+            sales_number="20240903#KNAGM4A77D5316538",
+            car_vin="KNAGM4A77D5316538",
+            sales_date=datetime(2024, 9, 3),
+            cost=Decimal("2999.99"),
+        )
+        service.sell_car(sale)
+        service.update_vin("JM1BL1TFXD1734246", "UPDBL1TFXD1734246")
+        service.revert_sale(sale.sales_number)
+
+        new_events = list(CarService(tmpdir).changes_since(last_seq))
+        assert [event["op"] for event in new_events] == ["sell_car", "update_vin", "revert_sale"]
+        assert new_events[1]["data"] == {"vin": "JM1BL1TFXD1734246", "new_vin": "UPDBL1TFXD1734246"}
+
+        # Журнал усекается по минимальной отметке потребителей.
+        segments = len(service.feed.segments())
+        service.ack_changes("bi", 2)
+        service.ack_changes("search", last_seq)
+        assert len(service.feed.segments()) == segments
+        service.ack_changes("bi", last_seq)
+        assert len(service.feed.segments()) < segments
+        assert [event["seq"] for event in service.changes_since(last_seq)] == [e["seq"] for e in new_events]
+
+    def test_btree_index_backend(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        text_service = CarService(os.path.join(tmpdir, "text"))
+        os.makedirs(text_service.root_directory_path)
+        btree_service = CarService(os.path.join(tmpdir, "btree"), index_backend="btree")
+        os.makedirs(btree_service.root_directory_path)
+
+        sale = Sale(
+            sales_number="20240903#KNAGM4A77D5316538",
+            car_vin="KNAGM4A77D5316538",
+            sales_date=datetime(2024, 9, 3),
+            cost=Decimal("2999.99"),
+        )
+        for service in (text_service, btree_service):
+            self._fill_initial_data(service, car_data, model_data)
+            service.sell_car(sale)
+            service.sell_car(
+                Sale(
+                    sales_number="20240904#JM1BL1M58C1614725",
+                    car_vin="JM1BL1M58C1614725",
+                    sales_date=datetime(2024, 9, 4),
+                    cost=Decimal("2500"),
+                )
+            )
+            service.revert_sale("20240904#JM1BL1M58C1614725")
+            service.update_vin("5N1CR2MN9EC641864", "UPDCR2MN9EC641864")
+
+        assert os.path.exists(os.path.join(btree_service.root_directory_path, "cars_index.btree"))
+        vins = [car.vin for car in car_data] + ["UPDCR2MN9EC641864", "UNKNOWN0000000000"]
+        for vin in vins:
+            assert btree_service.get_car_info(vin) == text_service.get_car_info(vin)
+        assert btree_service.top_models_by_sales() == text_service.top_models_by_sales()
+
+        # Существующее хранилище с текстовыми индексами переводится на B+ дерево при открытии.
+        migrated = CarService(text_service.root_directory_path, index_backend="btree")
+        for vin in vins:
+            assert migrated.get_car_info(vin) == text_service.get_car_info(vin)
+        assert list(migrated.index("cars").items()) == list(text_service.index("cars").items())
+
+        # Движок хранится в хранилище: без флага открывается B+ дерево, текстовый движок не пускаем.
+        for root in (btree_service.root_directory_path, text_service.root_directory_path):
+            assert CarService(root).index_backend == "btree"
+            with pytest.raises(IndexBackendMismatchError):
+                CarService(root, index_backend="text")
+        new_car = car_data[0].model_copy(update={"vin": "NEWCAR00000000001"})
+        CarService(btree_service.root_directory_path, change_feed=False).add_car(new_car)
+        assert CarService(btree_service.root_directory_path, index_backend="btree").get_car_info(new_car.vin)
+
+        # Хранилище B+ дерева, созданное до файла с движком, узнаётся по файлам .btree.
+        os.remove(os.path.join(btree_service.root_directory_path, "index_backend.txt"))
+        assert CarService(btree_service.root_directory_path).index_backend == "btree"
+
+        # VIN нельзя поменять на уже занятый.
+        with pytest.raises(ValueError):
+            btree_service.update_vin("UPDCR2MN9EC641864", new_car.vin)
+        assert btree_service.get_car_info(new_car.vin).vin == new_car.vin
+
+    def test_get_car_infos_batch(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir)
+
+        self._fill_initial_data(service, car_data, model_data)
+        service.sell_car(
+            Sale(
+                sales_number="20240903#KNAGM4A77D5316538",
+                car_vin="KNAGM4A77D5316538",
+                sales_date=datetime(2024, 9, 3),
+                cost=Decimal("2999.99"),
+            )
+        )
+
+        vins = ["UNKNOWN0000000000"] + [car.vin for car in reversed(car_data)] + ["KNAGM4A77D5316538"]
+        assert service.get_car_infos(vins) == [service.get_car_info(vin) for vin in vins]
+        assert service.get_car_infos([]) == []
+
+    def test_models_preload(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir)
+
+        self._fill_initial_data(service, car_data, model_data)
+        assert service.models() == {model.id: model for model in model_data}
+
+        # Одинаковые названия и бренды - общие строки во всех результатах.
+        infos = service.get_car_infos([car.vin for car in car_data])
+        same_model = [info for car, info in zip(car_data, infos) if car.model == car_data[0].model]
+        assert len(same_model) > 1
+        assert same_model[0].car_model_name is same_model[1].car_model_name
+
+        # Новая модель видна сразу, без перечитывания файла.
+        service.add_model(Model(id=100, name="Ceed", brand="Kia"))
+        assert service.get_model(100) == Model(id=100, name="Ceed", brand="Kia")
+
+        # Модель, добавленная другим экземпляром, подхватывается по изменению файла.
+        CarService(tmpdir).add_model(Model(id=101, name="Rio", brand="Kia"))
+        assert service.get_model(101) == Model(id=101, name="Rio", brand="Kia")
+        assert service.get_model(999) is None
+
+        # Своя запись после чужой не делает устаревшую таблицу снова верной.
+        other = CarService(tmpdir)
+        other.add_model(Model(id=102, name="Soul", brand="Kia"))
+        other.add_car(car_data[0].model_copy(update={"vin": "W1", "model": 102}))
+        service.add_model(Model(id=103, name="Stinger", brand="Kia"))
+        assert service.get_car_info("W1") == CarService(tmpdir).get_car_info("W1")
+        assert service.get_car_info("W1").car_model_name == "Soul"
+
+    def test_sales_partitions(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        legacy = CarService(os.path.join(tmpdir, "legacy"))
+        service = CarService(os.path.join(tmpdir, "partitioned"), sales_partitions=True)
+        os.makedirs(legacy.root_directory_path)
+        os.makedirs(service.root_directory_path)
+
+        # Продажи за три месяца, по одной на машину.
+        sales = [
+            Sale(
+                sales_number=f"{date:%Y%m%d}#{car.vin}",
+                car_vin=car.vin,
+                sales_date=date,
+                cost=Decimal(1000 + i),
+            )
+            for i, (car, date) in enumerate(zip(car_data[:6], [
+                datetime(2024, 7, 1), datetime(2024, 7, 31, 23), datetime(2024, 8, 1),
+                datetime(2024, 8, 15), datetime(2024, 9, 1), datetime(2024, 9, 2),
+            ]))
+        ]
+        for store in (legacy, service):
+            self._fill_initial_data(store, car_data, model_data)
+            for sale in sales:
+                store.sell_car(sale)
+
+        assert service.partitions.names() == ["2024-07", "2024-08", "2024-09"]
+        assert not os.path.exists(service.paths["sales.txt"])
+        for vin in [car.vin for car in car_data]:
+            assert service.get_car_info(vin) == legacy.get_car_info(vin)
+
+        # Запрос за август открывает только партицию августа.
+        august = (datetime(2024, 8, 1), datetime(2024, 9, 1))
+        assert service.partitions.names(*august) == ["2024-08"]
+        assert service.sales_between(*august) == sales[2:4]
+        assert legacy.sales_between(*august) == sales[2:4]
+        assert service.top_models_by_sales(*august) == legacy.top_models_by_sales(*august)
+        assert service.top_models_by_sales() == legacy.top_models_by_sales()
+
+        # Старые партиции сжимаются, чтение и отмена продажи продолжают работать.
+        assert service.archive_sales(datetime(2024, 9, 10)) == ["2024-07", "2024-08"]
+        assert service.sales_between(datetime(2024, 1, 1), datetime(2025, 1, 1)) == sales
+        assert service.get_car_info(sales[0].car_vin) == legacy.get_car_info(sales[0].car_vin)
+        service.revert_sale(sales[1].sales_number)
+        legacy.revert_sale(sales[1].sales_number)
+        assert service.partitions.names() == ["2024-07", "2024-08", "2024-09"]
+        assert service.get_car_infos([car.vin for car in car_data]) == \
+            legacy.get_car_infos([car.vin for car in car_data])
+
+        # Снапшот раскладывается по партициям обратно.
+        path = os.path.join(tmpdir, "sales.snapshot")
+        service.export_snapshot(path)
+        restored = CarService(os.path.join(tmpdir, "restored"), sales_partitions=True)
+        os.makedirs(restored.root_directory_path)
+        restored.import_snapshot(path)
+        assert restored.partitions.names() == ["2024-07", "2024-08", "2024-09"]
+        assert restored.sales_between(datetime(2024, 1, 1), datetime(2025, 1, 1)) == \
+            legacy.sales_between(datetime(2024, 1, 1), datetime(2025, 1, 1))
+
+        # Хранилище с партициями открывается в этом режиме и без флага.
+        assert CarService(service.root_directory_path).partitions is not None
+
+    def test_legacy_sales_migrated(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        legacy = CarService(tmpdir)
+        self._fill_initial_data(legacy, car_data, model_data)
+        sales = [
+            Sale(
+                sales_number=f"{date:%Y%m%d}#{car.vin}",
+                car_vin=car.vin,
+                sales_date=date,
+                cost=Decimal(1000 + i),
+            )
+            for i, (car, date) in enumerate(zip(car_data[:4], [
+                datetime(2024, 7, 1), datetime(2024, 8, 1), datetime(2024, 8, 15), datetime(2024, 9, 1),
+            ]))
+        ]
+        for sale in sales:
+            legacy.sell_car(sale)
+        legacy.revert_sale(sales[2].sales_number)
+        period = (datetime(2024, 1, 1), datetime(2025, 1, 1))
+        expected = (
+            legacy.get_car_infos([car.vin for car in car_data]),
+            legacy.top_models_by_sales(),
+            legacy.sales_between(*period),
+        )
+
+        # Первое открытие с партициями переносит продажи из sales.txt.
+        service = CarService(tmpdir, sales_partitions=True)
+        assert service.partitions.names() == ["2024-07", "2024-08", "2024-09"]
+        assert not os.path.exists(service.paths["sales.txt"])
+        assert (
+            service.get_car_infos([car.vin for car in car_data]),
+            service.top_models_by_sales(),
+            service.sales_between(*period),
+        ) == expected
+        assert service.stats(recompute=True)["sales"] == 3
+
+        service.revert_sale(sales[1].sales_number)
+        assert service.sales_between(*period) == [sales[0], sales[3]]
+        assert CarService(tmpdir).partitions.names() == ["2024-07", "2024-08", "2024-09"]
+
+    def test_get_cars_cache(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        service = CarService(tmpdir)
+
+        self._fill_initial_data(service, car_data, model_data)
+        available = service.get_cars(CarStatus.available)
+        # Между записями список берется из кеша, но изменения вызывающего в кеш не попадают.
+        assert service.get_cars(CarStatus.available) == available
+        available[0].price = Decimal("1")
+        available[0].status = CarStatus.sold
+        available.pop()
+        assert service.get_cars(CarStatus.available) == CarService(tmpdir).get_cars(CarStatus.available)
+
+        # Записи обновляют кеш построчно, результат совпадает с чтением файла.
+        service.sell_car(
+            Sale(
+                sales_number="20240903#KNAGM4A77D5316538",
+                car_vin="KNAGM4A77D5316538",
+                sales_date=datetime(2024, 9, 3),
+                cost=Decimal("2999.99"),
+            )
+        )
+        service.update_vin("5XYPH4A10GG021831", "UPDPH4A10GG021831")
+        service.add_car(
+            Car(
+                vin="NEWCAR00000000001",
+                model=1,
+                price=Decimal("1000"),
+                date_start=datetime(2024, 9, 1),
+                status=CarStatus.available,
+            )
+        )
+        service.remove_car("JM1BL1M58C1614725")
+        service.revert_sale("20240903#KNAGM4A77D5316538")
+        fresh = CarService(tmpdir)
+        for status in CarStatus:
+            assert service.get_cars(status) == fresh.get_cars(status)
+
+        # Запись другим экземпляром замечается по изменению файла.
+        fresh.add_car(
+            Car(
+                vin="NEWCAR00000000002",
+                model=2,
+                price=Decimal("2000"),
+                date_start=datetime(2024, 9, 2),
+                status=CarStatus.available,
+            )
+        )
+        assert service.get_cars(CarStatus.available) == fresh.get_cars(CarStatus.available)
+
+        # Своя запись после чужой не делает устаревший кеш снова верным.
+        service.get_cars(CarStatus.available)
+        fresh.sell_car(
+            Sale(
+                sales_number="20240905#NEWCAR00000000002",
+                car_vin="NEWCAR00000000002",
+                sales_date=datetime(2024, 9, 5),
+                cost=Decimal("2100"),
+            )
+        )
+        service.add_car(car_data[0].model_copy(update={"vin": "NEWCAR00000000003"}))
+        assert service.get_cars(CarStatus.available) == CarService(tmpdir).get_cars(CarStatus.available)
+        assert "NEWCAR00000000002" not in [car.vin for car in service.get_cars(CarStatus.available)]
+
+    def test_byte_scans(self, tmpdir: str, car_data: list[Car], model_data: list[Model], monkeypatch):
+        import bibip_car_service
+        from auxiliary_functions import functions as fn
+
+        service = CarService(tmpdir)
+        self._fill_initial_data(service, car_data, model_data)
+        for i, car in enumerate(car_data[:5]):
+            service.sell_car(
+                Sale(
+                    sales_number=f"20240903#{car.vin}",
+                    car_vin=car.vin,
+                    sales_date=datetime(2024, 9, 3),
+                    cost=Decimal(1000 + i),
+                )
+            )
+        service.revert_sale(f"20240903#{car_data[0].vin}")
+        service.remove_car(car_data[6].vin)
+
+        # Побайтовый просмотр находит те же строки, что и чтение в текстовом режиме.
+        with open(service.paths["cars.txt"], "r", encoding="utf-8", newline="") as f:
+            rows = [line.strip().split(";") for line in iter(lambda: f.read(501), "")]
+        for status in CarStatus:
+            expected = [(number, row) for number, row in enumerate(rows) if row[-1] == status]
+            assert list(fn.scan_status(service.paths["cars.txt"], status)) == expected
+        assert [number for number, _ in fn.scan_rows(service.paths["sales.txt"])] == [1, 2, 3, 4]
+
+        # Модели проданных машин одинаковы при проходе по файлу и при поиске по индексу.
+        scanned = service.top_models_by_sales()
+        monkeypatch.setattr(bibip_car_service, "SCAN_RATIO", 0)
+        assert service.top_models_by_sales() == scanned
+
+    def test_decode_datetime(self):
+        from auxiliary_functions import functions as fn
+
+        # Даты в файлах - str(datetime), они разбираются через fromisoformat.
+        date = datetime(2024, 9, 3, 7, 5, 9)
+        assert fn.decode_datetime(str(date)) == date
+        assert fn.decode_datetime("2024-09-03 07:05:09.250000") == date.replace(microsecond=250000)
+        # Старые записи без ведущих нулей fromisoformat не принимает, их разбирает strptime.
+        with pytest.raises(ValueError):
+            datetime.fromisoformat("2024-9-3 7:05:09")
+        assert fn.decode_datetime("2024-9-3 7:05:09") == date
+        with pytest.raises(ValueError):
+            fn.decode_datetime("03.09.2024")
+
+    def test_inventory_stats(self, tmpdir: str, car_data: list[Car], model_data: list[Model], monkeypatch):
+        service = CarService(tmpdir)
+        self._fill_initial_data(service, car_data, model_data)
+        for vin, date, cost in [
+            ("KNAGM4A77D5316538", datetime(2024, 9, 3), "1999.09"),
+            ("5XYPH4A10GG021831", datetime(2024, 10, 4), "2100"),
+        ]:
+            service.sell_car(Sale(sales_number=f"{date:%Y%m%d}#{vin}", car_vin=vin, sales_date=date, cost=Decimal(cost)))
+        service.revert_sale("20241004#5XYPH4A10GG021831")
+        service.remove_car("5N1AR2MM4DC605884")
+        service.update_vin("KNAGH4A48A5414970", "KNAGH4A48A5414971")
+
+        stats = service.stats()
+        assert stats["cars"] == 10
+        assert stats["cars_by_status"] == {"available": 7, "delivery": 1, "reserve": 1, "sold": 1}
+        assert (stats["sales"], stats["revenue"]) == (1, Decimal("1999.09"))
+        assert stats["revenue_by_month"] == {"2024-09": Decimal("1999.09")}
+        assert stats["average_price_by_model"][1] == Decimal("2158.67")
+        assert stats["average_price_by_model"][4] == Decimal("3100.00")
+        assert stats["average_price_by_brand"]["Kia"] == Decimal("2194.00")
+        assert stats["inventory"] == 9 and stats["average_age_days"] > 0
+
+        # Полный пересчёт совпадает со счётчиками и не перезаписывает stats.json.
+        with open(service.paths["stats.json"], encoding="utf-8") as f:
+            saved = json.load(f)
+        state = os.stat(service.paths["stats.json"]).st_mtime_ns
+        recomputed = service.stats(recompute=True)
+        assert {**recomputed, "average_age_days": None} == {**stats, "average_age_days": None}
+        assert os.stat(service.paths["stats.json"]).st_mtime_ns == state
+
+        # Испорченные счётчики проверка видит, а repair_stats исправляет.
+        service.counters.sales += 5
+        service.counters.save()
+        assert service.stats()["sales"] == 6 and service.stats(recompute=True)["sales"] == 1
+        assert service.stats()["sales"] == 6
+        assert service.repair_stats()["sales"] == 1
+        with open(service.paths["stats.json"], encoding="utf-8") as f:
+            assert json.load(f) == saved
+
+        # Другой экземпляр берёт сохранённые счётчики, не читая данные.
+        monkeypatch.setattr(CarService, "recount_inventory", lambda self: pytest.fail("пересчёт"))
+        assert CarService(tmpdir).stats()["cars_by_status"] == stats["cars_by_status"]
+        monkeypatch.undo()
+
+        # Хранилище без stats.json считает счётчики при первом обращении.
+        os.remove(service.paths["stats.json"])
+        assert CarService(tmpdir).stats()["revenue"] == Decimal("1999.09")
+
+    def test_profiler(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        profiler = Profiler()
+        service = CarService(tmpdir, profiler=profiler)
+
+        self._fill_initial_data(service, car_data, model_data)
+        service.sell_car(
+            Sale(
+                sales_number="20240903#KNAGM4A77D5316538",
+                car_vin="KNAGM4A77D5316538",
+                sales_date=datetime(2024, 9, 3),
+                cost=Decimal("2999.99"),
+            )
+        )
+        profiler.reset()
+        service.top_models_by_sales()
+
+        stacks = [line.rsplit(" ", 1)[0] for line in profiler.folded_stacks().splitlines()]
+        assert "top_models_by_sales;model_sales_totals;scan sales" in stacks
+        assert "top_models_by_sales;model_sales_totals;CarService.models_of_cars;scan cars;scan_status" in stacks
+        events = profiler.chrome_trace()["traceEvents"]
+        assert {event["name"] for event in events} >= {"top_models_by_sales", "scan sales", "scan_status"}
+        assert all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+        # Вызовы вне выборки не записываются.
+        profiler.reset()
+        profiler.sample_rate = 0.0
+        service.get_car_info("KNAGM4A77D5316538")
+        assert profiler.calls == 1 and profiler.sampled == 0
+        assert profiler.folded_stacks() == ""
+
+    def test_profiler_sampling(self, tmpdir: str, car_data: list[Car], model_data: list[Model]):
+        profiler = Profiler(sample_rate=0.5)
+        service = CarService(tmpdir, profiler=profiler)
+        self._fill_initial_data(service, car_data, model_data)
+        profiler.reset()
+
+        # top_models_by_sales вызывает model_sales_totals, тоже отмеченный @traced.
+        # Вложенный вызов не разыгрывает выборку заново.
+        for _ in range(40):
+            service.top_models_by_sales()
+
+        assert profiler.calls == 40 and 0 < profiler.sampled < 40
+        stacks = [line.rsplit(" ", 1)[0] for line in profiler.folded_stacks().splitlines()]
+        assert stacks and all(stack.startswith("top_models_by_sales") for stack in stacks)
+        roots = [event for event in profiler.chrome_trace()["traceEvents"] if event["name"] == "top_models_by_sales"]
+        assert len(roots) == profiler.sampled
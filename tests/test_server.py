@@ -0,0 +1,128 @@
+import http.client
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from bibip import CarServiceClient, CarServiceServer
+from bibip.server import BatchingWriter
+from bibip_car_service import CarService
+from constants import LINE_SIZE
+from models import CarStatus, ModelSaleStats, Sale
+from my_exceptions import CarNotFoundError, InvalidCharacterStr
+
+
+@pytest.fixture
+def server(tmpdir: str):
+    server = CarServiceServer(("127.0.0.1", 0), CarService(tmpdir), batch_window=0.05)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_client_mirrors_car_service(server, car_data, model_data):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    client = CarServiceClient(url)
+
+    for model in model_data:
+        assert client.add_model(model) == model
+
+    # Одновременные добавления склеиваются в пачки.
+    def add(car):
+        worker = CarServiceClient(url)
+        try:
+            return worker.add_car(car)
+        finally:
+            worker.close()
+
+    with ThreadPoolExecutor(max_workers=len(car_data)) as pool:
+        assert list(pool.map(add, car_data)) == car_data
+    assert server.writer.coalesced > 0
+
+    key = lambda car: car.vin  # noqa: E731
+    available = [car for car in car_data if car.status == CarStatus.available]
+    assert sorted(client.get_cars(CarStatus.available), key=key) == sorted(available, key=key)
+
+    sale = Sale(
+        sales_number="20240903#KNAGM4A77D5316538",
+        car_vin="KNAGM4A77D5316538",
+        sales_date=datetime(2024, 9, 3),
+        cost=Decimal("2999.99"),
+    )
+    assert client.sell_car(sale).status == CarStatus.sold
+    info = client.get_car_info("KNAGM4A77D5316538")
+    assert info.sales_cost == sale.cost
+    assert client.top_models_by_sales() == [ModelSaleStats(car_model_name="Optima", brand="Kia", sales_number=1)]
+    assert client.top_models_by_sales(since=datetime(2024, 10, 1)) == []
+    assert client.sales_between(datetime(2024, 9, 1), datetime(2024, 10, 1)) == [sale]
+
+    assert client.get_car_info("UNKNOWN0000000000") is None
+    assert client.get_car_infos(["UNKNOWN0000000000", "KNAGM4A77D5316538"]) == [None, info]
+    with pytest.raises(CarNotFoundError):
+        client.update_vin("UNKNOWN0000000000", "UPDGM4A77D5316538")
+
+    assert client.revert_sale(sale.sales_number).status == CarStatus.available
+    assert client.update_vin("KNAGM4A77D5316538", "UPDGM4A77D5316538").vin == "UPDGM4A77D5316538"
+    client.close()
+
+
+def test_batch_errors(tmpdir: str, car_data, monkeypatch):
+    service = CarService(tmpdir)
+
+    # Ошибка после записи строк отдаётся всей пачке, строки не пишутся повторно.
+    def fail(entries):
+        raise OSError("диск")
+    monkeypatch.setattr(service.index("cars"), "insert_many", fail)
+    writer = BatchingWriter(service, batch_window=0.2)
+    futures = [writer.submit("add_car", (car,)) for car in car_data[:2]]
+    for future in futures:
+        with pytest.raises(OSError):
+            future.result()
+    writer.close()
+    assert os.path.getsize(service.paths["cars.txt"]) // LINE_SIZE == 2
+    monkeypatch.undo()
+
+    # Ошибка проверки до записи - запросы выполняются по одному.
+    writer = BatchingWriter(service, batch_window=0.2)
+    good = writer.submit("add_car", (car_data[2],))
+    bad = writer.submit("add_car", (car_data[3].model_copy(update={"vin": "BAD;VIN"}),))
+    assert good.result() == car_data[2]
+    with pytest.raises(InvalidCharacterStr):
+        bad.result()
+    writer.close()
+    assert writer.coalesced == 0
+
+
+def test_client_does_not_repeat_writes():
+    # Сервер читает запрос и закрывает соединение без ответа.
+    listener = socket.create_server(("127.0.0.1", 0))
+    accepted = []
+
+    def serve():
+        while True:
+            try:
+                conn, _ = listener.accept()
+            except OSError:
+                return
+            accepted.append(conn.recv(65536))
+            conn.close()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    client = CarServiceClient(f"http://127.0.0.1:{listener.getsockname()[1]}")
+    try:
+        with pytest.raises((ConnectionError, http.client.HTTPException)):
+            client.revert_sale("20240903#KNAGM4A77D5316538")
+        assert len(accepted) == 1
+        # Чтение можно повторить.
+        with pytest.raises((ConnectionError, http.client.HTTPException)):
+            client.get_car_info("KNAGM4A77D5316538")
+        assert len(accepted) == 3
+    finally:
+        listener.close()
@@ -0,0 +1,98 @@
+import os
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from sharded_car_service import ShardedCarService, rebalance, shard_for
+from bibip_car_service import CarService
+from models import CarStatus, Sale
+
+
+def _fill(service, car_data, model_data, sales) -> None:
+    for model in model_data:
+        service.add_model(model)
+    for car in car_data:
+        service.add_car(car)
+    for sale in sales:
+        service.sell_car(sale)
+
+
+def _sales() -> list[Sale]:
+    return [
+        Sale(
+            sales_number=f"2024090{day}#{vin}",
+            car_vin=vin,
+            sales_date=datetime(2024, 9, day),
+            cost=Decimal(cost),
+        )
+        for day, vin, cost in [
+            (3, "KNAGM4A77D5316538", "1999.09"),
+            (4, "KNAGH4A48A5414970", "2100"),
+            (5, "JM1BL1M58C1614725", "2334"),
+            (6, "5N1CR2TS0HW037674", "9876"),
+        ]
+    ]
+
+
+def test_sharded_matches_single_store(tmpdir: str, car_data, model_data):
+    os.makedirs(f"{tmpdir}/single")
+    single = CarService(f"{tmpdir}/single")
+    sharded = ShardedCarService(f"{tmpdir}/sharded", shard_count=3)
+
+    _fill(single, car_data, model_data, _sales())
+    _fill(sharded, car_data, model_data, _sales())
+
+    key = lambda car: car.vin  # noqa: E731
+    assert sorted(sharded.get_cars(CarStatus.available), key=key) == \
+        sorted(single.get_cars(CarStatus.available), key=key)
+    assert sharded.top_models_by_sales() == single.top_models_by_sales()
+    for car in car_data:
+        assert sharded.get_car_info(car.vin) == single.get_car_info(car.vin)
+    vins = [car.vin for car in car_data] + ["UNKNOWN0000000000"]
+    assert sharded.get_car_infos(vins) == single.get_car_infos(vins)
+
+    # Новый VIN может попасть в другой шард.
+    new_vin = next(
+        f"UPDGM4A77D53165{i:02d}" for i in range(100)
+        if shard_for(f"UPDGM4A77D53165{i:02d}", 3) != shard_for("KNAGH4A48A5414970", 3)
+    )
+    sharded.update_vin("JM1BL1TFXD1734246", new_vin)
+    assert sharded.get_car_info("JM1BL1TFXD1734246") is None
+    assert sharded.get_car_info(new_vin).price == Decimal("2276.65")
+
+    sharded.revert_sale("20240904#KNAGH4A48A5414970")
+    assert sharded.get_car_info("KNAGH4A48A5414970").status == CarStatus.available
+
+    # Проданную машину в другой шард не переносим, иначе продажу нельзя отменить.
+    sold_vin = "KNAGM4A77D5316538"
+    other_vin = next(
+        f"OTHGM4A77D53165{i:02d}" for i in range(100)
+        if shard_for(f"OTHGM4A77D53165{i:02d}", 3) != shard_for(sold_vin, 3)
+    )
+    sold_info = sharded.get_car_info(sold_vin)
+    with pytest.raises(ValueError):
+        sharded.update_vin(sold_vin, other_vin)
+    assert sharded.get_car_info(sold_vin) == sold_info
+    assert sharded.get_car_info(other_vin) is None
+    sharded.revert_sale(f"20240903#{sold_vin}")
+    assert sharded.get_car_info(sold_vin).status == CarStatus.available
+    sharded.close()
+
+
+@pytest.mark.parametrize("sales_partitions", [False, True])
+def test_rebalance(tmpdir: str, car_data, model_data, sales_partitions: bool):
+    sharded = ShardedCarService(tmpdir, shard_count=2, sales_partitions=sales_partitions)
+    _fill(sharded, car_data, model_data, _sales())
+    infos = {car.vin: sharded.get_car_info(car.vin) for car in car_data}
+    top = sharded.top_models_by_sales()
+    sharded.close()
+
+    rebalance(tmpdir, 5)
+
+    sharded = ShardedCarService(tmpdir)
+    assert sharded.shard_count == 5
+    assert {car.vin: sharded.get_car_info(car.vin) for car in car_data} == infos
+    assert sharded.top_models_by_sales() == top
+    assert all((shard.partitions is not None) == sales_partitions for shard in sharded.shards)
+    sharded.close()